@@ -1,3 +1,6 @@
+from vercmp import debian_version_key
+
+
 class DebianArtifact:
     def __init__(self, name, repo, path, properties):
         self.filename = name
@@ -6,6 +9,7 @@ class DebianArtifact:
         self.path = path
         self.name = properties["deb.name"]
         self.version = properties["deb.version"]
+        self.version_key = debian_version_key(self.version)
 
     def as_dict(self):
         return {
@@ -20,50 +24,40 @@ class DebianArtifact:
     def __str__(self):
         return "/".join([self.repo, self.path, self.filename])
 
+    def sort_key(self):
+        return (self.name, self.version_key)
+
     def __lt__(self, other):
-        if self.name == other.name:
-            return debian_compare(self.version, other.version) < 0
-        else:
-            return self.name < other.name
+        return self.sort_key() < other.sort_key()
 
     def __le__(self, other):
-        if self.name == other.name:
-            return debian_compare(self.version, other.version) <= 0
-        else:
-            return self.name <= other.name
+        return self.sort_key() <= other.sort_key()
 
     def __eq__(self, other):
-        if self.name == other.name:
-            return debian_compare(self.version, other.version) == 0
-        else:
-            return False
+        return self.sort_key() == other.sort_key()
 
     def __ne__(self, other):
-        if self.name == other.name:
-            return debian_compare(self.version, other.version) != 0
-        else:
-            return True
+        return self.sort_key() != other.sort_key()
 
     def __ge__(self, other):
-        if self.name == other.name:
-            return debian_compare(self.version, other.version) >= 0
-        else:
-            return self.name >= other.name
+        return self.sort_key() >= other.sort_key()
 
     def __gt__(self, other):
-        if self.name == other.name:
-            return debian_compare(self.version, other.version)
-        else:
-            return self.name > other.name
+        return self.sort_key() > other.sort_key()
 
 class DockerArtifact:
-    def __init__(self, name, repo, path, properties):
+    """One Docker tag: the folder holding its manifest.json and layers."""
+
+    def __init__(self, name, repo, path, properties, created=""):
         self.filename = name
         self.repo = repo
         self.properties = properties
         self.path = path
-        self.name = properties["name"]
-        self.version = properties["version"]
+        self.name = properties["docker.repoName"]
+        self.version = properties["docker.manifest"]
+        self.digest = properties.get("docker.manifest.digest")
+        self.created = created
+        self.version_key = created
 
     def as_dict(self):
         return {
@@ -73,44 +67,31 @@ class DockerArtifact:
             "path": self.path,
             "name": self.name,
             "version": self.version,
+            "digest": self.digest,
+            "created": self.created,
         }
 
     def __str__(self):
-        return "/".join([self.repo, self.path, self.filename])
+        # Deleting the tag folder removes the manifest and its layer links
+        return "/".join([self.repo, self.path])
+
+    def sort_key(self):
+        return (self.name, self.version_key)
 
     def __lt__(self, other):
-        if self.name == other.name:
-            return docker_compare(self.version, other.version) < 0
-        else:
-            return self.name < other.name
+        return self.sort_key() < other.sort_key()
 
     def __le__(self, other):
-        if self.name == other.name:
-            return docker_compare(self.version, other.version) <= 0
-        else:
-            return self.name <= other.name
+        return self.sort_key() <= other.sort_key()
 
     def __eq__(self, other):
-        if self.name == other.name:
-            return docker_compare(self.version, other.version) == 0
-        else:
-            return False
+        return self.sort_key() == other.sort_key()
 
     def __ne__(self, other):
-        if self.name == other.name:
-            return docker_compare(self.version, other.version) != 0
-        else:
-            return True
+        return self.sort_key() != other.sort_key()
 
     def __ge__(self, other):
-        if self.name == other.name:
-            return docker_compare(self.version, other.version) >= 0
-        else:
-            return self.name >= other.name
+        return self.sort_key() >= other.sort_key()
 
     def __gt__(self, other):
-        if self.name == other.name:
-            return docker_compare(self.version, other.version)
-        else:
-            return self.name > other.name
-
+        return self.sort_key() > other.sort_key()
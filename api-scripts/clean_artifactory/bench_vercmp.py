@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""Time sorting Debian versions with debian_compare vs debian_version_key."""
+import argparse
+import functools
+import random
+import time
+
+from vercmp import debian_compare, debian_version_key
+
+
+def make_versions(n, seed=0):
+    rng = random.Random(seed)
+    versions = []
+    for _ in range(n):
+        version = ".".join(str(rng.randint(0, 30)) for _ in range(3))
+        if rng.random() < 0.3:
+            version += f"~rc{rng.randint(1, 5)}"
+        if rng.random() < 0.5:
+            version += f"-{rng.randint(1, 9)}ubuntu{rng.randint(1, 3)}"
+        if rng.random() < 0.1:
+            version = f"{rng.randint(1, 2)}:{version}"
+        versions.append(version)
+    return versions
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    print(f"{label:<28} {time.perf_counter() - start:8.3f}s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", type=int, default=100000, help="versions to sort")
+    args = parser.parse_args()
+
+    versions = make_versions(args.n)
+    by_cmp = timed("sorted(cmp_to_key(compare))",
+                   lambda: sorted(versions, key=functools.cmp_to_key(debian_compare)))
+    debian_version_key.cache_clear()
+    by_key = timed("sorted(key=version_key)",
+                   lambda: sorted(versions, key=debian_version_key))
+    timed("sorted(key=version_key) warm",
+          lambda: sorted(versions, key=debian_version_key))
+    assert [debian_version_key(v) for v in by_cmp] == \
+        [debian_version_key(v) for v in by_key]
+
+
+if __name__ == "__main__":
+    main()
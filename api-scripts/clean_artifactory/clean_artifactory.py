@@ -1,97 +1,146 @@
 #!/usr/bin/env python3
 
+import itertools
+import json
 import requests
 import pprint
-from vercmp import debian_compare
-from retrying import retry
+import re
 import urllib3
 import os
 import argparse
-from artifactory_artifacts import DebianArtifact
+from deleter import delete_packages
+import retention
 
-def search_artifactory(aql, baseurl, apikey=None, verify=True):
-    headers = {"X-Jfrog-Art-Api": apikey}
-    r = requests.post(
-        url=f"http://{baseurl}/artifactory/api/search/aql",
-        headers=headers,
-        data=aql,
-        verify=verify
-    )
-    r.raise_for_status()
-    response_data = r.json()
-    results = response_data["results"]
-    return results
-
-
-def determine_deletables(artifacts):
-    groups = {}
-    for artifact in artifacts:
-        properties = {}
-        for prop in artifact["properties"]:
-            properties[prop["key"]] = prop["value"]
-
-        artifact_record = DebianArtifact(
-            artifact["name"], artifact["repo"], artifact["path"], properties
-        )
-
-        group_key = "/".join([artifact["repo"], properties["deb.name"]])
+KEEP = 3
 
-        if group_key not in groups:
-            groups[group_key] = []
+_SKIP = re.compile(r"[\s,]*")
 
-        groups[group_key].append(artifact_record)
-    deletables = []
-    for groupk, groupv in groups.items():
-        if len(groupv) > 3:
-            sorted_pkgs = sorted(groupv, reverse=True)
-            print("Keeping {0}...".format(sorted_pkgs[0]))
-            print("Keeping {0}...".format(sorted_pkgs[1]))
-            print("Keeping {0}...".format(sorted_pkgs[2]))
-            deletables.extend(sorted_pkgs[3:])
-    return deletables
 
+def iter_json_array(chunks, key="results"):
+    """Incrementally decode the objects of the top-level ``key`` array.
 
-@retry(stop_max_attempt_number=7, wait_fixed=2000, apikey=None, verify=True)
-def delete_package(package, baseurl):
+    ``chunks`` is an iterable of text chunks, e.g. ``r.iter_content(
+    decode_unicode=True)``. Only the current object and the undecoded tail
+    of the stream are held in memory.
+    """
+    decoder = json.JSONDecoder()
+    marker = f'"{key}"'
+    buf = ""
+    pos = None
+    for chunk in itertools.chain(chunks, [None]):
+        if chunk is not None:
+            buf += chunk
+        if pos is None:
+            start = buf.find(marker)
+            bracket = buf.find("[", start + len(marker)) if start != -1 else -1
+            if bracket == -1:
+                continue
+            pos = bracket + 1
+        while True:
+            pos = _SKIP.match(buf, pos).end()
+            if pos < len(buf) and buf[pos] == "]":
+                return
+            try:
+                obj, pos = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if chunk is None and pos < len(buf):
+                    raise
+                break
+            yield obj
+        buf = buf[pos:]
+        pos = 0
+
+
+def stream_artifactory(aql, baseurl, apikey=None, verify=True, session=None):
+    """Yield AQL results one at a time from a single streamed request.
+
+    The response is parsed incrementally, so the full result set is never
+    held in memory. The query is not paged: Artifactory only honours
+    .sort()/.offset()/.limit() when .include() lists item fields alone, and
+    the retention queries include properties and download stats.
+    """
+    session = session or requests.Session()
     headers = {"X-Jfrog-Art-Api": apikey}
-    print("Deleting {0}...".format(package))
-    r = requests.delete(
-        url=f"http://{baseurl}/artifactory/{package}",
+    with session.post(
+        url=f"http://{baseurl}/artifactory/api/search/aql",
         headers=headers,
-        verify=verify
+        data=aql.strip(),
+        verify=verify,
+        stream=True,
+    ) as r:
+        r.raise_for_status()
+        r.encoding = r.encoding or "utf-8"
+        yield from iter_json_array(r.iter_content(65536, decode_unicode=True))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Apply retention policies to Debian or Docker repositories in Artifactory"
     )
-    r.raise_for_status()
-
-
-def delete_packages(packages):
-    for package in packages:
-        delete_package(package)
+    parser.add_argument("--type", choices=("debian", "docker"), default="debian",
+                        help="kind of repository to clean (default: debian)")
+    parser.add_argument("--docker-repo", default="docker-local",
+                        help="docker repository to clean with --type docker")
+    parser.add_argument("--keep", type=int, default=KEEP,
+                        help=f"versions to keep per package or image (default: {KEEP})")
+    parser.add_argument("--downloaded-within", type=int, metavar="WEEKS",
+                        help="also keep anything downloaded in the last WEEKS weeks")
+    parser.add_argument("--keep-releases", action="store_true",
+                        help="also keep versions/tags matching --release-pattern")
+    parser.add_argument("--release-pattern", default=retention.RELEASE_PATTERN,
+                        help="regex for tagged release versions")
+    parser.add_argument("--delete", action="store_true",
+                        help="delete the artifacts instead of only listing them")
+    parser.add_argument("-w", "--workers", type=int, default=8,
+                        help="concurrent deletions (default: 8)")
+    parser.add_argument("--rate", type=float, default=20,
+                        help="maximum delete requests per second (default: 20)")
+    parser.add_argument("--journal", default="clean_artifactory.journal",
+                        help="file recording completed deletions so a rerun resumes")
+    return parser.parse_args()
 
 
 def main():
+    args = parse_args()
     baseurl = os.environ.get("ARTIFACTORY_REGISTRY")
     apikey  = os.environ.get("ARTIFACTORY_API_KEY")
-    aql =  """
-    items.find({
-        "property.key": "deb.name",
-        "property.value": {"$match": "*"}
-    }).include("name", "path", "repo", "property")
-    """
-    docker_query = """items.find({
-      "type": "file", 
-      "repo": "docker-local"
-      "stat.downloaded": {"$before":"4w"},
-    }).include("name", "@docker.repoName", "@docker.manifest" ,"stat.downloads")
-    """
-    results = search_artifactory(aql=aql, baseurl=baseurl, apikey=apikey, verify=False)
-    # docker_results = search_artifactory(aql=docker_query, baseurl=baseurl, apikey=apikey, verify=False)
+    if args.type == "docker":
+        aql = retention.DOCKER_RETENTION_AQL % args.docker_repo
+    else:
+        aql = retention.DEBIAN_RETENTION_AQL
+    results = stream_artifactory(aql=aql, baseurl=baseurl, apikey=apikey, verify=False)
+    first = next(results, None)
     print("Sample result:")
     print("")
-    pprint.pprint(next(iter(results), None))
+    pprint.pprint(first)
     print("")
-    artifacts = determine_deletables(results)
-    #delete_packages(artifacts)
-    pprint.pprint(artifacts)
+    if first is not None:
+        results = itertools.chain([first], results)
+
+    policies = []
+    if args.downloaded_within is not None:
+        policies.append(retention.KeepDownloadedWithin(args.downloaded_within))
+    if args.keep_releases:
+        policies.append(retention.KeepReleases(args.release_pattern))
+    if args.type == "docker":
+        artifacts = retention.docker_artifacts(results)
+    else:
+        artifacts = retention.debian_artifacts(results)
+    plan = retention.evaluate(artifacts, keep=args.keep, policies=policies)
+
+    for artifact in plan.deletable:
+        print("Deletable {0}".format(artifact))
+    for reason, count in sorted(plan.kept.items()):
+        print(f"Kept {count} ({reason})")
+    print(f"{len(plan.deletable)} deletable, "
+          f"{retention.format_bytes(plan.reclaimable_bytes)} reclaimable")
+    if args.delete:
+        deleted, skipped, failed = delete_packages(
+            plan.deletable, baseurl, apikey=apikey, verify=False,
+            workers=args.workers, rate=args.rate, journal=args.journal,
+        )
+        print(f"Deleted {deleted}, skipped {skipped} already journaled, "
+              f"{len(failed)} failed")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,150 @@
+"""Concurrent, rate-limited and resumable artifact deletion.
+
+Deletes run on a bounded thread pool over one pooled ``requests.Session``.
+A token bucket caps the request rate across all workers, and each item
+retries on its own with exponential backoff and full jitter, so one slow
+artifact never stalls the rest. Every completed deletion is appended to a
+journal file; re-running with the same journal skips what is already gone.
+"""
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing ``rate`` requests per second."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity,
+                                  self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class DeletionJournal:
+    """Append-only record of deleted artifact paths, one per line."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = set()
+        if os.path.exists(path):
+            with open(path) as fs:
+                self.done = {line.rstrip("\n") for line in fs if line.strip()}
+        self.fs = open(path, "a")
+
+    def __contains__(self, package):
+        return package in self.done
+
+    def record(self, package):
+        with self.lock:
+            self.done.add(package)
+            self.fs.write(package + "\n")
+            self.fs.flush()
+            os.fsync(self.fs.fileno())
+
+    def close(self):
+        self.fs.close()
+
+
+def backoff_delay(attempt, base=0.5, cap=30.0):
+    """Full-jitter exponential backoff for the given 0-based attempt."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def make_session(apikey=None, workers=8):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if apikey:
+        session.headers["X-Jfrog-Art-Api"] = apikey
+    return session
+
+
+def delete_package(session, package, baseurl, verify=True, bucket=None,
+                   attempts=7, base=0.5, cap=30.0, timeout=60):
+    """Delete one artifact, retrying transient failures with backoff.
+
+    Connection errors, timeouts and RETRY_STATUSES are retried. A 404
+    counts as success: the artifact is already gone.
+    """
+    url = f"http://{baseurl}/artifactory/{package}"
+    for attempt in range(attempts):
+        if bucket is not None:
+            bucket.acquire()
+        try:
+            r = session.delete(url, verify=verify, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == attempts - 1:
+                raise
+        else:
+            if r.status_code == 404 or r.ok:
+                return
+            if r.status_code not in RETRY_STATUSES or attempt == attempts - 1:
+                r.raise_for_status()
+            retry_after = r.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                time.sleep(min(cap, int(retry_after)))
+                continue
+        time.sleep(backoff_delay(attempt, base, cap))
+
+
+def delete_packages(packages, baseurl, apikey=None, verify=True, workers=8,
+                    rate=20, journal="clean_artifactory.journal",
+                    attempts=7, base=0.5, cap=30.0, timeout=60):
+    """Delete ``packages`` concurrently and return (deleted, skipped, failed).
+
+    ``failed`` maps each package that could not be deleted to its error.
+    """
+    journal = DeletionJournal(journal)
+    bucket = TokenBucket(rate) if rate else None
+    session = make_session(apikey, workers)
+    deleted, skipped, failed = 0, 0, {}
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {}
+            for package in packages:
+                package = str(package)
+                if package in journal:
+                    skipped += 1
+                    continue
+                futures[pool.submit(delete_package, session, package, baseurl,
+                                    verify, bucket, attempts, base, cap,
+                                    timeout)] = package
+            for future in as_completed(futures):
+                package = futures[future]
+                try:
+                    future.result()
+                except requests.RequestException as e:
+                    failed[package] = e
+                    print("Failed to delete {0}: {1}".format(package, e))
+                    continue
+                journal.record(package)
+                deleted += 1
+                print("Deleted {0}".format(package))
+    finally:
+        journal.close()
+        session.close()
+    return deleted, skipped, failed
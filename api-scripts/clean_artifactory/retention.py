@@ -0,0 +1,188 @@
+"""Retention policies for Debian and Docker repositories.
+
+``evaluate`` makes one pass over streamed AQL results and applies every
+policy at once:
+
+* keep the newest N versions of each package or image (bounded heap)
+* keep anything downloaded within the last X weeks (``stat.downloaded``)
+* keep tagged releases whose version matches a pattern
+
+Docker tags that share a manifest digest with a kept tag are kept too,
+since deleting them would reclaim nothing. Reclaimable bytes only count
+blobs (by checksum) that no kept artifact still references, matching
+Artifactory's checksum-based storage.
+"""
+import collections
+import datetime as dt
+import heapq
+import re
+
+from artifactory_artifacts import DebianArtifact, DockerArtifact
+
+DEBIAN_RETENTION_AQL = """
+items.find({
+    "property.key": "deb.name",
+    "property.value": {"$match": "*"}
+}).include("name", "path", "repo", "size", "actual_sha1", "stat.downloaded",
+           "@deb.name", "@deb.version")
+"""
+
+DOCKER_RETENTION_AQL = """
+items.find({
+    "repo": "%s",
+    "type": "file"
+}).include("name", "path", "repo", "size", "actual_sha1", "created",
+           "stat.downloaded", "@docker.repoName", "@docker.manifest",
+           "@docker.manifest.digest")
+"""
+
+RELEASE_PATTERN = r"^v?\d+(\.\d+){1,3}(-\d+)?$"
+
+
+def parse_time(value):
+    if not value:
+        return None
+    return dt.datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def result_properties(result):
+    return {p["key"]: p.get("value") for p in result.get("properties", ())}
+
+
+def last_downloaded(result):
+    stats = result.get("stats") or [{}]
+    return parse_time(stats[0].get("downloaded"))
+
+
+def debian_artifacts(results):
+    """Yield a DebianArtifact per AQL result, annotated for retention."""
+    for result in results:
+        properties = result_properties(result)
+        if "deb.name" not in properties:
+            continue
+        artifact = DebianArtifact(
+            result["name"], result["repo"], result["path"], properties
+        )
+        artifact.group = "/".join([result["repo"], artifact.name])
+        artifact.digest = None
+        artifact.downloaded = last_downloaded(result)
+        artifact.blobs = [(result.get("actual_sha1"), result.get("size", 0))]
+        yield artifact
+
+
+def docker_artifacts(results):
+    """Yield a DockerArtifact per tag folder of an AQL result stream.
+
+    Results may arrive in any order (the AQL cannot be sorted server side
+    once it includes properties), so files are grouped by repo and path
+    first. Only the manifest and each file's checksum, size and download
+    time are held per folder.
+    """
+    folders = {}
+    for result in results:
+        folder = folders.setdefault(
+            (result["repo"], result["path"]),
+            {"manifest": None, "blobs": [], "downloaded": None},
+        )
+        if result["name"] == "manifest.json":
+            folder["manifest"] = result
+        folder["blobs"].append((result.get("actual_sha1"), result.get("size", 0)))
+        downloaded = last_downloaded(result)
+        if downloaded is not None and (folder["downloaded"] is None
+                                       or downloaded > folder["downloaded"]):
+            folder["downloaded"] = downloaded
+
+    for (repo, path), folder in folders.items():
+        manifest = folder["manifest"]
+        if manifest is None:
+            continue
+        properties = result_properties(manifest)
+        if "docker.repoName" not in properties:
+            continue
+        artifact = DockerArtifact(
+            manifest["name"], repo, path, properties, manifest.get("created", "")
+        )
+        artifact.group = "/".join([repo, artifact.name])
+        artifact.downloaded = folder["downloaded"]
+        artifact.blobs = folder["blobs"]
+        yield artifact
+
+
+class KeepDownloadedWithin:
+    def __init__(self, weeks, now=None):
+        self.name = f"downloaded-within-{weeks}w"
+        now = now or dt.datetime.now(dt.timezone.utc)
+        self.cutoff = now - dt.timedelta(weeks=weeks)
+
+    def __call__(self, artifact):
+        return artifact.downloaded is not None and artifact.downloaded >= self.cutoff
+
+
+class KeepReleases:
+    def __init__(self, pattern=RELEASE_PATTERN):
+        self.name = "release"
+        self.pattern = re.compile(pattern)
+
+    def __call__(self, artifact):
+        return bool(self.pattern.match(artifact.version or ""))
+
+
+RetentionPlan = collections.namedtuple(
+    "RetentionPlan", ["deletable", "reclaimable_bytes", "kept"]
+)
+
+
+def evaluate(artifacts, keep=3, policies=()):
+    """Apply keep-newest and ``policies`` in one pass over ``artifacts``.
+
+    An artifact is kept when it is among the ``keep`` newest of its group
+    or any policy matches it. Returns a RetentionPlan whose ``kept`` is a
+    Counter of the reason each kept artifact survived.
+    """
+    heaps = {}
+    kept = collections.Counter()
+    kept_blobs = set()
+    kept_digests = set()
+    candidates = []
+
+    def keep_artifact(artifact, reason):
+        kept[reason] += 1
+        kept_blobs.update(sha for sha, _ in artifact.blobs)
+        if artifact.digest:
+            kept_digests.add((artifact.group, artifact.digest))
+
+    for artifact in artifacts:
+        heap = heaps.setdefault(artifact.group, [])
+        if len(heap) < keep:
+            heapq.heappush(heap, artifact)
+            continue
+        oldest = heapq.heappushpop(heap, artifact) if keep else artifact
+        reason = next((p.name for p in policies if p(oldest)), None)
+        if reason:
+            keep_artifact(oldest, reason)
+        else:
+            candidates.append(oldest)
+
+    for heap in heaps.values():
+        for artifact in heap:
+            keep_artifact(artifact, "newest")
+
+    deletable = []
+    reclaim = {}
+    for artifact in candidates:
+        if artifact.digest and (artifact.group, artifact.digest) in kept_digests:
+            keep_artifact(artifact, "same-manifest")
+            continue
+        deletable.append(artifact)
+    for artifact in deletable:
+        for sha, size in artifact.blobs:
+            if sha not in kept_blobs:
+                reclaim[sha] = size or 0
+    return RetentionPlan(deletable, sum(reclaim.values()), kept)
+
+
+def format_bytes(n):
+    for unit in ("B", "KiB", "MiB", "GiB", "TiB"):
+        if n < 1024 or unit == "TiB":
+            return f"{n:.1f} {unit}" if unit != "B" else f"{n} B"
+        n /= 1024
@@ -0,0 +1,102 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from deleter import DeletionJournal, TokenBucket, delete_packages
+
+
+class StubArtifactory(BaseHTTPRequestHandler):
+    """Deletes artifacts, failing the first request for some of them."""
+
+    artifacts = set()
+    requests = []
+    flaky = {}
+
+    def do_DELETE(self):
+        path = self.path[len("/artifactory/"):]
+        self.requests.append(path)
+        status = self.flaky.pop(path, None)
+        if status == "slow":
+            # answer only after the client gave up on the request
+            time.sleep(0.3)
+            status = None
+        if status is None:
+            if path in self.artifacts:
+                self.artifacts.discard(path)
+                status = 204
+            else:
+                status = 404
+        self.send_response(status)
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    StubArtifactory.artifacts = {f"deb-local/pool/pkg_{i}.deb" for i in range(40)}
+    StubArtifactory.requests = []
+    StubArtifactory.flaky = {
+        "deb-local/pool/pkg_1.deb": 429,
+        "deb-local/pool/pkg_2.deb": 503,
+    }
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubArtifactory)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def run(packages, baseurl, journal, timeout=60):
+    return delete_packages(packages, baseurl, workers=4, rate=0,
+                           journal=str(journal), base=0.01, cap=0.05,
+                           timeout=timeout)
+
+
+def test_deletes_everything_and_retries_transient_errors(stub, tmp_path):
+    packages = sorted(StubArtifactory.artifacts)
+    deleted, skipped, failed = run(packages, stub, tmp_path / "journal")
+    assert (deleted, skipped, failed) == (40, 0, {})
+    assert StubArtifactory.artifacts == set()
+    assert StubArtifactory.requests.count("deb-local/pool/pkg_1.deb") == 2
+    assert StubArtifactory.requests.count("deb-local/pool/pkg_2.deb") == 2
+
+
+def test_read_timeout_is_retried(stub, tmp_path):
+    StubArtifactory.flaky = {"deb-local/pool/pkg_3.deb": "slow"}
+    packages = sorted(StubArtifactory.artifacts)
+    deleted, skipped, failed = run(packages, stub, tmp_path / "journal",
+                                   timeout=0.1)
+    assert (deleted, skipped, failed) == (40, 0, {})
+    assert StubArtifactory.requests.count("deb-local/pool/pkg_3.deb") == 2
+
+
+def test_rerun_resumes_from_journal(stub, tmp_path):
+    packages = sorted(StubArtifactory.artifacts)
+    journal = tmp_path / "journal"
+    journal.write_text("".join(p + "\n" for p in packages[:25]))
+    deleted, skipped, failed = run(packages, stub, journal)
+    assert (deleted, skipped, failed) == (15, 25, {})
+    assert set(StubArtifactory.requests) == set(packages[25:])
+
+    StubArtifactory.requests = []
+    assert run(packages, stub, journal) == (0, 40, {})
+    assert StubArtifactory.requests == []
+    reloaded = DeletionJournal(str(journal))
+    reloaded.close()
+    assert reloaded.done == set(packages)
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=200, burst=1)
+    start = time.monotonic()
+    for _ in range(21):
+        bucket.acquire()
+    assert time.monotonic() - start >= 0.09
@@ -0,0 +1,77 @@
+import datetime as dt
+import random
+
+import retention
+
+NOW = dt.datetime(2024, 6, 1, tzinfo=dt.timezone.utc)
+
+
+def docker_rows(tags):
+    rows = []
+    for image, tag, created, digest, layers, downloaded in tags:
+        base = {"repo": "docker-local", "path": f"{image}/{tag}"}
+        stats = [{"downloaded": downloaded}] if downloaded else []
+        rows.append(dict(base, name="manifest.json", size=1,
+                         actual_sha1=f"m-{digest}", created=created,
+                         stats=stats, properties=[
+                             {"key": "docker.repoName", "value": image},
+                             {"key": "docker.manifest", "value": tag},
+                             {"key": "docker.manifest.digest", "value": digest},
+                         ]))
+        for sha, size in layers:
+            rows.append(dict(base, name=f"sha256__{sha}", size=size,
+                             actual_sha1=sha))
+    return sorted(rows, key=lambda r: (r["repo"], r["path"], r["name"]))
+
+
+def test_docker_policies_and_reclaimable_bytes():
+    rows = docker_rows([
+        ("app", "1.0.0", "2024-01-01", "d1", [("L1", 100), ("L2", 50)], None),
+        ("app", "dev-1", "2024-02-01", "d2", [("L1", 100), ("L3", 70)], None),
+        ("app", "dev-2", "2024-03-01", "d3", [("L4", 10)],
+         "2024-05-30T00:00:00.000Z"),
+        ("app", "dev-3", "2024-04-01", "d4", [("L5", 20)], None),
+        ("app", "latest", "2024-05-01", "d4", [("L5", 20)], None),
+        ("app", "dev-0", "2023-05-01", "d4", [("L5", 20)], None),
+    ])
+    plan = retention.evaluate(
+        retention.docker_artifacts(iter(rows)), keep=2,
+        policies=[retention.KeepDownloadedWithin(1, now=NOW),
+                  retention.KeepReleases()],
+    )
+    assert [str(a) for a in plan.deletable] == ["docker-local/app/dev-1"]
+    # L1 is still referenced by the kept 1.0.0 release
+    assert plan.reclaimable_bytes == 71
+    assert plan.kept == {"newest": 2, "release": 1,
+                         "downloaded-within-1w": 1, "same-manifest": 1}
+
+
+def test_docker_groups_unsorted_results():
+    rows = docker_rows([
+        ("app", "dev-1", "2024-02-01", "d2", [("L1", 100), ("L3", 70)], None),
+        ("app", "dev-2", "2024-03-01", "d3", [("L4", 10)], None),
+        ("app", "dev-3", "2024-04-01", "d4", [("L5", 20)], None),
+    ])
+    random.Random(7).shuffle(rows)
+    artifacts = list(retention.docker_artifacts(iter(rows)))
+    assert sorted(str(a) for a in artifacts) == [
+        "docker-local/app/dev-1", "docker-local/app/dev-2",
+        "docker-local/app/dev-3"]
+    plan = retention.evaluate(iter(artifacts), keep=2)
+    assert [str(a) for a in plan.deletable] == ["docker-local/app/dev-1"]
+    assert plan.reclaimable_bytes == 171
+
+
+def test_debian_keeps_newest_and_releases():
+    rows = [
+        {"repo": "deb", "path": "pool", "name": f"x_{v}.deb", "size": 10,
+         "actual_sha1": v, "properties": [
+             {"key": "deb.name", "value": "x"},
+             {"key": "deb.version", "value": v},
+         ]}
+        for v in ["1.0", "1.1~rc1", "1.2", "1.3-1", "1.10~dev"]
+    ]
+    plan = retention.evaluate(retention.debian_artifacts(rows), keep=2,
+                              policies=[retention.KeepReleases()])
+    assert [str(a) for a in plan.deletable] == ["deb/pool/x_1.1~rc1.deb"]
+    assert plan.reclaimable_bytes == 10
@@ -1,4 +1,15 @@
-from vercmp import debian_compare
+import functools
+import itertools
+import random
+
+from vercmp import debian_compare, debian_version_key
+
+# Every version string used in test_debian_compare
+KNOWN_VERSIONS = [
+    "", "~~", "~~a", "~", "a", "1.2.3~rc1", "1.2.3", "1.2", "a1.2", "1.2-3",
+    "1.2.3~~rc1", "2", "2.0.0", "2.0", "1.2.a", "1.2a", "1", "1.2.3.4",
+    "1:2.3.4", "0:", "0:1.2", "1:", "0:1.2.3", "2:0.4.5",
+]
 
 
 def test_debian_compare():
@@ -23,3 +34,46 @@ def test_debian_compare():
     assert debian_compare("0:1.2", "1.2") == 0
     assert debian_compare("0:", "1:") < 0
     assert debian_compare("0:1.2.3", "2:0.4.5") < 0
+
+
+def sign(n):
+    return (n > 0) - (n < 0)
+
+
+def key_compare(a, b):
+    ka, kb = debian_version_key(a), debian_version_key(b)
+    return (ka > kb) - (ka < kb)
+
+
+def random_version(rng):
+    alphabet = "0123456789" * 3 + "..-+~ab"
+    body = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 8)))
+    if rng.random() < 0.2:
+        return f"{rng.randint(0, 3)}:{body}"
+    return body
+
+
+def test_debian_version_key_matches_known_cases():
+    for a, b in itertools.product(KNOWN_VERSIONS, repeat=2):
+        assert key_compare(a, b) == sign(debian_compare(a, b)), (a, b)
+
+
+def test_debian_version_key_matches_random_versions():
+    rng = random.Random(1234)
+    versions = KNOWN_VERSIONS + [random_version(rng) for _ in range(300)]
+    for a, b in itertools.product(versions, repeat=2):
+        assert key_compare(a, b) == sign(debian_compare(a, b)), (a, b)
+
+
+def test_debian_version_key_sorts_like_debian_compare():
+    rng = random.Random(42)
+    versions = [random_version(rng) for _ in range(500)]
+    by_key = sorted(versions, key=debian_version_key)
+    by_cmp = sorted(versions, key=functools.cmp_to_key(debian_compare))
+    assert [debian_version_key(v) for v in by_key] == \
+        [debian_version_key(v) for v in by_cmp]
+
+
+def test_debian_compare_equal_length_digits():
+    assert debian_compare("1.3", "1.2") > 0
+    assert debian_compare("1.2", "1.3") < 0
@@ -1,3 +1,4 @@
+import functools
 import re
 
 
@@ -15,7 +16,7 @@ def debian_digit_compare(a, b):
     else:
         if normalized_a < normalized_b:
             return -1
-        elif normalized_b > normalized_a:
+        elif normalized_a > normalized_b:
             return 1
         else:
             return 0
@@ -101,3 +102,47 @@ def debian_compare(a, b):
             return digit_compare
 
     return 0
+
+
+# Character weights for debian_version_key. "~" sorts before the end of a
+# string, which sorts before letters, which sort before everything else.
+_TILDE_WEIGHT = -1
+_END_WEIGHT = 0
+_NONALPHA_OFFSET = 0x110000
+
+
+def _lex_key(s):
+    weights = []
+    for c in s:
+        if c == "~":
+            weights.append(_TILDE_WEIGHT)
+        elif c.isalpha():
+            weights.append(ord(c))
+        else:
+            weights.append(ord(c) + _NONALPHA_OFFSET)
+    weights.append(_END_WEIGHT)
+    return tuple(weights)
+
+
+_EMPTY_LEX_KEY = _lex_key("")
+
+
+@functools.lru_cache(maxsize=1 << 18)
+def debian_version_key(a):
+    """Return a tuple that orders versions the same way as debian_compare.
+
+    The version is parsed once into alternating non-digit and digit parts;
+    ``sorted(versions, key=debian_version_key)`` then needs no further
+    parsing. Results are memoized.
+    """
+    residue = debian_normalize(a)
+    key = []
+    while residue:
+        parts = deb_find_nondigits.search(residue).groupdict()
+        key.append(_lex_key(parts["nondigits"]))
+        parts = deb_find_digits.search(parts["residue"]).groupdict()
+        key.append(int(parts["digits"] or 0))
+        residue = parts["residue"]
+    # An exhausted version compares as an empty non-digit part
+    key.append(_EMPTY_LEX_KEY)
+    return tuple(key)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Time kv2yaml on a synthetic Consul KV export (1M keys by default)."""
+import argparse
+import base64
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+from kv2yaml import SafeDumper, build_tree, read_pairs  # noqa: E402
+
+
+def make_keys(n, seed=0):
+    rng = random.Random(seed)
+    services = [f"service-{i}" for i in range(max(1, n // 1000))]
+    for i in range(n):
+        depth = rng.randint(1, 6)
+        path = [rng.choice(services)] + [f"k{rng.randint(0, 40)}" for _ in range(depth)]
+        path.append(f"leaf{i}")
+        value = str(rng.randint(0, 1 << 20)) if rng.random() < 0.3 else f"value {i}"
+        yield "/".join(path), value
+
+
+def write_export(path, n):
+    with open(path, "w") as f:
+        f.write("[")
+        for i, (key, value) in enumerate(make_keys(n)):
+            f.write("," if i else "")
+            json.dump({"key": key, "flags": 0,
+                       "value": base64.b64encode(value.encode()).decode()}, f)
+        f.write("]\n")
+
+
+def write_lines(path, n):
+    with open(path, "w") as f:
+        for key, value in make_keys(n):
+            f.write(f"{key} {value}\n")
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    print(f"{label:<28} {time.perf_counter() - start:8.3f}s")
+    return result
+
+
+def build(path):
+    with open(path) as f:
+        return build_tree(read_pairs(f))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", type=int, default=1000000, help="keys to generate")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        export = os.path.join(tmp, "export.json")
+        lines = os.path.join(tmp, "export.txt")
+        timed("generate export", lambda: (write_export(export, args.n),
+                                          write_lines(lines, args.n)))
+        tree = timed("build_tree (export JSON)", lambda: build(export))
+        assert timed("build_tree (key value)", lambda: build(lines)) == tree
+        timed(f"dump ({SafeDumper.__name__})",
+              lambda: yaml.dump(tree, io.StringIO(), Dumper=SafeDumper,
+                                indent=2, default_flow_style=False))
+
+
+if __name__ == "__main__":
+    main()
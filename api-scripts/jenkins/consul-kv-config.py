@@ -1,53 +1,63 @@
 #!/usr/bin/python
+"""Push a YAML config file into a Consul keyspace.
 
+The keyspace is updated in place: only keys that differ from the YAML are
+written or deleted, in check-and-set transactions (see consul_sync.py), so
+readers never see it emptied mid-push.
+"""
+
+import os
 import yaml
 import sys
-from consul_kv import Connection
 import argparse
 
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+from consul_sync import Consul, ConsulSyncError, flatten, sync  # noqa: E402
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
 def parse_arguments(args):
     parser = argparse.ArgumentParser(description='Push consul keys to a particular keyspace')
     parser.add_argument('--token', metavar='TOKEN', type=str,
             help='Consul token to use', default="")
     parser.add_argument('--endpoint', metavar='URL', type=str,
-            required=True,
             default='http://localhost:8500/v1/',
             help='Consul endpoint URL')
     parser.add_argument('--keyspace', metavar='KEY/SPACE', type=str,
             required=True,
             help='Keyspace to work in')
-    parser.add_argument('--conffile', metavar='conf/file.yaml', type=argparse.FileType('r')
+    parser.add_argument('--conffile', metavar='conf/file.yaml', type=str,
             required=True,
-            help='Keyspace to work in')
-    args = parser.parse_args()
-    return args
-
-def prefix_key_dictionary(keyspace, conf):
-    clean_keyspace = keyspace.rstrip('/').lstrip('/')
-    keyspace_parts = re.split(r'/+', clean_keyspace)
-    keyspace_parts.reverse()
-    building_dict = {}
-    for part in keyspace_parts:
-        building_dict = {part: building_dict}
-    return building_dict
-
-def configure_keyspace(endpoint, keyspace, conffile, token):
-    consul_connection = Connection(endpoint=endpoint)
-    consul_connection.delete(keyspace,recurse=True)
+            help='YAML file with the keys to push')
+    parser.add_argument('--dry-run', action='store_true',
+            help='Print the changes without applying them')
+    return parser.parse_args(args)
+
+def configure_keyspace(endpoint, keyspace, conffile, token, dry_run=False):
     with open(conffile, 'r',
             encoding='utf-8', errors='replace') as conf_handle:
-        conf = yaml.safe_load(conf_handle)
-        conf = prefix_key_dictionary(keyspace, conf)
-    with Connection(endpoint=endpoint) as conn:
-        conn.delete(keyspace, recurse=True)
-        conn.put_dict(conf)
+        conf = yaml.load(conf_handle, Loader=SafeLoader) or {}
+    return sync(Consul(endpoint, token), keyspace, flatten(conf, keyspace),
+                dry_run=dry_run)
 
 def main(args):
     parsed_args = parse_arguments(args)
-    configure_keyspace(args.endpoint,
-        args.keyspace,
-        args.conffile,
-        args.token)
+    try:
+        changes = configure_keyspace(parsed_args.endpoint,
+            parsed_args.keyspace,
+            parsed_args.conffile,
+            parsed_args.token,
+            parsed_args.dry_run)
+    except ConsulSyncError as e:
+        print(e, file=sys.stderr)
+        return 1
+    for change in changes:
+        print("{} {}".format(change.verb, change.key))
+    print("{} {} changes".format("Would apply" if parsed_args.dry_run else "Applied",
+                                 len(changes)), file=sys.stderr)
 
 if __name__ == '__main__':
     sys.exit(main(sys.argv[1:]))
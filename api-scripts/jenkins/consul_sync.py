@@ -0,0 +1,142 @@
+"""Diff-based sync of a YAML tree into a Consul KV prefix.
+
+The YAML is flattened into ``key -> value`` pairs in one iterative pass and
+the live keyspace is fetched with a single recursive GET. Only keys that
+are new, changed or gone are written, through ``/v1/txn`` batches of at
+most 64 operations. Every write is check-and-set against the ModifyIndex
+seen in that GET, so a concurrent change makes the batch fail instead of
+being silently overwritten, and readers never see an emptied keyspace.
+
+Used by yaml2consul.py and consul-kv-config.py.
+"""
+import base64
+import collections
+
+import requests
+
+TXN_MAX_OPS = 64
+
+Change = collections.namedtuple("Change", ["verb", "key", "value", "index"])
+
+
+class ConsulSyncError(Exception):
+    pass
+
+
+def flatten(data, prefix=""):
+    """Yield (key, value) for every scalar leaf of ``data``, iteratively.
+
+    Keys are joined with ``/`` below ``prefix``; values are rendered with
+    ``str`` as ``consul kv import`` files always have been.
+    """
+    prefix = prefix.strip("/")
+    stack = [(prefix, data)]
+    while stack:
+        path, item = stack.pop()
+        if isinstance(item, dict):
+            children = [("/".join(filter(None, [path, str(k)])), v)
+                        for k, v in item.items()]
+            stack.extend(reversed(children))
+        else:
+            yield path, str(item)
+
+
+def import_entries(pairs):
+    """Render pairs as a ``consul kv import`` JSON list."""
+    return [{"key": key, "flags": 0,
+             "value": base64.b64encode(value.encode("utf-8")).decode("ascii")}
+            for key, value in pairs]
+
+
+class Consul:
+    def __init__(self, endpoint="http://localhost:8500/v1/", token=None,
+                 session=None):
+        self.endpoint = endpoint.rstrip("/") + "/"
+        self.session = session or requests.Session()
+        if token:
+            self.session.headers["X-Consul-Token"] = token
+
+    def keyspace(self, prefix):
+        """Return {key: (value bytes or None, ModifyIndex)} below ``prefix``."""
+        prefix = prefix.strip("/")
+        r = self.session.get(self.endpoint + "kv/" + (prefix and prefix + "/"),
+                             params={"recurse": "true"})
+        if r.status_code == 404:
+            return {}
+        r.raise_for_status()
+        return {
+            e["Key"]: (base64.b64decode(e["Value"]) if e.get("Value") is not None
+                       else None, e["ModifyIndex"])
+            for e in r.json() or ()
+        }
+
+    def transaction(self, changes):
+        ops = []
+        for c in changes:
+            kv = {"Verb": c.verb, "Key": c.key, "Index": c.index}
+            if c.value is not None:
+                kv["Value"] = base64.b64encode(c.value).decode("ascii")
+            ops.append({"KV": kv})
+        r = self.session.put(self.endpoint + "txn", json=ops)
+        if r.status_code == 409:
+            errors = (r.json() or {}).get("Errors") or []
+            raise ConsulSyncError("Transaction rolled back: {}".format(
+                "; ".join("{}: {}".format(ops[e["OpIndex"]]["KV"]["Key"], e["What"])
+                          for e in errors)))
+        r.raise_for_status()
+
+
+def plan(desired, current, prune=True):
+    """Return the Changes turning ``current`` into ``desired``.
+
+    ``desired`` maps keys to str values; ``current`` is Consul.keyspace().
+    New keys use cas index 0 (create only), updates and deletes use the
+    ModifyIndex they were read at.
+    """
+    changes = []
+    for key, value in desired.items():
+        value = value.encode("utf-8")
+        existing = current.get(key)
+        if existing is None:
+            changes.append(Change("cas", key, value, 0))
+        elif existing[0] != value:
+            changes.append(Change("cas", key, value, existing[1]))
+    if prune:
+        for key, (_, index) in current.items():
+            if key not in desired:
+                changes.append(Change("delete-cas", key, None, index))
+    return changes
+
+
+def apply(consul, changes, batch_size=TXN_MAX_OPS):
+    """Apply ``changes`` in transactions of ``batch_size``; writes go first.
+
+    Each transaction is atomic, the run as a whole is not: when a later
+    batch is rolled back the earlier ones stay applied. The error says how
+    many changes were committed and carries them as ``committed``; running
+    the sync again re-reads the keyspace and finishes the rest.
+    """
+    changes = sorted(changes, key=lambda c: c.verb.startswith("delete"))
+    for start in range(0, len(changes), batch_size):
+        try:
+            consul.transaction(changes[start:start + batch_size])
+        except ConsulSyncError as e:
+            error = ConsulSyncError(
+                "{} ({} of {} changes in {} earlier batches were committed)"
+                .format(e, start, len(changes), start // batch_size))
+            error.committed = changes[:start]
+            raise error from e
+
+
+def sync(consul, prefix, pairs, prune=True, dry_run=False):
+    """Make ``prefix`` hold exactly ``pairs``; return the applied Changes.
+
+    Keys are never pruned without a prefix: that would plan a delete for
+    every key in the cluster's KV that is not in ``pairs``.
+    """
+    desired = dict(pairs)
+    prune = prune and bool(prefix.strip("/"))
+    changes = plan(desired, consul.keyspace(prefix), prune)
+    if not dry_run:
+        apply(consul, changes)
+    return changes
@@ -8,112 +8,315 @@
 #
 # With that directory as the PWD, run this script. It will write a 'dependencies' file
 # out to those salt state repos which need one.
+#
+# The tree is walked once. The `include:` block of every .sls file is kept in
+# an index cached by mtime and size, so only changed files are re-parsed (in
+# a process pool). Includes are resolved into a repo-to-repo graph, which is
+# checked for cycles, and 'dependencies' files are only rewritten when their
+# content actually changes.
 
 import os
 import re
+import sys
+import json
 import pprint
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
 
 root_path=os.getcwd()
 
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "salt-dependencies",
+)
+INDEX_VERSION = 1
 
 find_sls = re.compile(r'\.sls$')
+find_include = re.compile(r'^include:')
+find_included = re.compile(r'^ *- +(?P<module>[^\s]+)\s*$')
+find_jinja = re.compile(r'^\s*{%')
+find_package = re.compile(r'^\s*(?P<package>[^\s(,|]+)')
 
-def find_modules(path):
 
-    find_module = re.compile(r'^(?P<repository>[^/]+)/+(?P<raw_module>.+)/?$')
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Write 'dependencies' files for checked out salt states")
+    parser.add_argument('path', nargs='?', default=root_path,
+                        help='Directory holding all salt state repos (default: cwd)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Parser processes (default: CPU count)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Re-parse every .sls file')
+    parser.add_argument('--closure', action='store_true',
+                        help='Also print the transitive dependencies of each repo')
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Report changes without writing 'dependencies' files")
+    return parser.parse_args()
 
+
+def find_modules(path):
+    """Walk ``path`` once and map repos, modules and .sls files.
+
+    A module is a directory below a repo holding at least one .sls file,
+    named with dots. ``sls_files`` lists the files whose includes count
+    towards each repo (files directly in a ``saltstack`` dir are skipped).
+    """
     repos_to_modules = {}
     modules_to_repos = {}
+    sls_files = {}
 
     for root, dirs, files in os.walk(path):
-        sls_found = False
-        for f in files:
-            if find_sls.search(f):
-                relative = os.path.relpath(root, path)
-                stripped_relative = re.sub(r'^[.][/]+', '', relative)
-                module_results = find_module.search(stripped_relative)
-                if module_results:
-                    repository = module_results.group('repository')
-                    raw_module = module_results.group('raw_module')
-                    module_name = re.sub(r'[/]+', '.', raw_module)
-
-                    if repository in repos_to_modules:
-                        repos_to_modules[repository].add(module_name)
-                    else:
-                        repos_to_modules[repository] = set([module_name])
-                    modules_to_repos[module_name] = repository
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        sls = [f for f in files if find_sls.search(f)]
+        if not sls:
+            continue
+        relative = os.path.relpath(root, path)
+        if relative == '.':
+            continue
+        repository, _, raw_module = relative.partition(os.sep)
+        if os.path.basename(root) != "saltstack":
+            sls_files.setdefault(repository, []).extend(
+                os.path.join(relative, f) for f in sls)
+        raw_module = raw_module.strip(os.sep)
+        if not raw_module:
+            continue
+        module_name = re.sub(r'[/]+', '.', raw_module.replace(os.sep, '/'))
+        repos_to_modules.setdefault(repository, set()).add(module_name)
+        modules_to_repos[module_name] = repository
     return {
         "repos_to_modules": repos_to_modules,
-        "modules_to_repos": modules_to_repos
+        "modules_to_repos": modules_to_repos,
+        "sls_files": sls_files,
         }
 
 def repo_depfile(repo):
     return os.path.join(repo, "dependencies")
 
-# Cyclomatic complexity LOLZ :O w00t
-def find_dependencies(repos, modules_to_repos, path):
-    dependencies = {}
-    find_include = re.compile(r'^include:')
-    find_included = re.compile(r' +- (?P<module>[^\s]+)\s*$')
-    find_jinja = re.compile(r'^\s*{%')
 
+def parse_includes(p):
+    """Return the modules listed in the ``include:`` blocks of ``p``."""
+    included = []
+    try:
+        with open(p, 'r', encoding='utf-8', errors='ignore') as sls:
+            in_include = False
+            for l in sls:
+                if in_include:
+                    m = find_included.search(l)
+                    if m:
+                        included.append(m.group('module'))
+                        continue
+                    if find_jinja.search(l):
+                        continue
+                    in_include = False
+                if find_include.search(l):
+                    in_include = True
+    except OSError:
+        pass
+    return included
+
+
+class IncludeIndex:
+    """Per-file include lists cached on disk by (mtime_ns, size)."""
+
+    def __init__(self, path, use_cache=True):
+        key = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:16]
+        self.file = os.path.join(CACHE_DIR, "{}.json".format(key))
+        self.entries = {}
+        if use_cache:
+            try:
+                with open(self.file) as fs:
+                    data = json.load(fs)
+                if data.get("version") == INDEX_VERSION:
+                    self.entries = data["files"]
+            except (OSError, ValueError, KeyError):
+                pass
+
+    def update(self, path, relpaths, jobs=None):
+        """Refresh entries for ``relpaths``; return how many were re-parsed."""
+        stale = []
+        fresh = {}
+        for rel in relpaths:
+            try:
+                st = os.stat(os.path.join(path, rel))
+            except OSError:
+                continue
+            stamp = [st.st_mtime_ns, st.st_size]
+            entry = self.entries.get(rel)
+            if entry and entry[:2] == stamp:
+                fresh[rel] = entry
+            else:
+                stale.append((rel, stamp))
+        if stale:
+            files = [os.path.join(path, rel) for rel, _ in stale]
+            chunksize = max(1, len(files) // (4 * (jobs or os.cpu_count() or 1)))
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                for (rel, stamp), included in zip(
+                        stale, pool.map(parse_includes, files, chunksize=chunksize)):
+                    fresh[rel] = stamp + [included]
+        self.entries = fresh
+        return len(stale)
+
+    def includes(self, rel):
+        return self.entries.get(rel, [0, 0, []])[2]
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.file), exist_ok=True)
+        tmp = self.file + ".tmp"
+        with open(tmp, "w") as fs:
+            json.dump({"version": INDEX_VERSION, "files": self.entries}, fs)
+        os.replace(tmp, self.file)
+
+
+def build_graph(sls_files, modules_to_repos, index):
+    """Return {repo: set of repos it includes modules from}."""
+    graph = {}
+    for repo, files in sls_files.items():
+        deps = graph.setdefault(repo, set())
+        for rel in files:
+            for module in index.includes(rel):
+                dep_repo = modules_to_repos.get(module)
+                if dep_repo is not None and dep_repo != repo:
+                    deps.add(dep_repo)
+    return graph
+
+
+def find_cycles(graph):
+    """Return the strongly connected components of ``graph`` with > 1 repo.
+
+    Iterative Tarjan, so deep graphs don't hit the recursion limit.
+    """
+    index, low, on_stack, stack, cycles = {}, {}, set(), [], []
+    counter = 0
+    for start in graph:
+        if start in index:
+            continue
+        work = [(start, iter(sorted(graph.get(start, ()))))]
+        index[start] = low[start] = counter
+        counter += 1
+        stack.append(start)
+        on_stack.add(start)
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = low[child] = counter
+                    counter += 1
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(sorted(graph.get(child, ())))))
+                    break
+                if child in on_stack:
+                    low[node] = min(low[node], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    if len(component) > 1:
+                        cycles.append(sorted(component))
+    return cycles
+
+
+def transitive_closure(graph):
+    """Return {repo: every repo reachable from it}, excluding itself."""
+    closure = {}
+    for start in graph:
+        seen = set()
+        todo = list(graph[start])
+        while todo:
+            repo = todo.pop()
+            if repo in seen:
+                continue
+            seen.add(repo)
+            if repo in closure:
+                seen |= closure[repo]
+            else:
+                todo.extend(graph.get(repo, ()))
+        seen.discard(start)
+        closure[start] = seen
+    return closure
+
+
+def find_dependencies(repos, graph, path):
+    """Merge ``graph`` into each repo's existing 'dependencies' lines.
+
+    Existing lines are kept as they are (version constraints included);
+    a salt-state package is only added if no line already names it.
+    """
+    dependencies = {}
     for repo in repos:
-        depfile = repo_depfile(repo)
+        lines = set()
+        depfile = os.path.join(path, repo_depfile(repo))
         if os.access(depfile, os.R_OK|os.F_OK):
             with open(depfile, 'r', encoding='utf-8', errors='ignore') as df:
-                dependencies[repo] = set(df.read().strip().splitlines())
-        for root, dirs, files in os.walk(os.path.join(path, repo)):
-            if os.path.basename(root) != "saltstack":
-                for f in files:
-                    p = os.path.join(root, f)
-                    if find_sls.search(f) and os.access(p, os.R_OK|os.F_OK):
-                        with open(p, 'r', encoding='utf-8', errors='ignore') as sls:
-                            l = sls.readline()
-                            while l != '':
-                                if find_include.search(l):
-                                    l = sls.readline()
-                                    included_results = find_included.search(l)
-                                    jinja_results = find_jinja.search(l)
-                                    while l != '' and (jinja_results or included_results):
-                                        if included_results:
-                                            included_module = included_results.group('module')
-                                            if included_module in modules_to_repos and \
-                                              modules_to_repos[included_module] != repo:
-                                              dep_repo = modules_to_repos[included_module]
-                                              deb_name = 'salt-state-{repo}'.format(repo=dep_repo)
-                                              if repo in dependencies:
-                                                found_dep = False
-                                                for dep in dependencies[repo]:
-                                                  if deb_name in dep:
-                                                    found_dep = True
-                                                    break
-                                                if not found_dep:
-                                                  dependencies[repo].add(deb_name)
-                                              else:
-                                                dependencies[repo] = set([deb_name])
-                                        l = sls.readline()
-                                        included_results = find_included.search(l)
-                                        jinja_results = find_jinja.search(l)
-                                else:
-                                    l = sls.readline()
+                lines = set(df.read().strip().splitlines())
+        declared = {m.group('package') for m in map(find_package.search, lines) if m}
+        for dep_repo in graph.get(repo, ()):
+            deb_name = 'salt-state-{repo}'.format(repo=dep_repo)
+            if deb_name not in declared:
+                lines.add(deb_name)
+        if lines:
+            dependencies[repo] = lines
     return dependencies
 
 
-def write_depfiles(dependencies, path):
-    for repo, deps in dependencies.items():
-        with open(os.path.join(path, repo, 'dependencies'), 'w', encoding='utf-8') as depfile:
-            for dep in sorted(deps):
-                print(dep, file=depfile)
+def write_depfiles(dependencies, path, dry_run=False):
+    """Write changed 'dependencies' files; return the repos rewritten."""
+    changed = []
+    for repo, deps in sorted(dependencies.items()):
+        content = "".join("{}\n".format(dep) for dep in sorted(deps))
+        depfile = os.path.join(path, repo, 'dependencies')
+        try:
+            with open(depfile, 'r', encoding='utf-8') as fs:
+                if fs.read() == content:
+                    continue
+        except (OSError, UnicodeDecodeError):
+            pass
+        changed.append(repo)
+        if not dry_run:
+            with open(depfile, 'w', encoding='utf-8') as fs:
+                fs.write(content)
+    return changed
 
 def main():
-    path = os.getcwd()
+    args = parse_args()
+    path = os.path.abspath(args.path)
     modules = find_modules(path)
     modules_to_repos = modules["modules_to_repos"]
     repos_to_modules = modules["repos_to_modules"]
+    sls_files = modules["sls_files"]
     repos = list(repos_to_modules.keys())
-    dependencies = find_dependencies(repos, modules_to_repos, path)
+
+    index = IncludeIndex(path, use_cache=not args.no_cache)
+    parsed = index.update(
+        path, [f for repo in repos for f in sls_files.get(repo, ())], args.jobs)
+    index.save()
+    print("Parsed {} of {} .sls files".format(parsed, len(index.entries)),
+          file=sys.stderr)
+
+    graph = build_graph({r: sls_files.get(r, ()) for r in repos},
+                        modules_to_repos, index)
+    for cycle in find_cycles(graph):
+        print("WARNING: dependency cycle between {}".format(", ".join(cycle)),
+              file=sys.stderr)
+    if args.closure:
+        pprint.pprint(transitive_closure(graph))
+
+    dependencies = find_dependencies(repos, graph, path)
     pprint.pprint(dependencies)
-    write_depfiles(dependencies, path)
+    changed = write_depfiles(dependencies, path, args.dry_run)
+    print("{} {} of {} dependencies files".format(
+        "Would rewrite" if args.dry_run else "Rewrote",
+        len(changed), len(dependencies)), file=sys.stderr)
 
 if __name__ == "__main__":
     main()
@@ -1,12 +1,27 @@
 #!/usr/bin/env python
+"""Turn a flat Consul KV dump into a nested YAML document.
+
+The input is read as a stream, either ``key value`` lines or the JSON
+array written by ``consul kv export`` (values base64 encoded). Every key
+is inserted into one trie in a single pass, so building the tree is
+linear in the size of the input and never recurses.
+"""
 import os
+import re
+import json
 import yaml
 import base64
 import sys
-import six
+
+try:
+    from yaml import CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeDumper
 
 usage = '''
-yaml2consul INPUT_FILE OUTPUT_FILE
+kv2yaml INPUT_FILE OUTPUT_FILE
+
+INPUT_FILE holds "key value" lines or `consul kv export` JSON; use - for stdin.
 '''
 
 debug = False
@@ -28,100 +43,133 @@ def get(c, k, default=None):
 def is_int(s):
     if type(s) is not str:
         return False
-    try: 
+    try:
         int(s)
         return True
     except ValueError:
         return False
 
 
-def assoc(d, k ,v):
-    if d is None:
-        d = {}
+def coerce(v):
     if debug:
         print("v({type}) = {val}".format(type=type(v),val=v))
-    if is_int(v):
-        d[k] = int(v)
-    else:
-        d[k] = v
-    return d
-
-def assoc_in(d, key_path, v):
-    if not key_path:
-        raise ValueError("Cannot provide empty key path")
-    key, rest = key_path[0], key_path[1:]
-    if not rest:
-        return assoc(d, key, v)
-    else:
-        return assoc(d, key, assoc_in(get(d, key), rest, v))
+    return int(v) if is_int(v) else v
+
+
+def build_tree(pairs):
+    """Insert every (key, value) pair into a nested dict in one pass.
+
+    A later key may turn a scalar into a subtree; a scalar for a key that
+    already has children is an error.
+    """
+    root = {}
+    for key, value in pairs:
+        *parents, leaf = key.split("/")
+        node = root
+        for part in parents:
+            child = node.get(part)
+            if not isinstance(child, dict):
+                child = node[part] = {}
+            node = child
+        if isinstance(node.get(leaf), dict):
+            raise kv2YamlMergeError(
+                'Cannot merge non-dict "%s" into dict at key "%s"' % (value, key))
+        node[leaf] = coerce(value)
+    return root
 
-def data_merge(a, b):
-    """merges b into a and return merged result
-    NOTE: tuples and arbitrary objects are not handled as it is totally ambiguous what should happen"""
-    key = None
-    try:
-        if a is None or isinstance(a, (six.string_types, float, six.integer_types)):
-            # border case for first run or if a is a primitive
-            a = b
-        elif isinstance(a, list):
-            # lists can be only appended
-            if isinstance(b, list):
-                # merge lists
-                a.extend(b)
-            else:
-                # append to list
-                a.append(b)
-        elif isinstance(a, dict):
-            # dicts must be merged
-            if isinstance(b, dict):
-                for key in b:
-                    if key in a:
-                        a[key] = data_merge(a[key], b[key])
-                    else:
-                        a[key] = b[key]
-            else:
-                raise k2YamlMergeError('Cannot merge non-dict "%s" into dict "%s"' % (b, a))
-        else:
-            raise k2YamlMergeError('NOT IMPLEMENTED "%s" into "%s"' % (b, a))
-    except TypeError as e:
-        raise k2YamlMergeError('TypeError "%s" in key "%s" when merging "%s" into "%s"' % (e, key, b, a))
-    return a
-
-
-def expand_key(key, value):
-    path = key.split("/")
-    return assoc_in({}, path, value)
 
 def expand_keys(d):
-    try:
-        expanded = [expand_key(k, v) for k, v in d]
-        acc = {}
-        for exp in expanded:
-            acc = data_merge(acc, exp)
-        return acc
-    except ValueError as e:
-        print(e)
-        print(d)
+    return build_tree(d)
+
+
+def iter_lines(f):
+    """Yield (key, value) from ``key value`` lines."""
+    for a in f:
+        a = a.rstrip('\n')
+        if a:
+            key, _, value = a.partition(' ')
+            yield key, value
+
+
+_SKIP = re.compile(r'[\s,]*')
+
+def iter_export(f, chunk_size=1 << 20):
+    """Yield (key, value) from a `consul kv export` JSON array, streamed.
+
+    Folder keys (ending in ``/``) are skipped.
+    """
+    decoder = json.JSONDecoder()
+    buf = f.read(chunk_size).lstrip()
+    if not buf.startswith('['):
+        raise ValueError("Expected a JSON array")
+    pos = 1
+    eof = False
+    while True:
+        pos = _SKIP.match(buf, pos).end()
+        if pos < len(buf) and buf[pos] == ']':
+            return
+        try:
+            entry, end = decoder.raw_decode(buf, pos)
+        except ValueError:
+            if eof:
+                raise
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buf = buf[pos:] + chunk
+            pos = 0
+            continue
+        pos = end
+        if entry['key'].endswith('/'):
+            # folder keys carry no value, their children define the subtree
+            continue
+        value = entry.get('value')
+        value = base64.b64decode(value).decode('utf-8') if value else ''
+        yield entry['key'], value
+
+
+def read_pairs(f):
+    """Pick the input format from the first non-blank character."""
+    first = f.read(1)
+    while first.isspace():
+        first = f.read(1)
+    if first == '[':
+        return iter_export(_Prefixed(first, f))
+    return iter_lines(_Prefixed(first, f))
+
+
+class _Prefixed:
+    """File wrapper that puts back the characters consumed by read_pairs."""
+
+    def __init__(self, prefix, f):
+        self.prefix = prefix
+        self.f = f
+
+    def read(self, size=-1):
+        data, self.prefix = self.prefix + self.f.read(size), ''
+        return data
+
+    def __iter__(self):
+        first = self.prefix + self.f.readline()
+        self.prefix = ''
+        if first:
+            yield first
+        yield from self.f
+
 
 def main():
     if len(sys.argv) != 3:
         help()
         exit(1)
-    data = {}
-    with open(sys.argv[1]) as f:
-        data = f.read()
-    lines = []
-    for a in data.split('\n'):
-        if a:
-            i = a.split(' ')
-            tup = (i[0], ' '.join(i[1:]))
-            lines.append(tup)
+    if sys.argv[1] == '-':
+        tree = build_tree(read_pairs(sys.stdin))
+    else:
+        with open(sys.argv[1]) as f:
+            tree = build_tree(read_pairs(f))
     with open(sys.argv[2], 'w') as f:
-        output = yaml.safe_dump(expand_keys(lines), indent=2, default_flow_style=False)
-        if debug:
-            print(output)
-        f.write(output)
-    
+        yaml.dump(tree, f, Dumper=SafeDumper, indent=2, default_flow_style=False)
+    if debug:
+        print(yaml.dump(tree, Dumper=SafeDumper, indent=2, default_flow_style=False))
+
 
 if __name__ == '__main__':
     main()
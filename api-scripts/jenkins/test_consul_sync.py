@@ -0,0 +1,129 @@
+import base64
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import consul_sync
+
+
+class StubConsul(BaseHTTPRequestHandler):
+    """KV and txn endpoints with Consul's check-and-set semantics."""
+
+    keys = {}
+    txns = []
+    index = 100
+    # keys changed behind the sync's back right before the next txn
+    race = {}
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        prefix = self.path.split("?")[0][len("/v1/kv/"):]
+        found = [{"Key": k, "Value": base64.b64encode(v).decode(),
+                  "ModifyIndex": i}
+                 for k, (v, i) in sorted(self.keys.items())
+                 if k.startswith(prefix)]
+        if not found:
+            return self.send_json(404, None)
+        self.send_json(200, found)
+
+    def do_PUT(self):
+        ops = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.txns.append(ops)
+        for key, value in self.race.items():
+            StubConsul.index += 1
+            self.keys[key] = (value, StubConsul.index)
+        self.race.clear()
+        errors = []
+        for n, op in enumerate(ops):
+            kv = op["KV"]
+            current = self.keys.get(kv["Key"])
+            if kv["Index"] != (current[1] if current else 0):
+                errors.append({"OpIndex": n, "What": "failed index check"})
+        if errors:
+            return self.send_json(409, {"Results": None, "Errors": errors})
+        for op in ops:
+            kv = op["KV"]
+            StubConsul.index += 1
+            if kv["Verb"] == "delete-cas":
+                del self.keys[kv["Key"]]
+            else:
+                self.keys[kv["Key"]] = (base64.b64decode(kv["Value"]),
+                                        StubConsul.index)
+        self.send_json(200, {"Results": [], "Errors": None})
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def consul():
+    StubConsul.keys = {}
+    StubConsul.txns = []
+    StubConsul.race = {}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubConsul)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield consul_sync.Consul(f"http://127.0.0.1:{server.server_address[1]}/v1/")
+    server.shutdown()
+    server.server_close()
+
+
+def kv_ops(txn):
+    return [(op["KV"]["Verb"], op["KV"]["Key"], op["KV"]["Index"],
+             op["KV"].get("Value")) for op in txn]
+
+
+def test_prune_deletes_keys_missing_below_prefix(consul):
+    StubConsul.keys = {"app/a": (b"1", 5), "app/b": (b"same", 6),
+                       "app/old": (b"x", 7), "other/key": (b"y", 8)}
+    changes = consul_sync.sync(consul, "app", [("app/a", "2"), ("app/b", "same"),
+                                               ("app/new", "3")])
+    assert [(c.verb, c.key) for c in changes] == [
+        ("cas", "app/a"), ("cas", "app/new"), ("delete-cas", "app/old")]
+    # updates cas on the index they were read at, creates on 0
+    assert kv_ops(StubConsul.txns[0]) == [
+        ("cas", "app/a", 5, base64.b64encode(b"2").decode()),
+        ("cas", "app/new", 0, base64.b64encode(b"3").decode()),
+        ("delete-cas", "app/old", 7, None),
+    ]
+    assert sorted(StubConsul.keys) == ["app/a", "app/b", "app/new", "other/key"]
+
+
+def test_empty_prefix_never_prunes(consul):
+    StubConsul.keys = {"a": (b"1", 5), "vault/core": (b"x", 6),
+                       "other/key": (b"y", 7)}
+    for prefix in ("", "/"):
+        consul_sync.sync(consul, prefix, [("a", "1"), ("b", "2")])
+    assert [kv_ops(t) for t in StubConsul.txns] == [
+        [("cas", "b", 0, base64.b64encode(b"2").decode())]]
+    assert sorted(StubConsul.keys) == ["a", "b", "other/key", "vault/core"]
+
+
+def test_concurrent_change_rolls_back_and_reports_committed_batches(consul):
+    StubConsul.keys = {f"app/k{i}": (b"old", 10 + i) for i in range(4)}
+    changes = consul_sync.plan(
+        {f"app/k{i}": "new" for i in range(4)}, consul.keyspace("app"))
+
+    consul_sync.apply(consul, changes[:2], batch_size=2)
+    StubConsul.race = {"app/k3": b"theirs"}
+    with pytest.raises(consul_sync.ConsulSyncError) as err:
+        consul_sync.apply(consul, changes[2:], batch_size=1)
+    assert "app/k3: failed index check" in str(err.value)
+    assert "1 of 2 changes in 1 earlier batches were committed" in str(err.value)
+    assert [c.key for c in err.value.committed] == ["app/k2"]
+    # the rolled back batch wrote nothing, the concurrent value survives
+    assert StubConsul.keys["app/k3"][0] == b"theirs"
+    assert StubConsul.keys["app/k2"][0] == b"new"
+
+    # a rerun re-reads the keyspace and only rewrites what is still off
+    consul_sync.sync(consul, "app", [(f"app/k{i}", "new") for i in range(4)])
+    assert kv_ops(StubConsul.txns[-1])[0][:2] == ("cas", "app/k3")
+    assert {v for v, _ in StubConsul.keys.values()} == {b"new"}
@@ -1,55 +1,70 @@
 #!/usr/bin/env python
+"""Write a YAML file as a `consul kv import` JSON list, or sync it directly.
+
+With --endpoint the keys are diffed against the live keyspace and only
+changed keys are written (see consul_sync.py).
+"""
 import os
 import yaml
 import json
-import base64
 import sys
 import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+from consul_sync import Consul, flatten, import_entries, sync  # noqa: E402
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
 usage = '''
 yaml2consul YAML_FILE OUTPUT_JSON
+yaml2consul YAML_FILE --endpoint http://localhost:8500/v1/ -p PREFIX
 '''
-parser = argparse.ArgumentParser()
-parser.add_argument('input_file', action='store', help='The yaml file to read from.')
-parser.add_argument('output_file', action='store', help='The json file to write to.')
-parser.add_argument('-p', '--prefix', action='store', help='The prefix to add as a consul path')
-parser.add_argument('--debug', action='store_true')
-args = parser.parse_args()
-def get_nested(item, prefix=[], encode=True):
-    if type(item) is dict:
-        ret_vals = []
-        for k, v in item.items():
-            np = prefix + [ k ]
-            ret = get_nested(v, prefix=np)
-            if type(ret) is list:
-                ret_vals += ret
-            else:
-                ret_vals.append(ret)
-        return ret_vals
-    else:
-        ret = { 'key': '/'.join(prefix), 'flags': 0 }
-        if encode:
-            # encode and decode for type changes in python 2 and 3
-            ret['value'] = base64.b64encode(str(item).encode('ascii')).decode('utf-8')
-        else:
-            ret['value']= item
-        return ret
+
+def parse_args():
+    parser = argparse.ArgumentParser(usage=usage)
+    parser.add_argument('input_file', action='store', help='The yaml file to read from.')
+    parser.add_argument('output_file', action='store', nargs='?',
+                        help='The json file to write to.')
+    parser.add_argument('-p', '--prefix', action='store', default='',
+                        help='The prefix to add as a consul path')
+    parser.add_argument('--endpoint', action='store',
+                        help='Sync to this Consul API URL instead of writing json')
+    parser.add_argument('--token', action='store',
+                        default=os.environ.get('CONSUL_HTTP_TOKEN'),
+                        help='Consul token (default: $CONSUL_HTTP_TOKEN)')
+    parser.add_argument('--no-prune', action='store_false', dest='prune',
+                        help='Keep keys under the prefix that are not in the yaml '
+                             '(always the case without --prefix)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Print the changes without applying them')
+    parser.add_argument('--debug', action='store_true')
+    args = parser.parse_args()
+    if not (args.output_file or args.endpoint):
+        parser.error('an OUTPUT_JSON file or --endpoint is required')
+    return args
+
 def main():
-    data = {}
+    args = parse_args()
     with open(args.input_file) as f:
-        data = yaml.safe_load(f)
-    values = []
-    for key, value in data.items():
-        prefix = [key]
-        if args.prefix:
-            prefix = args.prefix.split('/') + [key]
-        nd = get_nested(value, prefix=prefix)
-        if args.debug:
-            print("{} {}".format(type(nd),nd))
-        if type(nd) is list:
-            values += nd
-        else:
-            values.append(nd)
-    consul_data = values
+        data = yaml.load(f, Loader=SafeLoader) or {}
+    pairs = flatten(data, args.prefix)
+    if args.endpoint:
+        if args.prune and not args.prefix.strip('/'):
+            print("No --prefix given: not pruning keys missing from the yaml",
+                  file=sys.stderr)
+        changes = sync(Consul(args.endpoint, args.token), args.prefix, pairs,
+                       prune=args.prune, dry_run=args.dry_run)
+        for change in changes:
+            print("{} {}".format(change.verb, change.key))
+        print("{} {} changes".format("Would apply" if args.dry_run else "Applied",
+                                     len(changes)), file=sys.stderr)
+        return
+    consul_data = import_entries(pairs)
+    if args.debug:
+        print(consul_data)
     with open(args.output_file, 'w') as f:
         json.dump(consul_data, f, indent=2, sort_keys=True)
 if __name__ == '__main__':
@@ -1,17 +1,46 @@
 #!/usr/bin/env python
 '''
 A CLI interface to a remote salt-api instance
+
+Commands run with the ``local`` client are submitted as ``local_async`` jobs
+and their returns collected concurrently:
+
+* one login token is reused for every call and only refreshed when it is
+  about to expire or salt-api rejects it
+* with ``--events`` minion returns are read from the salt-api ``/events``
+  stream as they arrive, and ``jobs.lookup_jid`` is only a slow safety net
+* otherwise ``jobs.lookup_jid`` is polled with exponential backoff that
+  resets whenever new minions return
+* only minions not seen before are recorded on each poll, and ``--jid``
+  tracks already running jobs alongside (or instead of) a new command
+
+``jobs.lookup_jid`` has no way to ask for a subset of minions, so every poll
+still transfers all returns so far; on large targets use ``--events``, which
+only delivers each return once, and keep polling as the fallback.
+
+Extra options (everything else is passed on to pepper)::
+
+    --jid JID                 track an existing job; may be repeated
+    --events                  stream returns from /events
+    --max-poll-interval SECS  upper bound for the poll backoff (default: 30)
 '''
 from __future__ import print_function
 
+import argparse
+import asyncio
 import json
+import re
 import sys
+import threading
 import time
 
 import pepper
 from pepper.cli import PepperCli
 from pepper import PepperException
 
+RET_TAG = re.compile(r'^salt/job/(?P<jid>[^/]+)/ret/(?P<minion>.+)$')
+
+
 def get_jid(json_data):
     if type(json_data) is str:
         data = json.loads(json_data)
@@ -23,13 +52,218 @@ def get_jid(json_data):
     return ret_dict.get('jid')
 
 
+def parse_extra_args(argv):
+    '''
+    Pull this script's own options out of ``argv`` before pepper parses it.
+    '''
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--jid', action='append', default=[])
+    parser.add_argument('--events', action='store_true')
+    parser.add_argument('--max-poll-interval', type=float, default=30)
+    return parser.parse_known_args(argv)
+
+
+class SaltSession(object):
+    '''
+    Share one salt-api token between threads, logging in again only when
+    the token is about to expire or a call is rejected as unauthenticated.
+    '''
+
+    def __init__(self, api, credentials, margin=60):
+        self.api = api
+        self.credentials = credentials
+        self.margin = margin
+        self.lock = threading.Lock()
+        self.logins = 0
+
+    def login(self, force=True):
+        with self.lock:
+            if not force and not self.expired():
+                return self.api.auth
+            if isinstance(self.credentials, dict):
+                auth = self.api.login(**self.credentials)
+            else:
+                auth = self.api.login(*self.credentials)
+            self.logins += 1
+            return auth
+
+    def expired(self):
+        auth = self.api.auth or {}
+        if not auth.get('token'):
+            return True
+        return time.time() > float(auth.get('expire', 0)) - self.margin
+
+    def call(self, fn, *args, **kwargs):
+        if self.expired():
+            self.login(force=False)
+        try:
+            return fn(*args, **kwargs)
+        except PepperException as exc:
+            if '401' not in str(exc) and 'uthenticat' not in str(exc):
+                raise
+        self.login()
+        return fn(*args, **kwargs)
+
+    async def acall(self, fn, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(
+            None, lambda: self.call(fn, *args, **kwargs))
+
+
+class JobTracker(object):
+    '''
+    Returns collected so far for one job.
+    '''
+
+    def __init__(self, jid, minions=None, load=None):
+        self.jid = jid
+        self.expected = set(minions or ())
+        self.load = load or {}
+        self.returns = {}
+        self.done = asyncio.Event()
+
+    @property
+    def missing(self):
+        return self.expected - set(self.returns)
+
+    def add(self, minion, ret):
+        if minion in self.returns:
+            return False
+        self.returns[minion] = ret
+        if self.expected and not self.missing:
+            self.done.set()
+        return True
+
+    def result(self):
+        '''
+        Shape the collected returns like ``jobs.print_job``.
+        '''
+        job = {
+            'Result': dict((m, {'return': r}) for m, r in self.returns.items()),
+            'Minions': sorted(self.expected or self.returns),
+        }
+        for key, field in (('Function', 'fun'), ('Arguments', 'arg'), ('Target', 'tgt')):
+            if field in self.load:
+                job[key] = self.load[field]
+        return {'return': [{self.jid: job}]}
+
+
+def lookup_returns(data):
+    ret = next(iter(data.get('return', [])), {}) or {}
+    # sometimes ret is nested in data
+    if 'data' in ret and isinstance(ret['data'], dict):
+        ret = ret['data']
+    return ret
+
+
+async def poll_job(session, tracker, timeout, interval=1, max_interval=30,
+                   factor=2):
+    '''
+    Poll ``jobs.lookup_jid`` until every expected minion returned or
+    ``timeout`` passes. The wait doubles after each poll without new
+    returns (up to ``max_interval``) and resets when minions return, and
+    is cut short when the event stream completes the job.
+
+    Each poll fetches the whole job: ``lookup_jid`` cannot be restricted to
+    the outstanding minions, only the bookkeeping here is incremental.
+    '''
+    deadline = time.monotonic() + timeout
+    wait = interval
+    while not tracker.done.is_set():
+        data = await session.acall(session.api.lookup_jid, tracker.jid)
+        returns = lookup_returns(data)
+        new = [m for m in returns if m not in tracker.returns]
+        for minion in new:
+            tracker.add(minion, returns[minion])
+        if not tracker.expected and returns and not new:
+            # existing job without a minion list: done once returns settle
+            tracker.done.set()
+        remaining = deadline - time.monotonic()
+        if tracker.done.is_set() or remaining <= 0:
+            break
+        wait = interval if new else min(wait * factor, max_interval)
+        try:
+            await asyncio.wait_for(tracker.done.wait(), min(wait, remaining))
+        except asyncio.TimeoutError:
+            pass
+    return tracker
+
+
+def stream_events(session, trackers, loop, stop):
+    '''
+    Read the salt-api ``/events`` stream in a thread and hand every minion
+    return for a tracked job to the event loop.
+    '''
+    while not stop.is_set():
+        if session.expired():
+            session.login(force=False)
+        resp = session.api.req_stream('/events')
+        if resp is None:
+            return
+        try:
+            # chunk_size=None hands lines over as they arrive
+            for line in resp.iter_lines(chunk_size=None, decode_unicode=True):
+                if stop.is_set():
+                    return
+                if not line or not line.startswith('data:'):
+                    continue
+                try:
+                    event = json.loads(line[len('data:'):].strip())
+                except ValueError:
+                    continue
+                match = RET_TAG.match(event.get('tag', ''))
+                if not match or match.group('jid') not in trackers:
+                    continue
+                tracker = trackers[match.group('jid')]
+                data = event.get('data', {})
+                loop.call_soon_threadsafe(tracker.add, match.group('minion'),
+                                          data.get('return'))
+        finally:
+            resp.close()
+
+
+async def track_jobs(session, trackers, timeout, events=False, interval=1,
+                     max_interval=30):
+    '''
+    Collect returns for every tracker concurrently and return them.
+    '''
+    stop = threading.Event()
+    if events:
+        loop = asyncio.get_running_loop()
+        listener = threading.Thread(
+            target=stream_events, args=(session, trackers, loop, stop),
+            daemon=True)
+        listener.start()
+        # the stream delivers returns, polling only catches what it missed
+        interval = max_interval
+    try:
+        await asyncio.gather(*[
+            poll_job(session, t, timeout, interval, max_interval)
+            for t in trackers.values()])
+    finally:
+        stop.set()
+    return trackers
+
+
+def job_results(trackers, fail_if_incomplete=False):
+    '''
+    Yield (exit_code, result) per tracker, in submission order.
+    '''
+    for tracker in trackers.values():
+        if tracker.expected and tracker.missing:
+            exit_code = 1 if fail_if_incomplete else 0
+            yield exit_code, {'Failed': sorted(tracker.missing),
+                              'Returned': tracker.result()}
+        else:
+            yield 0, tracker.result()
+
+
 def run():
     try:
-        cli = PepperCli()
-        for exit_code, result in async_run():
+        exit_code = 0
+        for code, result in async_run():
             print(result)
-            if exit_code is not None:
-                raise SystemExit(exit_code)
+            exit_code = max(exit_code, code or 0)
+        raise SystemExit(exit_code)
     except PepperException as exc:
         print('Pepper error: {0}'.format(exc), file=sys.stderr)
         raise SystemExit(1)
@@ -43,67 +277,68 @@ def run():
             raise SystemExit(1)
         else:
             pass
-    
-def poll_for_returns(cli, api, load, timeout=0, poll_time=0):
-    '''
-    Run a command with the local_async client and periodically poll the job
-    cache for returns for the job.
-    '''
-    load[0]['client'] = 'local_async'
-    async_ret = api.low(load)
-    jid = async_ret['return'][0]['jid']
-    nodes = async_ret['return'][0]['minions']
-    ret_nodes = []
-    exit_code = 1
-
-    # keep trying until all expected nodes return
-    total_time = 0
-    start_time = time.time()
-    exit_code = 0
-    _timeout = timeout if timeout else cli.options.timeout
-    _poll = poll_time if poll_time else cli.seconds_to_wait
-    while True:
-        total_time = time.time() - start_time
-        print("Total time:", total_time)
-        if total_time > _timeout:
-            exit_code = 1
-            break
-        # Login every time removing option for token
-        auth = api.login(*cli.parse_login())
-        jid_ret = api.lookup_jid(jid)
-        ret_nodes = list(jid_ret['return'][0].keys())
 
-        if set(ret_nodes) == set(nodes):
-            exit_code = 0
-            break
-        else:
-            time.sleep(_poll)
+def submit_jobs(session, load):
+    '''
+    Submit every ``local`` chunk of ``load`` as ``local_async`` and return
+    a JobTracker per job.
+    '''
+    trackers = {}
+    for low in load:
+        low = dict(low, client='local_async')
+        async_ret = session.call(session.api.low, [low])
+        ret = async_ret['return'][0]
+        trackers[ret['jid']] = JobTracker(ret['jid'], ret.get('minions'), low)
+    return trackers
+
+
+def job_minions(session, jid):
+    '''
+    Return the minions an already running job was sent to.
+    '''
+    ret = session.call(session.api.runner, 'jobs.list_job', jid=jid)
+    job = next(iter(ret.get('return', [])), {}) or {}
+    return job.get('Minions') or []
 
-    exit_code = exit_code if cli.options.fail_if_minions_dont_respond else 0
-    if set(ret_nodes) == set(nodes):
-        ret = api.runner(fun='jobs.print_job',jid=jid)
-    else:
-        ret = { 'Failed': list(set(ret_nodes) ^ set(nodes)) } 
-    yield exit_code, ret
 
 def async_run():
+    extra, rest = parse_extra_args(sys.argv[1:])
+    sys.argv = sys.argv[:1] + rest
     try:
         cli = PepperCli()
-        cli.parse()
-        
-        load = cli.parse_cmd()
+        if not hasattr(cli, 'options'):
+            cli.parse()
+
         api = pepper.Pepper(
             cli.parse_url(),
             debug_http=cli.options.debug_http,
             ignore_ssl_errors=cli.options.ignore_ssl_certificate_errors)
-        auth = api.login(*cli.parse_login())
-        # Call with the 
-        if load[0]['client'] == 'local':
-            for exit_code, ret in poll_for_returns(cli, api, load):
-                yield exit_code, json.dumps(ret, sort_keys=True, indent=4)
-        else:
-            ret = api.low(load)
-            exit_code = 0
+        session = SaltSession(api, cli.parse_login())
+        session.login()
+
+        trackers = dict((jid, JobTracker(jid, job_minions(session, jid)))
+                        for jid in extra.jid)
+        load = []
+        given = (cli.args or getattr(cli.options, 'json_input', None)
+                 or getattr(cli.options, 'json_file', None))
+        if given or not extra.jid:
+            try:
+                load = cli.parse_cmd(api)
+            except TypeError:
+                # salt-pepper < 0.7
+                load = cli.parse_cmd()
+        if any(low.get('client') != 'local' for low in load):
+            ret = session.call(api.low, load)
+            yield 0, json.dumps(ret, sort_keys=True, indent=4)
+            return
+        if load:
+            trackers.update(submit_jobs(session, load))
+
+        asyncio.run(track_jobs(session, trackers, cli.options.timeout,
+                               extra.events, cli.seconds_to_wait,
+                               extra.max_poll_interval))
+        for exit_code, ret in job_results(
+                trackers, cli.options.fail_if_minions_dont_respond):
             yield exit_code, json.dumps(ret, sort_keys=True, indent=4)
     except PepperException as exc:
         print('Pepper error: {0}'.format(exc), file=sys.stderr)
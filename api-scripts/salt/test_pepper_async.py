@@ -0,0 +1,152 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pepper
+import pytest
+
+import pepper_async
+
+
+class FakeSaltApi(BaseHTTPRequestHandler):
+    """salt-api stand-in: minion i of a job returns after i * ``step`` s."""
+
+    protocol_version = "HTTP/1.1"
+    step = 0.05
+    jobs = {}
+    calls = []
+    logins = 0
+    revoked = set()
+
+    def send_json(self, body, status=200):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def returned(self, jid):
+        start, minions = self.jobs[jid]
+        elapsed = time.monotonic() - start
+        return [m for i, m in enumerate(minions) if i * self.step <= elapsed]
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path.startswith("/login"):
+            FakeSaltApi.logins += 1
+            return self.send_json({"return": [{
+                "token": f"tok{FakeSaltApi.logins}", "expire": time.time() + 3600}]})
+        token = self.headers.get("X-Auth-Token")
+        if token is None or token in self.revoked:
+            return self.send_json({}, 401)
+        low = body[0]
+        self.calls.append(low.get("fun") or low["client"])
+        if low["client"] == "local_async":
+            jid = f"2026{len(self.jobs):04d}"
+            minions = [f"m{i}" for i in range(int(low["tgt"]))]
+            self.jobs[jid] = (time.monotonic(), minions)
+            return self.send_json({"return": [{"jid": jid, "minions": minions}]})
+        if low["fun"] == "jobs.lookup_jid":
+            return self.send_json({"return": [
+                {m: f"poll-{m}" for m in self.returned(low["jid"])}]})
+        if low["fun"] == "jobs.list_job":
+            return self.send_json({"return": [{"Minions": self.jobs[low["jid"]][1]}]})
+        self.send_json({}, 404)
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        sent = set()
+        try:
+            while True:
+                for jid in list(self.jobs):
+                    for minion in self.returned(jid):
+                        if (jid, minion) in sent:
+                            continue
+                        sent.add((jid, minion))
+                        event = {"tag": f"salt/job/{jid}/ret/{minion}",
+                                 "data": {"id": minion, "return": f"event-{minion}"}}
+                        chunk = f"tag: ret\ndata: {json.dumps(event)}\n\n".encode()
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                        self.wfile.flush()
+                time.sleep(0.01)
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def session():
+    FakeSaltApi.jobs = {}
+    FakeSaltApi.calls = []
+    FakeSaltApi.logins = 0
+    FakeSaltApi.revoked = set()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeSaltApi)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    api = pepper.Pepper(f"http://127.0.0.1:{server.server_address[1]}")
+    session = pepper_async.SaltSession(api, ("user", "pass", "pam"))
+    session.login()
+    yield session
+    server.shutdown()
+    server.server_close()
+
+
+def submit(session, *sizes):
+    load = [{"client": "local", "tgt": str(n), "fun": "test.ping"} for n in sizes]
+    return pepper_async.submit_jobs(session, load)
+
+
+def test_tracks_many_jobs_with_one_login(session):
+    trackers = submit(session, 6, 3)
+    asyncio.run(pepper_async.track_jobs(session, trackers, timeout=10,
+                                        interval=0.02, max_interval=0.2))
+    for tracker in trackers.values():
+        assert not tracker.missing
+        assert tracker.returns == {m: f"poll-{m}" for m in tracker.expected}
+    assert session.logins == 1
+    # backoff keeps the polls well below one per interval
+    assert FakeSaltApi.calls.count("jobs.lookup_jid") < 40
+
+
+def test_rejected_token_logs_in_again(session):
+    trackers = submit(session, 2)
+    FakeSaltApi.revoked.add(session.api.auth["token"])
+    asyncio.run(pepper_async.track_jobs(session, trackers, timeout=10,
+                                        interval=0.02, max_interval=0.2))
+    assert session.logins == 2
+    assert not next(iter(trackers.values())).missing
+
+
+def test_events_deliver_returns_without_polling(session):
+    trackers = submit(session, 8)
+    started = time.monotonic()
+    asyncio.run(pepper_async.track_jobs(session, trackers, timeout=10,
+                                        events=True, max_interval=5))
+    tracker = next(iter(trackers.values()))
+    assert not tracker.missing
+    # the first poll may catch m0, everything after comes from the stream
+    assert all(tracker.returns[f"m{i}"] == f"event-m{i}" for i in range(1, 8))
+    # done as the last event arrives, long before the 5 s safety poll
+    assert time.monotonic() - started < 2
+    assert FakeSaltApi.calls.count("jobs.lookup_jid") == 1
+
+
+def test_existing_jid_and_incomplete_job(session):
+    jid = next(iter(submit(session, 40)))
+    trackers = {jid: pepper_async.JobTracker(
+        jid, pepper_async.job_minions(session, jid))}
+    asyncio.run(pepper_async.track_jobs(session, trackers, timeout=0.3,
+                                        interval=0.02, max_interval=0.1))
+    [(code, result)] = pepper_async.job_results(trackers, fail_if_incomplete=True)
+    assert code == 1
+    assert result["Failed"] and "m39" in result["Failed"]
+    assert "m0" in result["Returned"]["return"][0][jid]["Result"]
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+"""Roll the branch restriction and Jenkins hook policy across a project.
+
+Does in bulk what bitbucket-update-permissions.py (set_branch_perms) and
+hooks/bitbucket-update-hooks.py (set_jenkins_hooks) do per repo: the
+current restrictions and hooks of every repo are read concurrently over one
+pooled session, diffed locally against the desired state, and only missing
+or changed items are written, again in parallel.
+
+Repos that were already compliant are cached per project with a hash of
+the policy and of one cheap probe of the repo: its hook list (key, enabled
+and configured state of every hook), or its restrictions with --no-hooks.
+On the next run such a repo costs that single GET as long as neither
+changed. Edits the probe cannot see (a restriction or the hook settings)
+are picked up once the entry is older than --cache-ttl; --no-cache re-reads
+everything.
+
+    bitbucket-bulk-apply.py --project SALT --dry-run
+    bitbucket-bulk-apply.py --project SALT --match '^salt-' -j 32
+"""
+import argparse
+import getpass
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger('bitbucket-bulk-apply')
+
+USER_BASE = os.path.expanduser('~')
+conf_path = os.path.join(USER_BASE, '.atlassian-conf.json')
+CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.join(USER_BASE, '.cache')),
+    'bitbucket-bulk-apply')
+base_url = "http://p-bitbucket.imovetv.com"
+
+REPOS = "/rest/api/1.0/projects/{}/repos"
+RESTRICTIONS = "/rest/branch-permissions/2.0/projects/{}/repos/{}/restrictions"
+HOOKS = "/rest/api/1.0/projects/{}/repos/{}/settings/hooks"
+JENKINS_HOOK = ('Bitbucket Server Webhook to Jenkins', 'POST_RECEIVE')
+
+hook_settings_defaults = {
+    "ignoreCommitters": "",
+    "branchOptionsBranches": "",
+    "gitRepoUrl": "",
+    "jenkinsBase": "http://p-gp2-devopsjenkins-1.imovetv.com",
+    "branchOptions": "",
+    "cloneType": "ssh"
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--project', default='SALT', help='The project of the repos (default=SALT).')
+    parser.add_argument('--name', action='append', default=[], help='Only this repo; may be repeated.')
+    parser.add_argument('--match', default='', help='A regex to match the names of the repos to update.')
+    parser.add_argument('--branches', default='dev,qa,beta,prod', help='Branches protected from deletion (default=dev,qa,beta,prod).')
+    parser.add_argument('--release-branch', default='prod', help='Branch that is fast-forward and pull-request only (default=prod).')
+    parser.add_argument('--jenkins-base', default=hook_settings_defaults['jenkinsBase'], help='Jenkins URL for the webhook.')
+    parser.add_argument('--clone-type', default='ssh', help='Clone link used as the hook gitRepoUrl (default=ssh).')
+    parser.add_argument('--no-restrictions', action='store_true', help='Leave branch restrictions alone.')
+    parser.add_argument('--no-hooks', action='store_true', help='Leave the Jenkins hook alone.')
+    parser.add_argument('--base-url', default=base_url, help='Bitbucket server URL.')
+    parser.add_argument('-j', '--jobs', type=int, default=16, help='Concurrent requests (default=16).')
+    parser.add_argument('--no-cache', action='store_true', help='Ignore the per-repo cache.')
+    parser.add_argument('--cache-ttl', type=int, default=86400, help='Seconds a compliant repo stays cached (default=86400).')
+    parser.add_argument('--dry-run', action='store_true', help='Print the changes without applying them.')
+    parser.add_argument('-v', dest='verbose', default=0, action='count', help='Increment output verbosity; may be specified multiple times')
+    return parser.parse_args()
+
+
+def load_conf():
+    conf = {}
+    try:
+        if os.path.exists(conf_path):
+            with open(conf_path, 'r') as conf_file:
+                conf = json.load(conf_file)
+    except ValueError:
+        logger.error('Decoding JSON has failed: ' + conf_path)
+    if not conf.get('username'):
+        conf['username'] = input('Enter your bitbucket username: ')
+    if not conf.get('password'):
+        conf['password'] = getpass.getpass()
+    return conf
+
+
+def make_session(conf, workers=16):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.auth = (conf['username'], conf['password'])
+    session.headers.update({
+        'accept': "application/json",
+        'content-type': "application/json",
+    })
+    return session
+
+
+def paged(session, url, params=None):
+    """Yield every value of a paged Bitbucket collection."""
+    params = dict(params or {}, limit=1000)
+    while True:
+        r = session.get(url, params=params)
+        r.raise_for_status()
+        data = r.json()
+        for value in data.get('values', []):
+            yield value
+        if data.get('isLastPage', True):
+            return
+        params['start'] = data['nextPageStart']
+
+
+def matcher(branch):
+    return {
+        "id": "refs/heads/" + branch,
+        "displayId": branch,
+        "type": {
+            "id": "BRANCH",
+            "name": "Branch"
+        },
+        "active": True
+    }
+
+
+def desired_restrictions(branches, release_branch):
+    """Return the restriction payloads set_branch_perms would create."""
+    wanted = [("no-deletes", b) for b in branches]
+    if release_branch:
+        wanted += [("fast-forward-only", release_branch),
+                   ("pull-request-only", release_branch)]
+    return [{"type": t, "matcher": matcher(b), "users": [], "groups": []}
+            for t, b in wanted]
+
+
+def _ids(values, field):
+    return tuple(sorted(v.get(field) if isinstance(v, dict) else v for v in values or []))
+
+
+def restriction_key(restriction):
+    """Identify a restriction by what it enforces and who is exempt from it."""
+    access_keys = [k.get('key', k) if isinstance(k, dict) else k
+                   for k in restriction.get('accessKeys') or []]
+    return (restriction['type'], restriction['matcher']['id'],
+            _ids(restriction.get('users'), 'name'),
+            _ids(restriction.get('groups'), 'name'),
+            _ids(access_keys, 'id'))
+
+
+def fingerprint(data):
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+class RepoCache:
+    """Per-project record of repos found compliant, keyed by repo slug."""
+
+    def __init__(self, project, enabled=True, ttl=86400):
+        self.path = os.path.join(CACHE_DIR, '{}.json'.format(project))
+        self.ttl = ttl
+        self.repos = {}
+        if enabled:
+            try:
+                with open(self.path) as fs:
+                    self.repos = json.load(fs)
+            except (OSError, ValueError):
+                pass
+
+    def fresh(self, slug, policy, state):
+        entry = self.repos.get(slug)
+        return (entry is not None and entry['policy'] == policy
+                and entry['state'] == fingerprint(state)
+                and time.time() - entry.get('time', 0) < self.ttl)
+
+    def record(self, slug, policy, state):
+        self.repos[slug] = {'policy': policy, 'state': fingerprint(state),
+                            'time': time.time()}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as fs:
+            json.dump(self.repos, fs, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+def clone_link(repo, clone_type):
+    for link in repo.get('links', {}).get('clone', []):
+        if link['name'] == clone_type:
+            return link['href']
+    return ""
+
+
+def read_hook(session, url, hooks=None):
+    """Return the Jenkins hook of a repo with its settings, or None.
+
+    ``hooks`` is the already listed hooks of the repo, if any.
+    """
+    for hook in hooks if hooks is not None else paged(session, url):
+        details = hook['details']
+        if (details['name'], details['type']) == JENKINS_HOOK:
+            r = session.get("{}/{}/settings".format(url, details['key']))
+            hook['settings'] = r.json() if r.ok and r.content else {}
+            return hook
+    return None
+
+
+def plan_repo(session, args, repo, policy, cache, wanted):
+    """Read one repo and return (slug, actions, state).
+
+    ``actions`` is a list of (description, method, url, payload); empty when
+    the repo is compliant or the cache says it still is. ``state`` is the
+    probe to cache the repo under, or None on a cache hit.
+    """
+    slug = repo['slug']
+    base = args.base_url
+    url = base + RESTRICTIONS.format(args.project, slug)
+    hooks_url = base + HOOKS.format(args.project, slug)
+    hooks = restrictions = None
+    if not args.no_hooks:
+        hooks = list(paged(session, hooks_url))
+        state = [[h['details']['key'], h.get('enabled'), h.get('configured')]
+                 for h in hooks]
+    else:
+        restrictions = sorted(paged(session, url), key=lambda r: r['id'])
+        state = restrictions
+    if cache.fresh(slug, policy, state):
+        return slug, [], None
+    if restrictions is None and not args.no_restrictions:
+        restrictions = sorted(paged(session, url), key=lambda r: r['id'])
+    hook = None if args.no_hooks else read_hook(session, hooks_url, hooks)
+    actions = []
+    if not args.no_restrictions:
+        have = {restriction_key(r) for r in restrictions}
+        for payload in wanted:
+            if restriction_key(payload) not in have:
+                actions.append(("set {} on {}".format(payload['type'], payload['matcher']['displayId']),
+                                "POST", url, payload))
+    if not args.no_hooks:
+        if hook is not None:
+            current = hook.get('settings') or {}
+            settings = dict(hook_settings_defaults, **current)
+            settings.update(jenkinsBase=args.jenkins_base,
+                            gitRepoUrl=clone_link(repo, args.clone_type))
+            key_url = "{}/{}".format(hooks_url, hook['details']['key'])
+            if settings != current:
+                actions.append(("configure jenkins hook", "PUT", key_url + "/settings", settings))
+            if not hook['enabled']:
+                actions.append(("enable jenkins hook", "PUT", key_url + "/enabled", None))
+        else:
+            logger.warning("{}: Jenkins hook is not installed".format(slug))
+    return slug, actions, state
+
+
+def apply_action(session, action):
+    description, method, url, payload = action
+    r = session.request(method, url, json=payload)
+    r.raise_for_status()
+    return r
+
+
+def run():
+    args = parse_args()
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(max(logging.INFO - args.verbose * 10, 1))
+    conf = load_conf()
+    session = make_session(conf, args.jobs)
+
+    branches = [b for b in args.branches.split(',') if b]
+    wanted = desired_restrictions(branches, args.release_branch)
+    policy = fingerprint([wanted, args.jenkins_base, args.clone_type,
+                          args.no_restrictions, args.no_hooks])
+    cache = RepoCache(args.project, enabled=not args.no_cache, ttl=args.cache_ttl)
+
+    logger.info("Gathering repos...")
+    repos = [r for r in paged(session, args.base_url + REPOS.format(args.project))
+             if (not args.name or r['name'] in args.name or r['slug'] in args.name)
+             and (not args.match or re.match(args.match, r['name']))]
+    logger.info("Found ({}) repos in project".format(len(repos)))
+
+    plans = {}
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [pool.submit(plan_repo, session, args, r, policy, cache, wanted)
+                   for r in repos]
+        for future in as_completed(futures):
+            slug, actions, state = future.result()
+            if actions:
+                plans[slug] = actions
+            elif state is not None:
+                cache.record(slug, policy, state)
+    logger.info("{} of {} repos need changes".format(len(plans), len(repos)))
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {}
+        for slug in sorted(plans):
+            for action in plans[slug]:
+                logger.info("{}: {}".format(slug, action[0]))
+                if not args.dry_run:
+                    futures[pool.submit(apply_action, session, action)] = (slug, action)
+        for future in as_completed(futures):
+            slug, action = futures[future]
+            try:
+                future.result()
+            except requests.RequestException as e:
+                failed += 1
+                logger.error("{}: failed to {}: {}".format(slug, action[0], e))
+    cache.save()
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    run()
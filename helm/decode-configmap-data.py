@@ -1,71 +1,69 @@
-#!/usr/bin/env python
-import collections
-import base64
-import gzip
+#!/usr/bin/env python3
+"""Decode the release stored in a Helm ConfigMap (v2 Tiller or the v3
+ConfigMap driver) or a Helm v3 release Secret.
+
+By default the decompressed record is printed with control and non-ASCII
+bytes stripped, which makes the protobuf-encoded v2 records readable. Use
+--field to extract parsed fields such as the manifest or values instead.
+
+    decode-configmap-data.py web.v3.yaml --out-file web.v3.txt
+    decode-configmap-data.py web.v3.yaml -f manifest
+"""
+import argparse
+import os
+import sys
+
 import yaml
 
-__version__ = "0.1.0"
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+import helm_release  # noqa: E402
 
-from yamlmerge.yamlmerge import yaml_load, construct_ordereddict, \
-    represent_ordereddict, represent_str
+__version__ = "0.2.0"
 
 
 def parse_args():
-    import optparse
-    parser = optparse.OptionParser(usage="%prog [options] source...",
-                                   description="Merge YAML data from given files, dir or file glob",
-                                   version="%" + "prog %s" % __version__,
-                                   prog="helm-decode-configmap-data")
-    parser.add_option("--out-file", action="store", default=None,
-                      help="The push the output to a file.")
-    parser.add_option("--debug", dest="debug", action="store_true", default=False,
-                      help="Enable debug logging [%default]")
+    parser = argparse.ArgumentParser(
+        prog="helm-decode-configmap-data",
+        description="Decode Helm release data from ConfigMaps or Secrets",
+    )
+    parser.add_argument("source", nargs="+",
+                        help="ConfigMap/Secret YAML or JSON files")
+    parser.add_argument("--out-file", default=None,
+                        help="The push the output to a file.")
+    parser.add_argument("-f", "--field", action="append",
+                        choices=sorted(helm_release.FIELDS),
+                        help="Print this parsed release field (repeatable)")
+    parser.add_argument("--version", action="version",
+                        version=f"%(prog)s {__version__}")
     return parser.parse_args()
-    
-def yaml_dump():
-    try:
-        yaml.SafeLoader.add_constructor(u'tag:yaml.org,2002:omap', construct_ordereddict)
-        yaml.SafeDumper.add_representer(collections.OrderedDict, represent_ordereddict)
-        yaml.SafeDumper.add_representer(str, represent_str)
-        if six.PY2:
-            # pylint: disable=undefined-variable
-            yaml.SafeDumper.add_representer(unicode, represent_str)
-        print(yaml.safe_dump(yaml_load(
-            args, defaultdata={}, unique_list=options.unique_list, key_on=options.key_on),
-            indent=2, default_flow_style=False, canonical=False))
-    except Exception as e:
-        parser.error(e)
 
 
-def main():
-    # setup
-    options, args = parse_args()
-    if options.debug:
-        logger = logging.getLogger()
-        loghandler = logging.StreamHandler()
-        loghandler.setFormatter(logging.Formatter('yamlmerge: %(levelname)s: %(message)s'))
-        logger.addHandler(loghandler)
-        logger.setLevel(logging.DEBUG)
+def write_fields(obj, fields, fh):
+    data = helm_release.decode_release(obj, fields)
+    if len(fields) == 1 and isinstance(data[fields[0]], str):
+        fh.write(data[fields[0]].encode("utf-8"))
+    else:
+        fh.write(yaml.safe_dump(data, default_flow_style=False).encode())
 
-    if not args:
-        parser.error("Need at least one argument")
-    # get data
-    cm = yaml_load(args)
-    data = cm['data']['release']
-    z = base64.b64decode(data)
-    b = gzip.decompress(z)
-    ascii_sym_re = re.compile(rb'[\x00-\x09\x0b-\x1f\x7f-\xff]', re.DOTALL|re.MULTILINE)
-    exclude = [chr(c).encode('ascii') for c in range(0,31)]
-    exclude.remove(b'\n')
-    exclude.remove(b'\r')
-    exclude.remove(b'\t')
-    o = bytes([b[i] for i in range(0, len(b)) if b[i:i+1] not in exclude and b[i]<128])
-    if options.out_file is None:
-        print(o.decode('utf-8'))
+
+def main():
+    args = parse_args()
+    if args.out_file is None:
+        out = sys.stdout.buffer
     else:
-        with open(options.out_file, 'wb') as fs:
-            fs.write(o)
-    
-    
+        out = open(args.out_file, "wb")
+    try:
+        for source in args.source:
+            obj = helm_release.load_object(source)
+            if args.field:
+                write_fields(obj, args.field, out)
+            else:
+                helm_release.write_raw(obj, out, clean=True)
+            out.write(b"\n")
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""Decode Helm release records stored in Kubernetes objects.
+
+Shared by ``helm/decode-configmap-data.py`` and
+``k8s/extract-helm-secret.py``. Understands both storage formats:
+
+* Helm v3 ``sh.helm.release.v1`` Secrets (and the v3 ConfigMap driver):
+  ``data.release`` is base64(base64(gzip(JSON))) in a Secret and
+  base64(gzip(JSON)) in a ConfigMap.
+* Helm v2 Tiller ConfigMaps: ``data.release`` is base64(gzip(protobuf)).
+
+The payload is base64-decoded and gunzipped in chunks, so raw output can be
+streamed straight to a file. v2 protobuf records are read with a minimal
+wire-format reader into the same shape as a v3 release, so field selection
+(``manifest``, ``values``, ``chart`` ...) works for both.
+"""
+import base64
+import json
+import subprocess
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+CHUNK_SIZE = 1 << 20
+
+# Control characters other than tab/newline/carriage return, plus every
+# non-ASCII byte. Used with bytes.translate to make v2 payloads printable.
+_STRIP = bytes(c for c in range(256)
+               if (c < 32 and c not in b"\t\n\r") or c >= 127)
+
+_V2_STATUS = [
+    "unknown", "deployed", "deleted", "superseded", "failed", "deleting",
+    "pending-install", "pending-upgrade", "pending-rollback",
+]
+
+FIELDS = {
+    "name": lambda r: r.get("name"),
+    "namespace": lambda r: r.get("namespace"),
+    "version": lambda r: r.get("version"),
+    "info": lambda r: r.get("info"),
+    "manifest": lambda r: r.get("manifest"),
+    "values": lambda r: r.get("config"),
+    "default-values": lambda r: (r.get("chart") or {}).get("values"),
+    "chart": lambda r: (r.get("chart") or {}).get("metadata"),
+    "hooks": lambda r: r.get("hooks"),
+}
+
+
+def load_object(source):
+    """Return the Secret/ConfigMap dict from a path or file handle."""
+    if hasattr(source, "read"):
+        return yaml.load(source, Loader=SafeLoader)
+    with open(source) as fh:
+        return yaml.load(fh, Loader=SafeLoader)
+
+
+def release_payload(obj):
+    """Return the Helm-encoded ``release`` string from a Secret/ConfigMap."""
+    payload = (obj.get("data") or {}).get("release")
+    if payload is None:
+        raise ValueError("object has no data.release field")
+    if obj.get("kind") == "Secret":
+        # Secret data carries one more layer of base64 than ConfigMap data
+        return _b64join(_iter_b64decode([payload]))
+    return payload
+
+
+def _b64join(chunks):
+    return b"".join(chunks).decode("ascii")
+
+
+def _iter_b64decode(chunks):
+    """Base64-decode an iterable of str/bytes chunks incrementally."""
+    rest = b""
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("ascii")
+        for start in range(0, len(chunk), CHUNK_SIZE):
+            buf = rest + chunk[start:start + CHUNK_SIZE]
+            cut = len(buf) - len(buf) % 4
+            rest = buf[cut:]
+            if cut:
+                yield base64.b64decode(buf[:cut])
+    if rest:
+        yield base64.b64decode(rest)
+
+
+def _iter_gunzip(chunks):
+    """Gunzip an iterable of byte chunks; pass through non-gzip data."""
+    decomp = None
+    for chunk in chunks:
+        if decomp is None:
+            if not chunk.startswith(b"\x1f\x8b"):
+                yield chunk
+                yield from chunks
+                return
+            decomp = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        out = decomp.decompress(chunk, CHUNK_SIZE)
+        while out:
+            yield out
+            out = decomp.decompress(decomp.unconsumed_tail, CHUNK_SIZE)
+    if decomp is not None:
+        tail = decomp.flush()
+        if tail:
+            yield tail
+
+
+def iter_decoded(payload):
+    """Yield the decompressed release record of a Helm-encoded string."""
+    return _iter_gunzip(iter(_iter_b64decode([payload])))
+
+
+def strip_control(data):
+    """Drop control and non-ASCII bytes, keeping tabs and newlines."""
+    return data.translate(None, _STRIP)
+
+
+# --- Helm v2 protobuf -----------------------------------------------------
+
+def _varint(buf, i):
+    shift = result = 0
+    while True:
+        b = buf[i]
+        i += 1
+        result |= (b & 0x7F) << shift
+        if not b & 0x80:
+            return result, i
+        shift += 7
+
+
+def _pb_fields(buf):
+    """Yield ``(field number, value)`` pairs from a protobuf message."""
+    buf = memoryview(buf)
+    i, n = 0, len(buf)
+    while i < n:
+        key, i = _varint(buf, i)
+        num, wire = key >> 3, key & 7
+        if wire == 0:
+            value, i = _varint(buf, i)
+        elif wire == 2:
+            size, i = _varint(buf, i)
+            value = buf[i:i + size]
+            i += size
+        elif wire == 1:
+            value, i = buf[i:i + 8], i + 8
+        elif wire == 5:
+            value, i = buf[i:i + 4], i + 4
+        else:
+            raise ValueError(f"unsupported protobuf wire type {wire}")
+        yield num, value
+
+
+def _pb_str(value):
+    return bytes(value).decode("utf-8", errors="replace")
+
+
+def _pb_raw_yaml(value):
+    """Parse a hapi Config message (field 1 holds raw YAML)."""
+    for num, v in _pb_fields(value):
+        if num == 1:
+            text = _pb_str(v)
+            try:
+                return yaml.load(text, Loader=SafeLoader)
+            except yaml.YAMLError:
+                return text
+    return None
+
+
+def _pb_timestamp(value):
+    for num, v in _pb_fields(value):
+        if num == 1:
+            return v
+    return None
+
+
+def _pb_info(value):
+    info = {}
+    for num, v in _pb_fields(value):
+        if num == 1:
+            for snum, sv in _pb_fields(v):
+                if snum == 1:
+                    info["status"] = (_V2_STATUS[sv] if sv < len(_V2_STATUS)
+                                      else str(sv))
+        elif num in (2, 3, 4):
+            key = ("first_deployed", "last_deployed", "deleted")[num - 2]
+            info[key] = _pb_timestamp(v)
+        elif num == 5:
+            info["description"] = _pb_str(v)
+    return info
+
+
+_V2_METADATA = {1: "name", 2: "home", 4: "version", 5: "description",
+                8: "engine", 9: "icon", 10: "apiVersion", 13: "appVersion"}
+
+
+def _pb_chart(value):
+    chart = {"metadata": {}}
+    for num, v in _pb_fields(value):
+        if num == 1:
+            for mnum, mv in _pb_fields(v):
+                if mnum in _V2_METADATA:
+                    chart["metadata"][_V2_METADATA[mnum]] = _pb_str(mv)
+        elif num == 4:
+            chart["values"] = _pb_raw_yaml(v)
+    return chart
+
+
+def parse_v2(data):
+    """Return a v3-shaped release dict from a Helm v2 protobuf record."""
+    release = {}
+    hooks = []
+    for num, v in _pb_fields(data):
+        if num == 1:
+            release["name"] = _pb_str(v)
+        elif num == 2:
+            release["info"] = _pb_info(v)
+        elif num == 3:
+            release["chart"] = _pb_chart(v)
+        elif num == 4:
+            release["config"] = _pb_raw_yaml(v)
+        elif num == 5:
+            release["manifest"] = _pb_str(v)
+        elif num == 6:
+            hook = {}
+            for hnum, hv in _pb_fields(v):
+                if hnum in (1, 2, 3, 4):
+                    key = ("name", "kind", "path", "manifest")[hnum - 1]
+                    hook[key] = _pb_str(hv)
+            hooks.append(hook)
+        elif num == 7:
+            release["version"] = v
+        elif num == 8:
+            release["namespace"] = _pb_str(v)
+    if hooks:
+        release["hooks"] = hooks
+    return release
+
+
+# --- Decoding -------------------------------------------------------------
+
+def parse_release(data):
+    """Parse a decompressed release record (v3 JSON or v2 protobuf)."""
+    if data[:1] == b"{":
+        return json.loads(data)
+    return parse_v2(data)
+
+
+def select_fields(release, fields=None):
+    """Return only ``fields`` of ``release`` (all of it when empty)."""
+    if not fields:
+        return release
+    return {f: FIELDS[f](release) for f in fields}
+
+
+def decode_payload(payload, fields=None):
+    """Decode a Helm-encoded release string and select ``fields``."""
+    return select_fields(parse_release(b"".join(iter_decoded(payload))),
+                         fields)
+
+
+def decode_release(obj, fields=None):
+    """Decode the release stored in a Secret/ConfigMap dict."""
+    return decode_payload(release_payload(obj), fields)
+
+
+def write_raw(obj, fh, clean=False):
+    """Stream the decompressed release record of ``obj`` to ``fh``."""
+    for chunk in iter_decoded(release_payload(obj)):
+        fh.write(strip_control(chunk) if clean else chunk)
+
+
+# --- History --------------------------------------------------------------
+
+DRIVERS = {
+    # driver: (kind, default namespace, label selector template)
+    "secret": ("secrets", None, "owner=helm,name={name}"),
+    "configmap": ("configmaps", None, "owner=helm,name={name}"),
+    "tiller": ("configmaps", "kube-system", "OWNER=TILLER,NAME={name}"),
+}
+
+
+def list_revisions(name, namespace=None, driver="secret", context=None):
+    """Return every stored revision object for release ``name``."""
+    kind, default_ns, selector = DRIVERS[driver]
+    command = ["kubectl", "get", kind, "-o", "json",
+               "-l", selector.format(name=name)]
+    namespace = namespace or default_ns
+    if namespace:
+        command += ["-n", namespace]
+    if context:
+        command += ["--context", context]
+    result = subprocess.run(command, capture_output=True, check=True)
+    return json.loads(result.stdout).get("items", [])
+
+
+def _decode_revision(args):
+    return decode_payload(*args)
+
+
+def decode_history(objects, fields=None, jobs=None):
+    """Decode many revision objects in parallel, sorted by version.
+
+    Returns ``(version, status, release)`` tuples.
+    """
+    if fields and "version" not in fields:
+        fields = list(fields) + ["version"]
+    work = [(release_payload(o), fields) for o in objects]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        releases = list(pool.map(_decode_revision, work))
+    rows = []
+    for obj, release in zip(objects, releases):
+        labels = (obj.get("metadata") or {}).get("labels") or {}
+        status = labels.get("status") or labels.get("STATUS")
+        rows.append((int(release.get("version") or 0), status, release))
+    return sorted(rows, key=lambda row: row[0])
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""Compare two kube_backup.py snapshots, or a snapshot against the live
+cluster, and report added, removed and changed objects.
+
+Both sides are reduced to an index of namespace/kind/name -> hash of the
+object after k8s_filter.clean_resource, built in parallel. Only objects
+whose hashes differ are deep-diffed (also in parallel) to produce
+field-level paths, so large snapshots compare in seconds.
+
+Examples
+--------
+    backup-diff.py k8s-backup/prod-old k8s-backup/prod
+    backup-diff.py k8s-backup/prod --live
+    backup-diff.py k8s-backup/prod --live --kinds deployments,configmaps
+"""
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+from k8s_filter import clean_resource  # noqa: E402
+
+# Summary files written by kube_backup.py --summary; they repeat the tree.
+SUMMARY_FILES = {"resources.yaml", "custom-resources.yaml"}
+YAML_SUFFIXES = (".yaml", ".yml", ".json")
+
+
+class bcolors:
+    OKGREEN = "\033[92m"
+    YELLOW = "\033[33m"
+    FAIL = "\033[91m"
+    ENDC = "\033[0m"
+    BOLD = "\033[1m"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Diff kube_backup.py snapshots or a snapshot and the live cluster",
+    )
+    parser.add_argument("old", help="snapshot directory (the baseline)")
+    parser.add_argument("new", nargs="?", help="snapshot directory to compare against")
+    parser.add_argument("--live", action="store_true",
+                        help="compare OLD against the current cluster instead of NEW")
+    parser.add_argument("-k", "--kinds",
+                        help="kinds to fetch with --live; defaults to the kinds found in OLD")
+    parser.add_argument("--context", help="kube context to use with --live")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="worker processes (default: CPU count)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+    if bool(args.new) == args.live:
+        parser.error("give either a NEW snapshot or --live")
+    return args
+
+
+def normalize(o):
+    """Return ``o`` stripped of fields that differ between equal objects."""
+    o = clean_resource(o)
+    if o.get("metadata"):
+        o["metadata"].pop("managedFields", None)
+    return o
+
+
+def object_key(o):
+    meta = o.get("metadata") or {}
+    return f'{meta.get("namespace", "cluster")}/{o.get("kind")}/{meta.get("name")}'
+
+
+def object_hash(o):
+    data = json.dumps(o, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def iter_objects(doc):
+    """Yield Kubernetes objects from a document, unwrapping kind: List."""
+    if not isinstance(doc, dict):
+        return
+    if "items" in doc and str(doc.get("kind", "")).endswith("List"):
+        for item in doc["items"] or []:
+            yield from iter_objects(item)
+    elif doc.get("kind") and doc.get("metadata"):
+        yield doc
+
+
+def load_file(path):
+    with open(path) as fh:
+        for doc in yaml.load_all(fh, Loader=SafeLoader):
+            yield from iter_objects(doc)
+
+
+def _index_files(paths):
+    """Worker: return {key: (hash, path)} for a batch of files."""
+    index = {}
+    for path in paths:
+        for o in load_file(path):
+            o = normalize(o)
+            index[object_key(o)] = (object_hash(o), path)
+    return index
+
+
+def snapshot_files(root):
+    files = []
+    for d, _, names in os.walk(root):
+        for name in names:
+            if d == root and name in SUMMARY_FILES:
+                continue
+            if name.endswith(YAML_SUFFIXES):
+                files.append(os.path.join(d, name))
+    return sorted(files)
+
+
+def _batches(items, n):
+    size = max(1, len(items) // (n * 4) + 1)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def index_snapshot(root, pool, jobs):
+    """Return {key: (hash, path)} for every object in a snapshot tree."""
+    index = {}
+    for part in pool.map(_index_files, _batches(snapshot_files(root), jobs)):
+        index.update(part)
+    return index
+
+
+def index_live(kinds, context=None):
+    """Return {key: (hash, object)} for ``kinds`` in the current cluster."""
+    command = ["kubectl", "get", ",".join(kinds), "-A", "-o", "json"]
+    if context:
+        command += ["--context", context]
+    result = subprocess.run(command, capture_output=True, check=True)
+    index = {}
+    for o in iter_objects(json.loads(result.stdout)):
+        o = normalize(o)
+        index[object_key(o)] = (object_hash(o), o)
+    return index
+
+
+def _resolve(ref, key):
+    """Return the normalized object for an index reference."""
+    if isinstance(ref, dict):
+        return ref
+    for o in load_file(ref):
+        o = normalize(o)
+        if object_key(o) == key:
+            return o
+    return None
+
+
+def deep_diff(old, new, path=""):
+    """Yield ``(path, old, new)`` for every differing leaf."""
+    if isinstance(old, dict) and isinstance(new, dict):
+        for k in sorted(set(old) | set(new), key=str):
+            p = f"{path}.{k}" if path else str(k)
+            if k not in new:
+                yield p, old[k], None
+            elif k not in old:
+                yield p, None, new[k]
+            elif old[k] != new[k]:
+                yield from deep_diff(old[k], new[k], p)
+    elif isinstance(old, list) and isinstance(new, list):
+        for i in range(max(len(old), len(new))):
+            p = f"{path}[{i}]"
+            if i >= len(new):
+                yield p, old[i], None
+            elif i >= len(old):
+                yield p, None, new[i]
+            elif old[i] != new[i]:
+                yield from deep_diff(old[i], new[i], p)
+    elif old != new:
+        yield path, old, new
+
+
+def _diff_one(args):
+    key, old_ref, new_ref = args
+    old = _resolve(old_ref, key)
+    new = _resolve(new_ref, key)
+    return key, list(deep_diff(old, new))
+
+
+def compare(old, new, pool):
+    """Compare two indexes; returns (added, removed, changed)."""
+    added = sorted(new.keys() - old.keys())
+    removed = sorted(old.keys() - new.keys())
+    work = [(k, old[k][1], new[k][1]) for k in sorted(old.keys() & new.keys())
+            if old[k][0] != new[k][0]]
+    changed = list(pool.map(_diff_one, work, chunksize=16))
+    return added, removed, changed
+
+
+def kinds_in(index):
+    return sorted({key.split("/")[1] for key in index})
+
+
+def print_report(added, removed, changed):
+    for key in added:
+        print(f"{bcolors.OKGREEN}+ {key}{bcolors.ENDC}")
+    for key in removed:
+        print(f"{bcolors.FAIL}- {key}{bcolors.ENDC}")
+    for key, fields in changed:
+        print(f"{bcolors.YELLOW}~ {key}{bcolors.ENDC}")
+        for path, old, new in fields:
+            print(f"    {path}: {json.dumps(old, default=str)} -> "
+                  f"{json.dumps(new, default=str)}")
+    print(f"{bcolors.BOLD}{len(added)} added, {len(removed)} removed, "
+          f"{len(changed)} changed{bcolors.ENDC}")
+
+
+def main():
+    args = parse_args()
+    jobs = args.jobs or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        old = index_snapshot(args.old, pool, jobs)
+        if args.live:
+            kinds = args.kinds.split(",") if args.kinds else kinds_in(old)
+            new = index_live(kinds, args.context)
+        else:
+            new = index_snapshot(args.new, pool, jobs)
+        added, removed, changed = compare(old, new, pool)
+    if args.json:
+        print(json.dumps({
+            "added": added,
+            "removed": removed,
+            "changed": {k: [{"path": p, "old": o, "new": n} for p, o, n in f]
+                        for k, f in changed},
+        }, default=str, indent=2))
+    else:
+        print_report(added, removed, changed)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@
 # Normalize a Kubernetes backup directory tree: rename group-suffixed
 # subdirs (e.g. "deployment.apps" -> "deployment") and prune redundant
 # resource kinds so the layout matches live cluster naming.
+# New backups can do this while writing with: kube_backup.py --normalize
 set -eEo pipefail
 #set -x
 swapname() {
@@ -11,17 +11,34 @@ Examples
         | k8s-decode-tls-secret
     k8s-decode-tls-secret secret.yaml --backend openssl
     k8s-decode-tls-secret --key ca.crt secret.json
+
+Bulk mode sweeps many ``kubernetes.io/tls`` Secrets at once, from a
+``kube_backup.py`` directory or a ``kubectl get secrets -A -o json`` List,
+and prints one report sorted by expiry. Identical certificates (shared CA
+chains) are parsed once, in parallel, with the ``cryptography`` backend.
+
+    kubectl get secrets -A -o json | k8s-decode-tls-secret --bulk
+    k8s-decode-tls-secret --bulk k8s-backup/prod --within 30
 """
 
 import argparse
 import base64
 import datetime as dt
+import hashlib
+import json
+import os
 import re
 import subprocess
 import sys
+from concurrent.futures import ProcessPoolExecutor
 
 import yaml
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
 
 def load_secret(source):
     """Return the parsed Secret dict from a path or file handle."""
@@ -158,6 +175,160 @@ def summarize_openssl(pem_bundle):
     return summaries
 
 
+# --- Bulk -----------------------------------------------------------------
+
+TLS_TYPE = "kubernetes.io/tls"
+ALT_NAMES_ANNOTATION = "cert-manager.io/alt-names"
+
+
+def _secrets_in(doc):
+    if not isinstance(doc, dict):
+        return
+    if doc.get("kind") == "Secret":
+        yield doc
+    elif "items" in doc:
+        for item in doc.get("items") or []:
+            yield from _secrets_in(item)
+
+
+def iter_secrets(source):
+    """Yield every Secret in a backup directory, List file or stream."""
+    if hasattr(source, "read"):
+        for doc in yaml.load_all(source, Loader=SafeLoader):
+            yield from _secrets_in(doc)
+        return
+    if not os.path.isdir(source):
+        with open(source) as fh:
+            yield from iter_secrets(fh)
+        return
+    for root, _, files in os.walk(source):
+        for name in sorted(files):
+            if name.endswith((".yaml", ".yml", ".json")):
+                with open(os.path.join(root, name)) as fh:
+                    yield from iter_secrets(fh)
+
+
+def fingerprint(pem):
+    """Return the SHA-256 fingerprint of a single PEM certificate."""
+    body = b"".join(pem.splitlines()[1:-1])
+    return hashlib.sha256(base64.b64decode(body)).hexdigest()
+
+
+def _summarize_one(pem):
+    try:
+        return summarize_python(pem)[0]
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+
+
+def san_mismatch(secret, leaf):
+    """Return names the Secret expects that the leaf cert does not cover."""
+    annotations = (secret.get("metadata") or {}).get("annotations") or {}
+    expected = annotations.get(ALT_NAMES_ANNOTATION)
+    if not expected:
+        return []
+    sans = set(leaf["sans"])
+    missing = []
+    for name in (n.strip() for n in expected.split(",")):
+        wildcard = "*." + name.split(".", 1)[-1]
+        if name and name not in sans and wildcard not in sans:
+            missing.append(name)
+    return missing
+
+
+def _cert_entries(data):
+    """Return (fingerprint, pem, error) for each cert in a Secret data value."""
+    try:
+        pems = list(split_pem(base64.b64decode(data)))
+    except ValueError as e:
+        return [(None, None, f"invalid base64: {e}")]
+    entries = []
+    for pem in pems:
+        try:
+            entries.append((fingerprint(pem), pem, None))
+        except ValueError as e:
+            entries.append((None, None, f"invalid PEM body: {e}"))
+    return entries
+
+
+def bulk_report(secrets, key="tls.crt", jobs=None):
+    """Summarize the certs of many TLS Secrets, parsing each cert once.
+
+    Returns one row per certificate per Secret, sorted by expiry. Certs that
+    fail to decode or parse are reported as rows with an ``error`` and no
+    dates, sorted first.
+    """
+    bundles = []
+    unique = {}
+    for secret in secrets:
+        if secret.get("type") != TLS_TYPE:
+            continue
+        data = secret.get("data") or {}
+        if key not in data:
+            continue
+        entries = _cert_entries(data[key])
+        for fp, pem, _ in entries:
+            if fp is not None:
+                unique.setdefault(fp, pem)
+        if entries:
+            bundles.append((secret, entries))
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        parsed = dict(zip(unique, pool.map(_summarize_one, unique.values(),
+                                           chunksize=32)))
+
+    now = dt.datetime.now(tz=dt.timezone.utc)
+    rows = []
+    for secret, entries in bundles:
+        meta = secret.get("metadata") or {}
+        leaf = parsed.get(entries[0][0]) or {}
+        missing = san_mismatch(secret, leaf) if "sans" in leaf else []
+        for i, (fp, _, error) in enumerate(entries):
+            summary = parsed.get(fp) or {"error": error}
+            row = {
+                "namespace": meta.get("namespace"),
+                "secret": meta.get("name"),
+                "position": "leaf" if i == 0 else f"chain[{i}]",
+                "fingerprint": fp,
+                "days_left": None,
+                "missing_sans": missing if i == 0 else [],
+                "subject_cn": None,
+                "issuer_cn": None,
+                "not_before": None,
+                "not_after": None,
+                "sans": [],
+                "error": None,
+            }
+            row.update(summary)
+            if row["error"] is None:
+                row["days_left"] = (row["not_after"] - now).days
+            rows.append(row)
+    earliest = dt.datetime.min.replace(tzinfo=dt.timezone.utc)
+    rows.sort(key=lambda r: (r["not_after"] or earliest, r["namespace"] or "",
+                             r["secret"] or "", r["position"]))
+    return rows, len(unique)
+
+
+def print_bulk_report(rows, as_json=False):
+    if as_json:
+        print(json.dumps(rows, default=str, indent=2))
+        return
+    for r in rows:
+        if r["error"]:
+            print(f"{'PARSE ERROR':<10}  {'':>6}  "
+                  f"{r['namespace']}/{r['secret']} [{r['position']}]  "
+                  f"{r['error']}")
+            continue
+        flag = ""
+        if r["days_left"] < 0:
+            flag = "  EXPIRED"
+        if r["missing_sans"]:
+            flag += f"  SAN MISMATCH: {', '.join(r['missing_sans'])}"
+        print(f"{r['not_after']:%Y-%m-%d}  {r['days_left']:>5}d  "
+              f"{r['namespace']}/{r['secret']} [{r['position']}]  "
+              f"CN={r['subject_cn'] or '(none)'}{flag}")
+
+
 # --- Output ---------------------------------------------------------------
 
 def print_summary(summaries, source_label):
@@ -200,8 +371,42 @@ def main(argv=None):
         "-k", "--key", default="tls.crt",
         help="Secret data key holding the PEM bundle (default: tls.crt)",
     )
+    parser.add_argument(
+        "--bulk", action="store_true",
+        help="Treat input as a backup directory or a Secret List and print "
+             "one expiry report for every kubernetes.io/tls Secret",
+    )
+    parser.add_argument(
+        "--within", type=int, metavar="DAYS",
+        help="Bulk mode: only report certs expiring within DAYS",
+    )
+    parser.add_argument(
+        "--json", action="store_true",
+        help="Bulk mode: print the report as JSON",
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=None,
+        help="Bulk mode: worker processes (default: CPU count)",
+    )
     args = parser.parse_args(argv)
 
+    if args.bulk:
+        if args.file:
+            source = args.file
+        elif sys.stdin.isatty():
+            parser.error("No input on stdin and no file argument given")
+        else:
+            source = sys.stdin
+        rows, parsed = bulk_report(iter_secrets(source), args.key, args.jobs)
+        if args.within is not None:
+            rows = [r for r in rows if r["days_left"] is None
+                    or r["days_left"] <= args.within]
+        print_bulk_report(rows, args.json)
+        if not args.json:
+            print(f"\n{len(rows)} certs reported, {parsed} unique parsed",
+                  file=sys.stderr)
+        return
+
     if args.file:
         secret = load_secret(args.file)
         label = args.file
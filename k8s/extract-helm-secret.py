@@ -1,29 +1,73 @@
 #!/usr/bin/env python3
 """Extract the manifest from a Helm v3 release Secret (sh.helm.release.v1.*):
 double-base64-decode the data.release field, gunzip it, and print the
-resulting release object as YAML."""
-import base64
-import gzip
-import yaml
+resulting release object as YAML.
+
+Decoding is shared with helm/decode-configmap-data.py through
+helm/helm_release.py, so Helm v2 Tiller ConfigMaps work too. Use --field to
+print only parts of the release, or --history to decode every stored
+revision of a release in parallel.
+
+    extract-helm-secret.py sh.helm.release.v1.web.v12.yaml -f manifest
+    extract-helm-secret.py --history web -n apps -f chart -f values
+"""
+import os
+import sys
 import argparse
 
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                "..", "helm"))
+import helm_release  # noqa: E402
+
 
 def parse_args():
     parser = argparse.ArgumentParser()
-    parser.add_argument("secret", help="The helm secret file to extract values from")
-    return parser.parse_args()
+    parser.add_argument("secret", nargs="?",
+                        help="The helm secret file to extract values from")
+    parser.add_argument("-f", "--field", action="append",
+                        choices=sorted(helm_release.FIELDS),
+                        help="Only print this release field (repeatable)")
+    parser.add_argument("--history", metavar="RELEASE",
+                        help="Decode every stored revision of RELEASE")
+    parser.add_argument("-n", "--namespace",
+                        help="Namespace of the release for --history")
+    parser.add_argument("--driver", default="secret",
+                        choices=sorted(helm_release.DRIVERS),
+                        help="Helm storage driver for --history")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Worker processes for --history")
+    args = parser.parse_args()
+    if not (args.secret or args.history):
+        parser.error("a secret file or --history RELEASE is required")
+    return args
+
+
+def get_release_data(f, fields=None):
+    return helm_release.decode_release(helm_release.load_object(f), fields)
 
 
-def get_release_data(f):
-    data = yaml.safe_load(open(f))
-    zdata = base64.b64decode(base64.b64decode(data["data"]["release"]))
-    return yaml.safe_load(gzip.decompress(zdata).decode("utf-8"))
+def print_release(data, fields):
+    if fields and len(fields) == 1 and isinstance(data[fields[0]], str):
+        print(data[fields[0]])
+    else:
+        print(yaml.safe_dump(data))
 
 
 def main():
     args = parse_args()
-    data = get_release_data(f = args.secret)
-    print(yaml.safe_dump(data))
+    if args.history:
+        objects = helm_release.list_revisions(args.history, args.namespace,
+                                              args.driver)
+        history = helm_release.decode_history(objects, args.field, args.jobs)
+        for version, status, data in history:
+            print(f"# revision {version} ({status})")
+            print("---")
+            print_release(data, args.field)
+        return
+    data = get_release_data(f=args.secret, fields=args.field)
+    print_release(data, args.field)
 
 
 if __name__ == "__main__":
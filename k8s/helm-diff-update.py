@@ -1,14 +1,39 @@
 #!/usr/bin/env python3
 """Run `helm diff upgrade` for one or more releases, render the diff with
-color, and prompt before invoking `helm upgrade` to apply the change."""
+color, and prompt before invoking `helm upgrade` to apply the change.
+
+Pass a directory, a glob, or several release files to diff a whole fleet:
+the kube context is resolved once and `helm diff` runs concurrently, then a
+changed/unchanged summary is printed followed by each diff in input order.
+
+    helm-diff-update.py releases/ -j 8
+    helm-diff-update.py 'releases/*/helmrelease.yaml'
+
+Diff results are cached per context, release, namespace, chart, chart
+version and values hash together with the deployed release revision. When
+neither the inputs nor the revision have changed the cached result is
+reused and `helm diff` is skipped; pass --no-cache to force a render.
+"""
 import os
+import fcntl
+import glob
+import json
+import hashlib
 import tempfile
 import yaml
 import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from subprocess import Popen, PIPE
 
 release_data = None
 
+CACHE_FILE = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "helm-diff-update",
+    "cache.json",
+)
+
 
 class bcolors:
     HEADER = "\033[95m"
@@ -25,7 +50,12 @@ class bcolors:
 
 def parse_args():
     parser = argparse.ArgumentParser()
-    parser.add_argument("release", help="The helm release file to extract values from")
+    parser.add_argument(
+        "release",
+        nargs="+",
+        help="The helm release file to extract values from; a directory, "
+        "glob or several files runs in fleet mode",
+    )
     parser.add_argument(
         "--name",
         help="The release name to use this will default to what is in the release file",
@@ -40,6 +70,18 @@ def parse_args():
         help="The helm chart to use defaults to anthemai-helm/hos-generic",
     )
     parser.add_argument("--version", help="The helm chart version to use")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=8,
+        help="Concurrent helm diffs in fleet mode (default: 8)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always run helm diff instead of reusing cached results",
+    )
     return parser.parse_args()
 
 
@@ -57,7 +99,7 @@ def run(command):
         yield line.decode("utf-8")
 
 
-def print_context(ns=None):
+def get_context(ns=None):
     ctx = list(run("kubectl config current-context"))[0]
     if ns is None:
         ns = list(
@@ -66,7 +108,12 @@ def print_context(ns=None):
                     "_ctx", ctx
                 )
             )
-        )[0]
+        )
+        ns = ns[0] if ns else "default"
+    return ctx, ns
+
+
+def print_context(ctx, ns):
     print(
         f"{bcolors.BOLD}{bcolors.OKGREEN}Using the context {ctx}, namespace {ns}{bcolors.ENDC}"
     )
@@ -77,6 +124,10 @@ def get_release_data(file_name):
         return yaml.safe_load(fs)
 
 
+def is_helm_release(data):
+    return isinstance(data, dict) and data.get("kind") == "HelmRelease"
+
+
 def get_values(data):
     return yaml.dump(data["spec"]["values"])
 
@@ -93,39 +144,247 @@ def get_namespace(data):
     return data.get("metadata", {}).get("namespace")
 
 
-def main():
-    args = parse_args()
-    data = get_release_data(args.release)
-    # Get all the values
+def resolve_release(path, data, args):
+    """Return the (name, namespace, version) to diff ``path`` with."""
     name = get_release_name(data) if args.name is None else args.name
     if name is None:
-        name = args.release.replace(".yaml", "")
-    # Get namespace
-    ns_cmd = ""
+        name = os.path.basename(path).replace(".yaml", "")
     namespace = get_namespace(data) if args.namespace is None else args.namespace
-    if namespace is not None:
-        ns_cmd = f"-n {namespace}"
-    # Get Version
-    v_cmd = ""
     version = get_chart_version(data) if args.version is None else args.version
-    print(f"version {version}")
-    if version is not None:
-        v_cmd = f"--version {version}"
-    fd, values_file = tempfile.mkstemp()
-    # use a context manager to open the file at that path and close it again
-    with open(values_file, "w") as fs:
+    return name, namespace, version
+
+
+def write_values(data):
+    """Write the release values to a temp file and return its path."""
+    fd, values_file = tempfile.mkstemp(suffix=".yaml")
+    with os.fdopen(fd, "w") as fs:
         fs.write(get_values(data))
-    command = f"helm diff -C 3 upgrade {name} {args.chart} {v_cmd} {ns_cmd} --values {values_file}"
-    print(f"{bcolors.WARNING}Running: {command}{bcolors.ENDC}")
-    print_context(ns=namespace)
-    lines = list(run(command))
-    if not len(lines):
+    return values_file
+
+
+def diff_command(name, chart, version, namespace, values_file, ctx=None):
+    ns_cmd = f"-n {namespace}" if namespace is not None else ""
+    v_cmd = f"--version {version}" if version is not None else ""
+    ctx_cmd = f"--kube-context {ctx}" if ctx is not None else ""
+    return (
+        f"helm diff -C 3 upgrade {name} {chart} {v_cmd} {ns_cmd} {ctx_cmd}"
+        f" --values {values_file}"
+    )
+
+
+def expand_releases(paths):
+    """Expand directories and globs into a sorted list of release files."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = glob.glob(os.path.join(path, "*.yaml"))
+            found += glob.glob(os.path.join(path, "*.yml"))
+        elif glob.has_magic(path):
+            found = glob.glob(path)
+        else:
+            found = [path]
+        files.extend(sorted(found))
+    return files
+
+
+def load_cache(path=CACHE_FILE):
+    try:
+        with open(path) as fs:
+            return json.load(fs)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_cache(cache, loaded, path=CACHE_FILE):
+    """Merge the entries of ``cache`` that changed since ``loaded`` into
+    the cache file.
+
+    The file is re-read under a lock before the atomic replace, so entries
+    written meanwhile by another run are kept.
+    """
+    updates = {k: v for k, v in cache.items() if loaded.get(k) != v}
+    if not updates:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        merged = load_cache(path)
+        merged.update(updates)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as fs:
+            json.dump(merged, fs)
+        os.replace(tmp, path)
+
+
+def cache_key(ctx, name, namespace, chart, version, values):
+    values_hash = hashlib.sha256(values.encode("utf-8")).hexdigest()
+    return json.dumps([ctx, name, namespace, chart, version, values_hash])
+
+
+def get_revisions(ctx=None):
+    """Return {(namespace, name): revision} for every deployed release."""
+    ctx_cmd = f"--kube-context {ctx}" if ctx is not None else ""
+    result = subprocess.run(
+        f"helm list -A --max 0 -o json {ctx_cmd}",
+        shell=True,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        return {}
+    return {
+        (r.get("namespace"), r.get("name")): str(r.get("revision"))
+        for r in json.loads(result.stdout or "[]")
+    }
+
+
+def get_revision(name, namespace, ctx=None):
+    """Return the deployed revision of a single release or None."""
+    ns_cmd = f"-n {namespace}" if namespace is not None else ""
+    ctx_cmd = f"--kube-context {ctx}" if ctx is not None else ""
+    result = subprocess.run(
+        f"helm status {name} {ns_cmd} {ctx_cmd} -o json",
+        shell=True,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        return None
+    return str(json.loads(result.stdout).get("version"))
+
+
+def diff_release(path, args, ctx, revisions=None, cache=None, quiet=True,
+                 data=None, default_ns=None):
+    """Run helm diff for one release file and capture its output.
+
+    ``revisions`` maps (namespace, name) to the deployed release revision,
+    releases without a namespace are looked up in ``default_ns``. When
+    ``cache`` holds a result for the same inputs and that revision has not
+    moved, helm diff is skipped. Releases without a pinned chart version are
+    never cached, as the chart may have moved on. Returns
+    ``(path, name, namespace, output, error, cached)``.
+    """
+    if data is None:
+        data = get_release_data(path)
+    name, namespace, version = resolve_release(path, data, args)
+    resolved_ns = namespace if namespace is not None else default_ns
+    revision = (revisions or {}).get((resolved_ns, name))
+    key = cache_key(ctx, name, resolved_ns, args.chart, version,
+                    get_values(data))
+    if version is None:
+        cache = None
+    if cache is not None and revision is not None:
+        entry = cache.get(key)
+        if entry is not None and entry["revision"] == revision:
+            return path, name, resolved_ns, entry["output"], None, True
+    values_file = write_values(data)
+    try:
+        command = diff_command(name, args.chart, version, namespace,
+                               values_file, ctx)
+        if not quiet:
+            print(f"{bcolors.WARNING}Running: {command}{bcolors.ENDC}")
+        result = subprocess.run(command, shell=True, capture_output=True,
+                                text=True)
+    finally:
+        os.remove(values_file)
+    output = result.stdout.rstrip()
+    if result.returncode != 0:
+        return path, name, resolved_ns, output, result.stderr.strip(), False
+    if cache is not None and revision is not None:
+        cache[key] = {"revision": revision, "output": output}
+    return path, name, resolved_ns, output, None, False
+
+
+def fleet_diff(path, args, ctx, revisions, cache, default_ns):
+    """Diff one file of a fleet run.
+
+    Returns None for documents that are not a HelmRelease and reports any
+    error as a failed result so one bad file does not abort the run.
+    """
+    try:
+        data = get_release_data(path)
+        if not is_helm_release(data):
+            return None
+        return diff_release(path, args, ctx, revisions, cache, data=data,
+                            default_ns=default_ns)
+    except Exception as e:
+        name = os.path.splitext(os.path.basename(path))[0]
+        return path, name, "?", "", f"{type(e).__name__}: {e}", False
+
+
+def run_fleet(files, args):
+    ctx, ns = get_context(ns=args.namespace)
+    print_context(ctx, ns)
+    cache = None if args.no_cache else load_cache()
+    loaded = dict(cache or {})
+    revisions = {} if args.no_cache else get_revisions(ctx)
+    print(f"{bcolors.WARNING}Diffing {len(files)} releases "
+          f"with {args.jobs} workers{bcolors.ENDC}")
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        results = list(pool.map(
+            lambda f: fleet_diff(f, args, ctx, revisions, cache, ns), files))
+    if cache is not None:
+        save_cache(cache, loaded)
+    skipped = [f for f, r in zip(files, results) if r is None]
+    results = [r for r in results if r is not None]
+    if skipped:
+        print(f"{bcolors.WARNING}Skipped {len(skipped)} files that are not "
+              f"a HelmRelease{bcolors.ENDC}")
+
+    print(f"{bcolors.BOLD}Summary{bcolors.ENDC}")
+    for path, name, namespace, output, error, cached in results:
+        if error:
+            state = f"{bcolors.FAIL}failed{bcolors.ENDC}"
+        elif output:
+            state = f"{bcolors.YELLOW}changed{bcolors.ENDC}"
+        else:
+            state = f"{bcolors.OKGREEN}unchanged{bcolors.ENDC}"
+        note = " [cached]" if cached else ""
+        print(f"  {namespace}/{name}: {state}{note} ({path})")
+
+    for path, name, namespace, output, error, _ in results:
+        if not (output or error):
+            continue
+        print(f"\n{bcolors.HEADER}==> {namespace}/{name} ({path}){bcolors.ENDC}")
+        if output:
+            print(output)
+        if error:
+            print(f"{bcolors.FAIL}{error}{bcolors.ENDC}")
+    print_context(ctx, ns)
+
+
+def main():
+    args = parse_args()
+    files = expand_releases(args.release)
+    if len(files) != 1 or files[0] != args.release[0]:
+        if args.name is not None:
+            raise SystemExit("--name cannot be used with several releases")
+        run_fleet(files, args)
+        return
+    release = files[0]
+    data = get_release_data(release)
+    name, namespace, version = resolve_release(release, data, args)
+    print(f"version {version}")
+    ctx, ns = get_context(ns=namespace)
+    print_context(ctx, ns)
+    cache = None if args.no_cache else load_cache()
+    loaded = dict(cache or {})
+    revision = None if args.no_cache else get_revision(name, namespace, ctx)
+    _, _, _, output, error, cached = diff_release(
+        release, args, ctx, {(ns, name): revision}, cache, quiet=False,
+        data=data, default_ns=ns)
+    if cached:
+        print(f"{bcolors.WARNING}Revision {revision} and inputs unchanged, "
+              f"using cached diff{bcolors.ENDC}")
+    elif cache is not None:
+        save_cache(cache, loaded)
+    if error:
+        print(f"{bcolors.FAIL}{error}{bcolors.ENDC}")
+    elif not output:
         print("NO CHANGES")
-    for line in lines:
-        print(line)
-    print_context(ns=namespace)
-    # close the file descriptor
-    os.close(fd)
+    else:
+        print(output)
+    print_context(ctx, ns)
 
 
 if __name__ == "__main__":
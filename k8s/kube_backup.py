@@ -1,13 +1,38 @@
 #!/usr/bin/env python3
 """Dump Kubernetes resources to YAML files on disk, one file per object,
 filtered by namespace and kind. Useful for ad-hoc backups before migrations
-or restores."""
+or restores.
+
+With --normalize the tree is also tidied while it is written, replacing the
+separate correlate_backup_objects.sh pass: kind directories are lowercased
+without API group suffixes, noisy kinds (pods, events, endpoints,
+replicasets, ...) are pruned, Helm-managed objects are skipped, and
+workload-related objects are grouped per application as
+<namespace>/<name>/<kind>.yaml."""
 import os
 import yaml
 import argparse
 from subprocess import Popen, PIPE, STDOUT
 
 
+# Kinds dropped by --normalize; they are recreated by their controllers.
+PRUNED_KINDS = {"pod", "endpoints", "event", "replicaset", "redisfailover"}
+
+# Kinds grouped per application as <namespace>/<name>/<kind>.yaml.
+CORRELATED_KINDS = {
+    "configmap",
+    "daemonset",
+    "deployment",
+    "statefulset",
+    "service",
+    "job",
+    "cronjob",
+    "serviceaccount",
+}
+
+HELM_MANAGED_LABEL = "app.kubernetes.io/managed-by"
+
+
 class bcolors:
     HEADER = "\033[95m"
     OKBLUE = "\033[94m"
@@ -35,6 +60,12 @@ def parse_args():
     # parser.add_argument("--debug", action="store_true", help="Enable debug logs")
     parser.add_argument("-z", "--archive", action="store_true", help="if present, archives and removes the output directory")
     parser.add_argument("-s", "--summary", action="store_true", help="Store a summary file as resources.yaml")
+    parser.add_argument("-N", "--normalize", action="store_true",
+                        help="Canonicalize kind directories, prune noisy kinds and skip Helm-managed objects")
+    parser.add_argument("--prune-kinds",
+                        help="comma seperated kinds to prune with --normalize; defaults to " + ",".join(sorted(PRUNED_KINDS)))
+    parser.add_argument("--keep-helm", action="store_true",
+                        help="with --normalize, keep objects managed by Helm")
     return parser.parse_args()
 
 
@@ -93,23 +124,57 @@ def get_custom_resource_definitions(all=False, namespace=None):
     return shell_out(command)
 
 
-def split_resources(data, quiet=False):
+def canonical_kind(o):
+    """Lowercase kind without an API group, e.g. "deployment"."""
+    return o["kind"].split(".", 1)[0].lower()
+
+
+def is_helm_managed(o):
+    labels = o["metadata"].get("labels") or {}
+    return labels.get(HELM_MANAGED_LABEL) == "Helm"
+
+
+def normalized_path(o, prune_kinds=PRUNED_KINDS, keep_helm=False):
+    """Return the normalized path for ``o`` or the reason it is skipped."""
+    kind = canonical_kind(o)
+    if kind in prune_kinds:
+        return None, "pruned"
+    if not keep_helm and is_helm_managed(o):
+        return None, "helm"
+    n = o["metadata"]["name"]
+    ns = o["metadata"].get("namespace", "cluster")
+    if kind in CORRELATED_KINDS:
+        return f'{ns}/{n}/{kind}.yaml', None
+    return f'{ns}/{kind}/{n}.yaml', None
+
+
+def split_resources(data, quiet=False, normalize=False,
+                    prune_kinds=PRUNED_KINDS, keep_helm=False):
     print(f"{bcolors.OKGREEN}Splitting output and creating files{bcolors.ENDC}")
+    skipped = {"pruned": 0, "helm": 0}
     for o in data["items"]:
         k = o.get("kind")
         if k is None:
             print(f"{bcolors.WARNING}Kind not found{bcolors.ENDC}")
             print(yaml.safe_dump(o))
             continue
-        n = o["metadata"]["name"]
-        ns = o["metadata"].get("namespace", "cluster")
-        d = f'{ns}/{k}'
-        os.makedirs(d, exist_ok=True)
-        fn = f'{d}/{n}.yaml'
+        if normalize:
+            fn, reason = normalized_path(o, prune_kinds, keep_helm)
+            if fn is None:
+                skipped[reason] += 1
+                continue
+        else:
+            n = o["metadata"]["name"]
+            ns = o["metadata"].get("namespace", "cluster")
+            fn = f'{ns}/{k}/{n}.yaml'
+        os.makedirs(os.path.dirname(fn), exist_ok=True)
         if not quiet:
             print(f'{bcolors.BOLD}{bcolors.YELLOW}\t{fn}{bcolors.ENDC}')
         with open(fn, 'w') as f:
             yaml.safe_dump(o, f)
+    if normalize:
+        print(f"{bcolors.OKCYAN}Skipped {skipped['pruned']} pruned and "
+              f"{skipped['helm']} Helm-managed objects{bcolors.ENDC}")
 
 
 def main():
@@ -153,8 +218,13 @@ def main():
             fs.write(text)
         with open("errors.txt", "wb") as fs:
             fs.write(err)
+    prune_kinds = PRUNED_KINDS
+    if args.prune_kinds is not None:
+        prune_kinds = {k.strip().lower() for k in args.prune_kinds.split(",") if k.strip()}
+    split_opts = dict(quiet=args.quiet, normalize=args.normalize,
+                      prune_kinds=prune_kinds, keep_helm=args.keep_helm)
     resources = yaml.safe_load(text)
-    split_resources(resources, args.quiet)
+    split_resources(resources, **split_opts)
     text, err, ret = get_custom_resource_definitions(all=args.all, namespace=args.namespace)
     print(f'{bcolors.BOLD}{bcolors.YELLOW}{err}{bcolors.ENDC}')
     if args.summary:
@@ -163,7 +233,7 @@ def main():
         with open("custom-resources-errors.txt", "wb") as fs:
             fs.write(err)
     resources = yaml.safe_load(text)
-    split_resources(resources, args.quiet)
+    split_resources(resources, **split_opts)
     if args.archive:
         zip_dir = os.getcwd()
         os.chdir('..')
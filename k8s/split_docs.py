@@ -1,58 +1,199 @@
 #!/usr/bin/env python3
 """Walk a directory of multi-document YAML files and re-emit each document as
 its own file named by kind/name, so a bulk dump can be diffed and edited
-piece by piece."""
+piece by piece.
+
+Input files are parsed and dumped in a process pool. Each worker hashes
+its documents against the existing outputs and streams only the changed
+ones to a spool file, so re-splitting after a small edit only touches the
+affected files. The parent keeps just an index of where each output's text
+sits and merges it in input order: when several documents map to the same
+``<name>.<kind>.yaml`` the last one wins (with a warning) just as in a
+sequential run.
+
+Examples
+--------
+    split_docs.py rendered/ split/
+    split_docs.py -j 8 rendered/ split/
+"""
+import argparse
+import hashlib
 import os
-import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
 import yaml
 
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
 
-def load_docs(path):
+
+def list_inputs(path):
     path = os.path.expanduser(path)
-    fl = [f for f in os.listdir(path) if f.endswith('.yaml')]
+    return sorted(os.path.join(path, f) for f in os.listdir(path)
+                  if f.endswith('.yaml'))
+
+
+def load_docs(path):
     all_docs = []
-    for f in fl:
-        with open(os.path.expanduser(os.path.join(path, f)), "r") as fd:
-            docs = list(yaml.load_all(fd))
+    for fp in list_inputs(path):
+        with open(fp, "r") as fd:
+            docs = list(yaml.load_all(fd, Loader=SafeLoader))
             n = len(docs)
             all_docs.extend(docs)
-            print(f"Found {n} documents in {f}")
+            print(f"Found {n} documents in {os.path.basename(fp)}")
     return all_docs
 
 
 def get_name(doc):
-    return doc.get('metadata').get('name')
+    return (doc.get('metadata') or {}).get('name')
 
 
 def get_kind(doc):
     return doc.get('kind')
 
 
+def output_path(doc, path):
+    """Return the ``<name>.<kind>.yaml`` path for ``doc`` or None to skip."""
+    if not isinstance(doc, dict):
+        return None
+    name = get_name(doc)
+    kind = get_kind(doc)
+    if not (name and kind):
+        return None
+    return os.path.join(path, f"{name.lower()}.{kind.lower()}.yaml")
+
+
+def dump_doc(doc):
+    return yaml.dump(doc, Dumper=SafeDumper, indent=2,
+                     default_flow_style=False, canonical=False)
+
+
+def file_digest(fp):
+    """Return the sha256 of ``fp`` or None when it does not exist."""
+    h = hashlib.sha256()
+    try:
+        with open(fp, 'rb') as fs:
+            for chunk in iter(lambda: fs.read(1 << 16), b''):
+                h.update(chunk)
+    except FileNotFoundError:
+        return None
+    return h.hexdigest()
+
+
+def write_if_changed(fp, text):
+    """Write ``text`` to ``fp`` unless the file already holds it.
+
+    Returns True when the file was written.
+    """
+    data = text.encode('utf-8')
+    if file_digest(fp) == hashlib.sha256(data).hexdigest():
+        return False
+    with open(fp, 'wb') as fs:
+        fs.write(data)
+    return True
+
+
 def write_docs(docs, path):
     path = os.path.expanduser(path)
-    if not os.path.exists(path):
-        os.makedirs(path)
+    os.makedirs(path, exist_ok=True)
     for d in docs:
-        if d is None:
-            continue
-        name = get_name(d).lower()
-        kind = get_kind(d).lower()
-        if not (name or kind):
+        fp = output_path(d, path)
+        if fp is None:
             continue
-        fp = os.path.join(path, f"{name}.{kind}.yaml")
-        with open(fp, 'w') as fs:
-            yaml.safe_dump(d, fs, indent=2, default_flow_style=False, canonical=False)
-        print(f"Wrote: {fp}")
-
-
-def main():
-    if len(sys.argv) != 3:
-        print(f"Usage: {__file__} <input path> <output path>")
-        exit()
-    input = sys.argv[1]
-    output = sys.argv[2]
-    docs = load_docs(input)
-    write_docs(docs, output)
+        if write_if_changed(fp, dump_doc(d)):
+            print(f"Wrote: {fp}")
+
+
+def split_file(src, path, spool):
+    """Render the documents of ``src`` for ``path``.
+
+    Runs inside a worker process. Documents whose output file already holds
+    them are only hashed; the others are appended to the ``spool`` file.
+    Returns ``(src, found, entries)`` where ``entries`` lists ``(output
+    file, offset, size)`` in document order, with offset None when the
+    output is unchanged.
+    """
+    found = 0
+    entries = []
+    with open(src, "r") as fd, open(spool, "wb") as out:
+        for d in yaml.load_all(fd, Loader=SafeLoader):
+            found += 1
+            fp = output_path(d, path)
+            if fp is None:
+                continue
+            data = dump_doc(d).encode('utf-8')
+            if file_digest(fp) == hashlib.sha256(data).hexdigest():
+                entries.append((fp, None, len(data)))
+            else:
+                entries.append((fp, out.tell(), len(data)))
+                out.write(data)
+    return src, found, entries
+
+
+def split_dir(input, output, jobs=None):
+    """Split every ``.yaml`` file in ``input`` into ``output`` in parallel.
+
+    Returns ``(documents found, files written)``.
+    """
+    output = os.path.expanduser(output)
+    os.makedirs(output, exist_ok=True)
+    total = changed = 0
+    inputs = list_inputs(input)
+    spools = []
+    for _ in inputs:
+        fd, spool = tempfile.mkstemp(prefix=".split-", suffix=".spool",
+                                     dir=output)
+        os.close(fd)
+        spools.append(spool)
+    # output file -> (source, spool, offset, size) of its last document
+    index = {}
+    try:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            for spool, (src, found, entries) in zip(spools, pool.map(
+                    split_file, inputs, [output] * len(inputs), spools)):
+                total += found
+                print(f"Found {found} documents in {os.path.basename(src)}")
+                for fp, offset, size in entries:
+                    if fp in index:
+                        print(f"Duplicate: {fp} from "
+                              f"{os.path.basename(index[fp][0])} replaced by "
+                              f"{os.path.basename(src)}")
+                    index[fp] = (src, spool, offset, size)
+        for fp, (_, spool, offset, size) in index.items():
+            if offset is None:
+                continue
+            with open(spool, 'rb') as fs:
+                fs.seek(offset)
+                data = fs.read(size)
+            with open(fp, 'wb') as fs:
+                fs.write(data)
+            changed += 1
+            print(f"Wrote: {fp}")
+    finally:
+        for spool in spools:
+            os.remove(spool)
+    return total, changed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Split multi-document YAML files into one file per "
+                    "document named <name>.<kind>.yaml",
+    )
+    parser.add_argument("input", help="directory of .yaml files to split")
+    parser.add_argument("output", help="directory to write documents to")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="worker processes (default: CPU count)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    total, changed = split_dir(args.input, args.output, args.jobs)
+    print(f"{total} documents, {changed} files written")
 
 
 if __name__ == "__main__":
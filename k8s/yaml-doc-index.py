@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""Index the objects in a huge multi-document YAML dump by byte offset and
+pull single objects back out without parsing the whole file.
+
+The indexer scans line by line for ``---`` separators and ``kind`` /
+``metadata.name`` / ``metadata.namespace`` headers; it never runs the YAML
+parser. Both multi-document files (``split_docs.py`` input) and
+``kind: List`` dumps from ``kubectl get -o yaml`` (``resources.yaml``,
+``custom-resources.yaml``) are understood. The index is stored next to the
+dump as ``<file>.idx`` and rebuilt automatically when the dump changes.
+
+A query memory-maps the dump and parses only the requested document.
+
+Examples
+--------
+    yaml-doc-index.py build resources.yaml
+    yaml-doc-index.py list resources.yaml --kind Deployment
+    yaml-doc-index.py get resources.yaml -k Deployment -n web frontend
+"""
+import argparse
+import json
+import mmap
+import os
+import sys
+
+import yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 1
+
+
+def _scalar(value):
+    """Return a plain header value with comments and quotes removed."""
+    value = value.split(b" #", 1)[0].strip()
+    if len(value) >= 2 and value[:1] == value[-1:] and value[:1] in b"'\"":
+        value = value[1:-1]
+    return value.decode("utf-8", errors="replace") or None
+
+
+class _Record:
+    """Header state for one document or one ``items`` entry."""
+
+    def __init__(self, start, base=0, dedent=0):
+        self.start = start
+        self.base = base
+        self.dedent = dedent
+        self.kind = self.name = self.namespace = None
+        self.has_items = False
+        self._in_meta = False
+        self._meta_indent = None
+
+    def feed(self, indent, stripped):
+        if indent == self.base:
+            self._in_meta = False
+            key, _, value = stripped.partition(b":")
+            if key == b"kind" and self.kind is None:
+                self.kind = _scalar(value)
+            elif key == b"metadata" and not value.strip():
+                self._in_meta = True
+                self._meta_indent = None
+        elif self._in_meta and indent > self.base:
+            if self._meta_indent is None:
+                self._meta_indent = indent
+            if indent == self._meta_indent:
+                key, _, value = stripped.partition(b":")
+                if key == b"name" and self.name is None:
+                    self.name = _scalar(value)
+                elif key == b"namespace" and self.namespace is None:
+                    self.namespace = _scalar(value)
+
+    def entry(self, end):
+        if self.has_items or not (self.kind or self.name):
+            return None
+        return [self.start, end, self.kind, self.namespace, self.name,
+                self.dedent]
+
+
+def _is_separator(line):
+    return line.startswith(b"---") and (len(line) == 3
+                                        or line[3:4].isspace())
+
+
+def scan(fh):
+    """Return index entries for the binary file handle ``fh``.
+
+    Each entry is ``[start, end, kind, namespace, name, dedent]`` where
+    ``dedent`` is the column a ``kind: List`` item starts at.
+    """
+    entries = []
+    offset = 0
+    doc = _Record(0)
+    item = None
+    items_indent = None
+
+    def close(record, end):
+        if record is not None:
+            entry = record.entry(end)
+            if entry is not None:
+                entries.append(entry)
+
+    for line in fh:
+        start = offset
+        offset += len(line)
+        if _is_separator(line):
+            close(item, start)
+            close(doc, start)
+            doc, item, items_indent = _Record(offset), None, None
+            continue
+        stripped = line.strip()
+        if not stripped or stripped.startswith(b"#"):
+            continue
+        indent = len(line) - len(line.lstrip(b" "))
+        if items_indent == -1:
+            items_indent = indent if stripped.startswith(b"-") else None
+        if items_indent is not None:
+            if indent == items_indent and stripped.startswith(b"-"):
+                close(item, start)
+                item = _Record(start, base=indent + 2, dedent=indent)
+                item.feed(indent + 2, stripped[1:].strip())
+                continue
+            if indent > items_indent:
+                item.feed(indent, stripped)
+                continue
+            close(item, start)
+            item, items_indent = None, None
+        if indent == 0 and stripped.split(b"#", 1)[0].strip() == b"items:":
+            doc.has_items = True
+            items_indent = -1
+            continue
+        doc.feed(indent, stripped)
+    close(item, offset)
+    close(doc, offset)
+    return entries
+
+
+def index_path(path):
+    return path + INDEX_SUFFIX
+
+
+def build_index(path):
+    """Scan ``path`` and write its sidecar index. Returns the index dict."""
+    st = os.stat(path)
+    with open(path, "rb") as fh:
+        entries = scan(fh)
+    index = {
+        "version": INDEX_VERSION,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "entries": entries,
+    }
+    with open(index_path(path), "w") as fs:
+        json.dump(index, fs, separators=(",", ":"))
+    return index
+
+
+def load_index(path):
+    """Return the sidecar index for ``path``, rebuilding it when stale."""
+    st = os.stat(path)
+    try:
+        with open(index_path(path)) as fs:
+            index = json.load(fs)
+    except (FileNotFoundError, ValueError):
+        return build_index(path)
+    if (index.get("version") != INDEX_VERSION
+            or index.get("size") != st.st_size
+            or index.get("mtime_ns") != st.st_mtime_ns):
+        return build_index(path)
+    return index
+
+
+def find(entries, kind=None, name=None, namespace=None):
+    """Yield entries matching ``kind`` (case-insensitive), name, namespace."""
+    kind = kind.lower() if kind else None
+    for entry in entries:
+        _, _, e_kind, e_ns, e_name, _ = entry
+        if kind and (e_kind or "").lower() != kind:
+            continue
+        if name and e_name != name:
+            continue
+        if namespace and e_ns != namespace:
+            continue
+        yield entry
+
+
+def read_raw(path, entry):
+    """Return the bytes of one indexed document via mmap."""
+    start, end = entry[0], entry[1]
+    with open(path, "rb") as fh:
+        if start == end:
+            return b""
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return mm[start:end]
+
+
+def load_entry(path, entry):
+    """Parse and return the single object described by ``entry``."""
+    raw = read_raw(path, entry)
+    dedent = entry[5]
+    if dedent:
+        raw = b"".join(line[dedent:] for line in raw.splitlines(True))
+    data = yaml.load(raw, Loader=SafeLoader)
+    if raw.lstrip().startswith(b"-") and isinstance(data, list):
+        data = data[0]
+    return data
+
+
+def cmd_build(args):
+    for path in args.files:
+        index = build_index(path)
+        print(f"{path}: {len(index['entries'])} objects indexed")
+
+
+def cmd_list(args):
+    index = load_index(args.file)
+    for entry in find(index["entries"], args.kind, args.name,
+                      args.namespace):
+        start, end, kind, ns, name, _ = entry
+        print(f"{ns or 'cluster'}\t{kind}\t{name}\t{start}-{end}")
+
+
+def cmd_get(args):
+    index = load_index(args.file)
+    matches = list(find(index["entries"], args.kind, args.name,
+                        args.namespace))
+    if not matches:
+        raise SystemExit(f"No {args.kind or 'object'} named {args.name!r} "
+                         f"in {args.file}")
+    for entry in matches:
+        if args.raw:
+            sys.stdout.write(read_raw(args.file, entry).decode("utf-8"))
+            continue
+        if len(matches) > 1:
+            print("---")
+        print(yaml.dump(load_entry(args.file, entry), Dumper=SafeDumper,
+                        default_flow_style=False), end="")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Byte-offset index for multi-document YAML dumps",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("build", help="(re)build the sidecar index")
+    p.add_argument("files", nargs="+", help="YAML dumps to index")
+    p.set_defaults(func=cmd_build)
+
+    for name, func, help in (
+        ("list", cmd_list, "list indexed objects"),
+        ("get", cmd_get, "print matching objects"),
+    ):
+        p = sub.add_parser(name, help=help)
+        p.add_argument("file", help="YAML dump to query")
+        p.add_argument("-k", "--kind", help="object kind, e.g. Deployment")
+        p.add_argument("-n", "--namespace", help="object namespace")
+        p.set_defaults(func=func)
+        if name == "get":
+            p.add_argument("name", help="metadata.name of the object")
+            p.add_argument("--raw", action="store_true",
+                           help="print the document text without parsing")
+        else:
+            p.add_argument("--name", help="metadata.name of the object")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,7 @@ import requests
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from atlassian_auth import get_auth as _get_auth, get_jira_server_id, add_auth_arguments
+from confluence_cache import PageCache
 
 
 def find_cab_page(base_url, space_key, cab_date, auth):
@@ -74,16 +75,14 @@ def get_my_account_id(base_url, auth):
     return resp.json()["accountId"]
 
 
-def fetch_page(base_url, page_id, auth):
-    """Fetch a Confluence page with storage format body."""
-    resp = requests.get(
-        f"{base_url}/wiki/api/v2/pages/{page_id}",
-        params={"body-format": "storage"},
-        auth=auth,
-        timeout=15,
-    )
-    resp.raise_for_status()
-    return resp.json()
+def fetch_page(base_url, page_id, auth, cache=None):
+    """Fetch a Confluence page with storage format body.
+
+    The body comes from the local page cache when its version is still
+    current, so the version we edit against is always the latest.
+    """
+    cache = cache or PageCache(base_url)
+    return cache.get_page(requests, page_id, "storage", auth=auth)
 
 
 def update_page(base_url, page_id, title, body, version, message, auth):
@@ -207,6 +206,8 @@ def main():
                         help="Text for the Approved cell (default: 'yes pending plan + approval')")
     parser.add_argument("--dry-run", action="store_true",
                         help="Preview changes without modifying the page")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always download the page body")
     add_auth_arguments(parser)
     args = parser.parse_args()
 
@@ -219,6 +220,7 @@ def main():
         force_password=args.force_password,
     )
     auth = (username, password)
+    cache = PageCache(base_url, enabled=not args.no_cache)
 
     # Resolve page ID
     if args.page_id:
@@ -232,7 +234,7 @@ def main():
     account_id = get_my_account_id(base_url, auth)
 
     # Fetch current page
-    page = fetch_page(base_url, page_id, auth)
+    page = fetch_page(base_url, page_id, auth, cache)
     title = page["title"]
     version = page["version"]["number"]
     body = page["body"]["storage"]["value"]
@@ -12,6 +12,7 @@ import requests
 
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from atlassian_auth import get_auth as _get_auth, add_auth_arguments
+from confluence_cache import PageCache
 
 
 def find_cab_page(base_url, space_key, cab_date, auth):
@@ -48,16 +49,14 @@ def find_cab_page(base_url, space_key, cab_date, auth):
     return pages[0]["id"], pages[0]["title"]
 
 
-def fetch_page_body(base_url, page_id, auth):
-    """Fetch a Confluence page with storage format body."""
-    resp = requests.get(
-        f"{base_url}/wiki/api/v2/pages/{page_id}",
-        params={"body-format": "storage"},
-        auth=auth,
-        timeout=15,
-    )
-    resp.raise_for_status()
-    return resp.json()
+def fetch_page_body(base_url, page_id, auth, cache=None):
+    """Fetch a Confluence page with storage format body.
+
+    The body is served from the local page cache unless the page's version
+    changed since it was cached.
+    """
+    cache = cache or PageCache(base_url)
+    return cache.get_page(requests, page_id, "storage", auth=auth)
 
 
 def extract_text(html_fragment):
@@ -173,6 +172,8 @@ def main():
                         help="Output format (default: table)")
     parser.add_argument("--page-id",
                         help="Direct page ID (skips search)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always download the page body")
     add_auth_arguments(parser)
     args = parser.parse_args()
 
@@ -181,14 +182,15 @@ def main():
         force_password=args.force_password,
     )
     auth = (username, password)
+    cache = PageCache(base_url, enabled=not args.no_cache)
 
     if args.page_id:
         page_id = args.page_id
-        page = fetch_page_body(base_url, page_id, auth)
+        page = fetch_page_body(base_url, page_id, auth, cache)
         title = page["title"]
     else:
         page_id, title = find_cab_page(base_url, args.space_key, args.date, auth)
-        page = fetch_page_body(base_url, page_id, auth)
+        page = fetch_page_body(base_url, page_id, auth, cache)
 
     body = page["body"]["storage"]["value"]
     headers, rows = parse_table(body)
@@ -0,0 +1,148 @@
+"""
+Versioned local cache of Confluence page bodies.
+
+Pages are cached per site, page ID and body format together with their
+version number. A lookup first asks Confluence for the page without a body
+(a small metadata response carrying the current version) and only downloads
+the body again when the version moved on, so a large page that is read many
+times a day costs one cheap request per read.
+
+Only the storage and atlas_doc_format bodies are cached. The rendered
+view HTML can change without a version bump (Jira macros, includes, page
+trees), so view bodies are always downloaded.
+
+The cache lives in ~/.cache/confluence-pages/ (or $CONFLUENCE_CACHE_DIR) and
+is trimmed to $CONFLUENCE_CACHE_MAX_MB (default 200) by evicting the least
+recently used entries.
+
+Used by cab-read.py, cab-add.py and skills/confluence-read/cf_get.py:
+
+    import requests
+    from confluence_cache import PageCache
+
+    cache = PageCache(base_url)
+    page = cache.get_page(requests, page_id, "storage", auth=(user, token))
+    body = page["body"]["storage"]["value"]
+"""
+
+import json
+import os
+import threading
+from urllib.parse import urlparse
+
+DEFAULT_DIR = os.environ.get("CONFLUENCE_CACHE_DIR") or os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "confluence-pages")
+DEFAULT_MAX_BYTES = int(float(os.environ.get("CONFLUENCE_CACHE_MAX_MB", 200)) * 1024 * 1024)
+# formats whose content is fixed by the page version
+CACHEABLE_FORMATS = {"storage", "atlas_doc_format"}
+
+
+class PageCache:
+    """Cache of v2 page responses, keyed by page ID and body format.
+
+    ``session`` arguments may be a requests.Session or the requests module
+    itself; ``auth`` is passed through when given.
+    """
+
+    def __init__(self, base_url, directory=DEFAULT_DIR, max_bytes=DEFAULT_MAX_BYTES,
+                 enabled=True):
+        self.base_url = base_url.rstrip("/")
+        self.root = directory
+        site = (urlparse(base_url).netloc or "default").replace(":", "_")
+        self.directory = os.path.join(directory, site)
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        # running estimate of the cache size, so stores do not rescan it
+        self.size = None
+
+    def path(self, page_id, body_format):
+        return os.path.join(self.directory, f"{page_id}.{body_format}.json")
+
+    def load(self, page_id, body_format):
+        """Return the cached page, whatever its version, or None."""
+        if not self.enabled or body_format not in CACHEABLE_FORMATS:
+            return None
+        path = self.path(page_id, body_format)
+        try:
+            with open(path) as fs:
+                page = json.load(fs)
+            # mtime doubles as last use for eviction
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return page
+
+    def store(self, page, body_format):
+        """Cache ``page`` (a v2 page response including its body)."""
+        if (not self.enabled or body_format not in CACHEABLE_FORMATS
+                or body_format not in page.get("body", {})):
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(page["id"], body_format)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as fs:
+            json.dump(page, fs)
+            written = fs.tell()
+        os.replace(tmp, path)
+        with self.lock:
+            if self.size is None:
+                self.size = self.evict()
+            else:
+                self.size += written
+                if self.size > self.max_bytes:
+                    self.size = self.evict()
+
+    def fetch(self, session, page_id, body_format=None, auth=None, timeout=15):
+        params = {"body-format": body_format} if body_format else {}
+        resp = session.get(f"{self.base_url}/wiki/api/v2/pages/{page_id}",
+                           params=params, auth=auth, timeout=timeout)
+        resp.raise_for_status()
+        return resp.json()
+
+    def get_page(self, session, page_id, body_format, auth=None, timeout=15):
+        """Return the current page with its body in ``body_format``.
+
+        The body comes from the cache when the cached version is still the
+        current one; otherwise it is downloaded and cached (unless the
+        format is not cacheable).
+        """
+        cached = self.load(page_id, body_format)
+        if cached is not None:
+            meta = self.fetch(session, page_id, auth=auth, timeout=timeout)
+            if meta.get("version", {}).get("number") == cached.get("version", {}).get("number"):
+                # keep the fresh metadata (title, status, ...) with the cached body
+                meta["body"] = cached["body"]
+                return meta
+        page = self.fetch(session, page_id, body_format, auth=auth, timeout=timeout)
+        self.store(page, body_format)
+        return page
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits max_bytes.
+
+        Returns the resulting size of the cache.
+        """
+        entries = []
+        total = 0
+        for site in os.scandir(self.root):
+            if not site.is_dir():
+                continue
+            for entry in os.scandir(site.path):
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue  # evicted by another process meanwhile
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        return total
@@ -1,9 +1,40 @@
+#!/usr/bin/env python3
+"""List every tag of a Docker image and resolve each tag to its digest.
+
+Tags are paged iteratively from Docker Hub (or the registry's own v2
+tags/list endpoint) and digests are resolved concurrently with HEAD
+requests against the registry v2 manifests API over one pooled session.
+Resolved digests are cached on disk per registry, repo and tag with a
+TTL, so re-runs only resolve new tags.
+
+    get_all_docker_images.py nginx
+    get_all_docker_images.py myorg/app -j 32 --ttl 3600
+    get_all_docker_images.py team/app --registry http://localhost:5000
+"""
 import json
 import os
+import re
 import sys
+import time
 import requests
-import docker
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+DOCKER_HUB_REGISTRY = "https://registry-1.docker.io"
+DOCKER_HUB_API = "https://hub.docker.com"
+CACHE_FILE = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+    "get_all_docker_images",
+    "digests.json",
+)
+TIMEOUT = 30
+MANIFEST_TYPES = ", ".join([
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+    "application/vnd.oci.image.manifest.v1+json",
+    "application/vnd.docker.distribution.manifest.v2+json",
+])
 
 
 def parse_args():
@@ -11,10 +42,26 @@ def parse_args():
     parser.add_argument('reg_name', action='store', help='The registry to query')
     parser.add_argument('--no-paginate', action='store_false', dest="paginate",
                         default=True, help='Turn of pagination of image tags')
+    parser.add_argument('--registry', default=DOCKER_HUB_REGISTRY,
+                        help='Registry v2 base URL (default: Docker Hub)')
+    parser.add_argument('-j', '--jobs', type=int, default=16,
+                        help='Concurrent digest lookups (default: 16)')
+    parser.add_argument('--ttl', type=int, default=86400,
+                        help='Seconds a cached digest stays valid (default: 86400)')
+    parser.add_argument('--cache-file', default=CACHE_FILE,
+                        help='Digest cache location')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Ignore and do not update the digest cache')
+    parser.add_argument('--use-daemon', action='store_true',
+                        help='Resolve digests through the local docker daemon')
+    parser.add_argument('--timeout', type=float, default=TIMEOUT,
+                        help='Seconds to wait for each registry response '
+                             '(default: %(default)s)')
     return parser.parse_args()
-    
+
 
 def get_client():
+    import docker
     global client
     if 'client' in globals() and isinstance(client, docker.client.DockerClient):
         return client
@@ -24,18 +71,36 @@ def get_client():
         return client
 
 
-def get_tags(url, paginate=True):
-    response = requests.get(url)
-    if response.ok:
+def is_docker_hub(registry):
+    """Return True when ``registry`` points at Docker Hub."""
+    host = registry.split("://", 1)[-1].split("/", 1)[0]
+    return host in ("docker.io", "index.docker.io", "registry-1.docker.io")
+
+
+def make_session(pool_size=16):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def iter_tags(url, paginate=True, session=None, timeout=TIMEOUT):
+    """Yield Docker Hub tag records, following ``next`` links iteratively."""
+    session = session or requests
+    while url:
+        response = session.get(url, timeout=timeout)
+        if not response.ok:
+            return
         data = response.json()
-        tags = data.get('results', [])
-        _next = data.get('next')
-        if _next and paginate:
-            print("Getting next: {}".format(_next)) 
-            tags += get_tags(_next)
-    else:
-        tags = []
-    return tags
+        yield from data.get('results', [])
+        url = data.get('next') if paginate else None
+        if url:
+            print("Getting next: {}".format(url), file=sys.stderr)
+
+
+def get_tags(url, paginate=True):
+    return list(iter_tags(url, paginate))
 
 
 def get_remote_id(name):
@@ -45,13 +110,144 @@ def get_remote_id(name):
     return rd.id
 
 
+class RegistryClient:
+    """Minimal registry v2 client with bearer-token handling.
+
+    Tokens are requested from the realm advertised in the registry's
+    ``WWW-Authenticate`` header and reused until the registry rejects them.
+    """
+
+    def __init__(self, base_url=DOCKER_HUB_REGISTRY, session=None,
+                 timeout=TIMEOUT):
+        if "://" not in base_url:
+            base_url = f"https://{base_url}"
+        self.base_url = base_url.rstrip("/")
+        self.session = session or make_session()
+        self.timeout = timeout
+        self.tokens = {}
+
+    def _authenticate(self, name, challenge):
+        match = re.match(r"Bearer\s+(.*)", challenge or "", re.I)
+        if not match:
+            return None
+        params = dict(re.findall(r'(\w+)="([^"]*)"', match.group(1)))
+        realm = params.pop("realm", None)
+        if realm is None:
+            return None
+        params.setdefault("scope", f"repository:{name}:pull")
+        r = self.session.get(realm, params=params, timeout=self.timeout)
+        r.raise_for_status()
+        data = r.json()
+        self.tokens[name] = data.get("token") or data.get("access_token")
+        return self.tokens[name]
+
+    def request(self, method, name, path, **kwargs):
+        url = f"{self.base_url}/v2/{name}/{path}"
+        headers = dict(kwargs.pop("headers", {}))
+        for _ in range(2):
+            if name in self.tokens:
+                headers["Authorization"] = f"Bearer {self.tokens[name]}"
+            r = self.session.request(method, url, headers=headers,
+                                     timeout=self.timeout, **kwargs)
+            if r.status_code != 401:
+                return r
+            if not self._authenticate(name, r.headers.get("WWW-Authenticate")):
+                return r
+        return r
+
+    def digest(self, name, tag):
+        """Return the manifest digest of ``name:tag`` via a HEAD request."""
+        r = self.request("HEAD", name, f"manifests/{tag}",
+                         headers={"Accept": MANIFEST_TYPES})
+        r.raise_for_status()
+        return r.headers.get("Docker-Content-Digest")
+
+    def iter_tags(self, name, page_size=1000):
+        """Yield tag names from ``/v2/<name>/tags/list``, following Link."""
+        path = f"tags/list?n={page_size}"
+        while path:
+            r = self.request("GET", name, path)
+            r.raise_for_status()
+            yield from r.json().get("tags") or []
+            match = re.search(r'<([^>]+)>;\s*rel="next"', r.headers.get("Link", ""))
+            path = None
+            if match:
+                path = match.group(1).split(f"/v2/{name}/", 1)[-1]
+
+
+def load_cache(path):
+    try:
+        with open(path) as fs:
+            return json.load(fs)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_cache(cache, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as fs:
+        json.dump(cache, fs)
+    os.replace(tmp, path)
+
+
+def resolve_digests(client, name, tags, cache=None, ttl=86400, jobs=16):
+    """Return {name:tag: digest}, only resolving tags missing from ``cache``.
+
+    ``cache`` maps ``<registry>/name:tag`` to ``[digest, resolved_at]`` and
+    is updated in place.
+    """
+    now = time.time()
+    cache = {} if cache is None else cache
+    result = {}
+    missing = []
+    for tag in tags:
+        image = f"{name}:{tag}"
+        entry = cache.get(f"{client.base_url}/{image}")
+        if entry and now - entry[1] < ttl:
+            result[image] = entry[0]
+        else:
+            missing.append(tag)
+
+    def lookup(tag):
+        try:
+            return tag, client.digest(name, tag)
+        except requests.RequestException as e:
+            print(f"Failed to resolve {name}:{tag}: {e}", file=sys.stderr)
+            return tag, None
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for tag, digest in pool.map(lookup, missing):
+            image = f"{name}:{tag}"
+            result[image] = digest
+            if digest is not None:
+                cache[f"{client.base_url}/{image}"] = [digest, now]
+    print(f"Resolved {len(missing)} digests, {len(tags) - len(missing)} "
+          f"from cache", file=sys.stderr)
+    return {f"{name}:{t}": result[f"{name}:{t}"] for t in tags}
+
+
 def main():
     args = parse_args()
-    reg_name = 'library/{}'.format(args.reg_name) if len(args.reg_name.split('/')) == 1 else args.reg_name
-    url = 'https://hub.docker.com/v2/repositories/{}/tags/'.format(reg_name)
-    tags = get_tags(url, paginate=args.paginate)
-    images = [':'.join([reg_name, t['name']]) for t in tags]
-    id_map = {i: get_remote_id(i) for i in images}
+    hub = is_docker_hub(args.registry)
+    reg_name = args.reg_name
+    if hub and len(reg_name.split('/')) == 1:
+        reg_name = 'library/{}'.format(reg_name)
+    session = make_session(args.jobs)
+    client = RegistryClient(args.registry, session, args.timeout)
+    if hub:
+        url = '{}/v2/repositories/{}/tags/?page_size=100'.format(DOCKER_HUB_API, reg_name)
+        tags = [t['name'] for t in iter_tags(url, args.paginate, session,
+                                             args.timeout)]
+    else:
+        tags = list(client.iter_tags(reg_name))
+    if args.use_daemon:
+        id_map = {i: get_remote_id(i) for i in (':'.join([reg_name, t]) for t in tags)}
+    else:
+        cache = None if args.no_cache else load_cache(args.cache_file)
+        id_map = resolve_digests(client, reg_name, tags, cache, args.ttl, args.jobs)
+        if cache is not None:
+            save_cache(cache, args.cache_file)
     print('images = {}'.format(json.dumps(id_map, indent=2)))
 
 if __name__ == '__main__':
@@ -34,6 +34,21 @@ Auth:
     Uses jira_auth.py (same module as jira_create_issue.py). Standard auth
     flags from add_auth_arguments() are accepted.
 
+Validation:
+    Every payload is checked against the project's createmeta (fields on
+    the create screen, required fields, allowed priorities/components)
+    before anything is created. createmeta is cached for a day in
+    ~/.cache/jira-createmeta/ (--refresh-meta refetches it); a dry run
+    validates too when the cache is there.
+
+Re-runs:
+    The Epic and every child get an epic-plan-<hash> label computed from
+    their spec. Running the same plan again reuses the Epic and only creates the
+    children that are missing, so a run that failed halfway can be repeated.
+    Children are created with /rest/api/2/issue/bulk, 50 per request and
+    several requests at a time; if bulk create is unavailable they are
+    created one by one in parallel.
+
 Examples:
     # Dry-run, prints both Epic and Task payloads
     jira_create_epic_with_tasks.py CLOUDOPS \\
@@ -48,9 +63,18 @@ Examples:
         --children-file ./c.yaml --assignee <id> --create
 """
 import argparse
+import hashlib
 import json
+import os
+import re
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
 
 try:
     from jira import JIRA, JIRAError
@@ -64,7 +88,21 @@ try:
 except ModuleNotFoundError:
     YAML_AVAILABLE = False
 
-from jira_auth import auth, add_auth_arguments
+from jira_auth import auth, add_auth_arguments, get_conf
+
+BULK_SIZE = 50
+PLAN_LABEL = "epic-plan-"
+PLAN_LABEL_RE = re.compile(re.escape(PLAN_LABEL) + r"[0-9a-f]{12}")
+META_TTL = 24 * 3600
+META_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "jira-createmeta"
+)
+# set by the create call itself, not on the create screen of every type
+UNCHECKED_FIELDS = {"project", "issuetype", "parent"}
+
+
+class BulkUnavailable(Exception):
+    """The Jira instance has no bulk issue create endpoint."""
 
 
 def parse_args():
@@ -112,6 +150,10 @@ def parse_args():
                         help="Actually create the issues (overrides --dry-run)")
     parser.add_argument("--verbose", action="store_true",
                         help="Print extra information including Jira URLs")
+    parser.add_argument("--jobs", type=int, default=4,
+                        help="Concurrent create requests (default: 4)")
+    parser.add_argument("--refresh-meta", action="store_true",
+                        help="Refetch the cached createmeta before validating")
 
     add_auth_arguments(parser)
     return parser.parse_args()
@@ -175,6 +217,131 @@ def resolve_description(child, key_inline="description", key_file="description-f
     return ""
 
 
+def spec_label(*spec):
+    """Label identifying an issue spec, stable across runs of the same plan."""
+    digest = hashlib.sha1(json.dumps(spec, sort_keys=True, default=str).encode())
+    return PLAN_LABEL + digest.hexdigest()[:12]
+
+
+def plan_label_of(fields):
+    return next(l for l in fields["labels"] if PLAN_LABEL_RE.fullmatch(l))
+
+
+def make_session(conf, workers):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.auth = (conf["username"], conf["password"])
+    session.headers.update({"Accept": "application/json",
+                            "Content-Type": "application/json"})
+    return session
+
+
+def meta_path(base_url, project):
+    return os.path.join(META_DIR, f"{urlparse(base_url).netloc}-{project}.json")
+
+
+def _meta_field(f):
+    allowed = f.get("allowedValues")
+    return {
+        "name": f.get("name"),
+        "required": f.get("required", False),
+        "hasDefaultValue": f.get("hasDefaultValue", False),
+        "allowed": sorted({v.get("name") or v.get("value") for v in allowed} - {None})
+        if allowed else None,
+    }
+
+
+def _paged_values(session, url):
+    start = 0
+    while True:
+        r = session.get(url, params={"startAt": start, "maxResults": 200}, timeout=30)
+        r.raise_for_status()
+        data = r.json()
+        values = data.get("values", data.get("fields", []))
+        yield from values
+        start += len(values)
+        if not values or data.get("isLast", start >= data.get("total", start)):
+            return
+
+
+def fetch_createmeta(session, base_url, project):
+    """Return {issuetype name: {fieldId: field info}} for ``project``.
+
+    Uses the per-issue-type createmeta endpoints, falling back to the old
+    expanded createmeta on instances that do not have them.
+    """
+    url = f"{base_url}/rest/api/2/issue/createmeta/{project}/issuetypes"
+    r = session.get(url, timeout=30)
+    if r.status_code == 404:
+        r = session.get(f"{base_url}/rest/api/2/issue/createmeta", timeout=30, params={
+            "projectKeys": project, "expand": "projects.issuetypes.fields"})
+        r.raise_for_status()
+        projects = r.json().get("projects", [])
+        if not projects:
+            raise ValueError(f"project {project} not found or not creatable")
+        return {t["name"]: {fid: _meta_field(f) for fid, f in t["fields"].items()}
+                for t in projects[0]["issuetypes"]}
+    r.raise_for_status()
+    meta = {}
+    for t in _paged_values(session, url):
+        meta[t["name"]] = {f["fieldId"]: _meta_field(f)
+                           for f in _paged_values(session, f"{url}/{t['id']}")}
+    return meta
+
+
+def cached_createmeta(base_url, project):
+    """Return the cached createmeta if it is fresh, without touching the network."""
+    try:
+        with open(meta_path(base_url, project)) as fs:
+            entry = json.load(fs)
+    except (OSError, ValueError):
+        return None
+    if time.time() - entry.get("time", 0) > META_TTL:
+        return None
+    return entry["issuetypes"]
+
+
+def load_createmeta(session, base_url, project, refresh=False):
+    meta = None if refresh else cached_createmeta(base_url, project)
+    if meta is None:
+        meta = fetch_createmeta(session, base_url, project)
+        path = meta_path(base_url, project)
+        os.makedirs(META_DIR, exist_ok=True)
+        with open(path + ".tmp", "w") as fs:
+            json.dump({"time": time.time(), "issuetypes": meta}, fs)
+        os.replace(path + ".tmp", path)
+    return meta
+
+
+def validate_fields(fields, meta):
+    """Return the problems Jira would reject ``fields`` for, per createmeta."""
+    issuetype = fields["issuetype"]["name"]
+    screen = meta.get(issuetype)
+    if screen is None:
+        return [f"issue type {issuetype!r} not in project (have: {', '.join(sorted(meta))})"]
+    problems = []
+    for fid, value in fields.items():
+        if fid in UNCHECKED_FIELDS:
+            continue
+        if fid not in screen:
+            problems.append(f"field {fid!r} is not on the {issuetype} create screen")
+            continue
+        allowed = screen[fid]["allowed"]
+        if allowed is None:
+            continue
+        for v in value if isinstance(value, list) else [value]:
+            name = v.get("name") if isinstance(v, dict) else v
+            if name is not None and name not in allowed:
+                problems.append(f"{fid} {name!r} not allowed (have: {', '.join(allowed)})")
+    for fid, f in screen.items():
+        if f["required"] and not f["hasDefaultValue"] and fid not in fields \
+                and fid not in UNCHECKED_FIELDS:
+            problems.append(f"required field {f['name'] or fid!r} ({fid}) is missing")
+    return problems
+
+
 def build_epic_fields(args, description):
     fields = {
         "project": {"key": args.project},
@@ -184,8 +351,8 @@ def build_epic_fields(args, description):
     if description:
         fields["description"] = description
     labels = list(args.label) + list(args.epic_label)
-    if labels:
-        fields["labels"] = labels
+    labels.append(spec_label(args.project, args.epic_issuetype, args.epic_summary))
+    fields["labels"] = labels
     if args.epic_component:
         fields["components"] = [{"name": c} for c in args.epic_component]
     if args.epic_priority:
@@ -196,7 +363,7 @@ def build_epic_fields(args, description):
     return fields
 
 
-def build_child_fields(args, child, epic_key=None):
+def build_child_fields(args, child):
     summary = child.get("summary")
     if not summary:
         raise ValueError("each child entry must have a 'summary' key")
@@ -209,10 +376,10 @@ def build_child_fields(args, child, epic_key=None):
     if description:
         fields["description"] = description
 
-    # Labels: defaults from CLI + per-child
+    # Labels: defaults from CLI + per-child + the spec hash for re-runs
     labels = list(args.label) + list(args.child_label) + list(child.get("labels", []))
-    if labels:
-        fields["labels"] = sorted(set(labels))
+    labels.append(spec_label(args.project, args.child_issuetype, child))
+    fields["labels"] = sorted(set(labels))
 
     # Components per-child
     components = child.get("components", [])
@@ -230,12 +397,78 @@ def build_child_fields(args, child, epic_key=None):
     if a:
         fields["assignee"] = a
 
-    if epic_key:
-        fields["parent"] = {"key": epic_key}
-
     return fields
 
 
+def find_by_labels(jira, jql, labels):
+    """Return {plan label: issue key} for issues matching ``jql``."""
+    found = {}
+    for issue in jira.search_issues(jql, fields=["labels"], maxResults=False):
+        for label in issue.fields.labels or []:
+            if label in labels:
+                found[label] = issue.key
+    return found
+
+
+def create_one(session, base_url, fields):
+    try:
+        r = session.post(f"{base_url}/rest/api/2/issue", json={"fields": fields},
+                         timeout=60)
+    except requests.RequestException as e:
+        return None, f"(request failed): {e}"
+    if r.status_code != 201:
+        return None, f"({r.status_code}): {r.text[:400]}"
+    return r.json()["key"], None
+
+
+def create_batch(session, base_url, batch):
+    """Bulk create ``batch`` ([(index, fields)]) and return [(index, key, error)].
+
+    Raises BulkUnavailable when the bulk endpoint does not exist.
+    """
+    try:
+        r = session.post(f"{base_url}/rest/api/2/issue/bulk", timeout=120,
+                         json={"issueUpdates": [{"fields": f} for _, f in batch]})
+    except requests.RequestException as e:
+        return [(i, None, f"(request failed): {e}") for i, _ in batch]
+    if r.status_code in (404, 405):
+        raise BulkUnavailable
+    try:
+        data = r.json()
+    except ValueError:
+        data = {}
+    if r.status_code not in (200, 201) and "errors" not in data:
+        return [(i, None, f"({r.status_code}): {r.text[:400]}") for i, _ in batch]
+    failed = {e["failedElementNumber"]: e for e in data.get("errors", [])}
+    created = iter(data.get("issues", []))
+    results = []
+    # "issues" lists the successes in request order, "errors" the rest
+    for n, (i, _) in enumerate(batch):
+        if n in failed:
+            e = failed[n].get("elementErrors", {})
+            results.append((i, None, f"({failed[n].get('status')}): "
+                            + json.dumps(e.get("errors") or e.get("errorMessages"))))
+        else:
+            key = next(created, {}).get("key")
+            results.append((i, key, None if key else "(bulk create returned no key)"))
+    return results
+
+
+def create_children(session, base_url, pending, jobs):
+    """Create ``pending`` ([(index, fields)]); return [(index, key, error)]."""
+    batches = [pending[n:n + BULK_SIZE] for n in range(0, len(pending), BULK_SIZE)]
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        try:
+            return [res for batch in pool.map(
+                lambda b: create_batch(session, base_url, b), batches) for res in batch]
+        except BulkUnavailable:
+            # no bulk create on this instance; a batch that made it through
+            # would be found again by its plan label, so just go one by one
+            return list(pool.map(
+                lambda item: (item[0],) + create_one(session, base_url, item[1]),
+                pending))
+
+
 def main():
     args = parse_args()
     children = load_children(args.children_file)
@@ -250,6 +483,18 @@ def main():
 
     epic_fields = build_epic_fields(args, epic_desc)
 
+    # Build every child up front so bad config fails before anything is created
+    child_fields = []
+    bad = []
+    for i, c in enumerate(children, 1):
+        try:
+            child_fields.append((i, build_child_fields(args, c)))
+        except (ValueError, OSError) as e:
+            bad.append(f"  [{i}] bad config: {e}")
+    labels = [plan_label_of(cf) for _, cf in child_fields]
+    if len(set(labels)) != len(labels):
+        bad.append("  duplicate child entries (same spec twice)")
+
     if args.dry_run:
         print("=" * 72)
         print("DRY RUN — no issues will be created (use --create to commit)")
@@ -257,8 +502,7 @@ def main():
         print("\n--- EPIC payload ---")
         print(json.dumps(epic_fields, indent=2))
         print(f"\n--- {len(children)} CHILD payloads (parent will be filled at create time) ---")
-        for i, c in enumerate(children, 1):
-            cf = build_child_fields(args, c, epic_key="<EPIC-KEY-AFTER-CREATE>")
+        for i, cf in child_fields:
             print(f"\n[{i}] {cf['summary']}")
             print(f"    issuetype: {cf['issuetype']['name']}")
             print(f"    labels: {cf.get('labels', [])}")
@@ -268,40 +512,81 @@ def main():
                 print(f"    priority: {cf['priority']}")
             if "components" in cf:
                 print(f"    components: {cf['components']}")
-        print(f"\nWould create: 1 Epic + {len(children)} children")
+
+    conf = None
+    meta = None
+    if not args.dry_run:
+        conf = auth(args)
+        base_url = conf["url"].rstrip("/")
+        session = make_session(conf, args.jobs)
+        try:
+            meta = load_createmeta(session, base_url, args.project, args.refresh_meta)
+        except (requests.RequestException, ValueError) as e:
+            print(f"FAILED to load createmeta for {args.project}: {e}", file=sys.stderr)
+            return 1
+    else:
+        url = args.url or get_conf(args.conf).get(args.profile, {}).get("url")
+        if url:
+            meta = cached_createmeta(url.rstrip("/"), args.project)
+
+    if meta is not None:
+        for label, fields in [("Epic", epic_fields)] + \
+                [(f"[{i}]", cf) for i, cf in child_fields]:
+            bad += [f"  {label} {p}" for p in validate_fields(fields, meta)]
+    elif args.dry_run:
+        print("\n(no cached createmeta yet; payloads are validated on --create)")
+
+    if bad:
+        print("\nInvalid plan, nothing created:", file=sys.stderr)
+        print("\n".join(bad), file=sys.stderr)
+        return 1
+    if args.dry_run:
+        print(f"\nWould create: 1 Epic + {len(children)} children"
+              + (" (validated against createmeta)" if meta is not None else ""))
         return 0
 
-    conf = auth(args)
     jira = JIRA(server=conf["url"], basic_auth=(conf["username"], conf["password"]))
 
-    try:
-        epic = jira.create_issue(fields=epic_fields)
-    except JIRAError as e:
-        print(f"FAILED to create Epic ({e.status_code}): {e.text}", file=sys.stderr)
-        return 1
-    epic_url = f"{conf['url'].rstrip('/')}/browse/{epic.key}"
-    print(f"Created Epic: {epic.key}  {epic_url if args.verbose else ''}")
+    epic_label = plan_label_of(epic_fields)
+    existing = find_by_labels(
+        jira, f'project = "{args.project}" AND labels = "{epic_label}"', {epic_label})
+    if epic_label in existing:
+        epic_key = existing[epic_label]
+        print(f"Reusing Epic: {epic_key}")
+    else:
+        try:
+            epic_key = jira.create_issue(fields=epic_fields).key
+        except JIRAError as e:
+            print(f"FAILED to create Epic ({e.status_code}): {e.text}", file=sys.stderr)
+            return 1
+        epic_url = f"{base_url}/browse/{epic_key}"
+        print(f"Created Epic: {epic_key}  {epic_url if args.verbose else ''}")
+
+    done = find_by_labels(jira, f"parent = {epic_key}", set(labels))
+    pending = []
+    for i, cf in child_fields:
+        label = plan_label_of(cf)
+        if label in done:
+            if args.verbose:
+                print(f"  [{i}] {done[label]}: exists")
+            continue
+        pending.append((i, dict(cf, parent={"key": epic_key})))
 
     failures = []
     created = []
-    for i, c in enumerate(children, 1):
-        try:
-            cf = build_child_fields(args, c, epic_key=epic.key)
-        except ValueError as e:
-            print(f"  [{i}] SKIP (bad config): {e}", file=sys.stderr)
-            failures.append((i, str(e)))
+    summaries = dict((i, cf["summary"]) for i, cf in child_fields)
+    for i, key, error in sorted(create_children(session, base_url, pending, args.jobs)):
+        if error:
+            print(f"  [{i}] FAILED {error}", file=sys.stderr)
+            failures.append((i, error))
             continue
-        try:
-            issue = jira.create_issue(fields=cf)
-            created.append(issue.key)
-            child_url = f"{conf['url'].rstrip('/')}/browse/{issue.key}"
-            print(f"  [{i}] {issue.key}: {cf['summary']}"
-                  + (f"  {child_url}" if args.verbose else ""))
-        except JIRAError as e:
-            print(f"  [{i}] FAILED ({e.status_code}): {e.text}", file=sys.stderr)
-            failures.append((i, e.text))
+        created.append(key)
+        child_url = f"{base_url}/browse/{key}"
+        print(f"  [{i}] {key}: {summaries[i]}"
+              + (f"  {child_url}" if args.verbose else ""))
 
-    print(f"\nSummary: {epic.key} + {len(created)} children created"
+    print(f"\nSummary: {epic_key} + {len(created)} children created"
+          + (f", {len(done)} already existed" if done else "")
           + (f" ({len(failures)} failed)" if failures else ""))
     return 0 if not failures else 1
 
@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+Local SQLite mirror of Jira issues for offline, millisecond lookups.
+
+Issues of the configured projects are stored whole (all fields, as the v3
+API returns them) with a few columns pulled out for filtering and an FTS5
+index over summary, description and comments. Syncs are incremental: each
+project remembers the newest ``updated`` it has seen and only asks for
+issues with ``updated >=`` that time (minus an overlap, because JQL dates
+are in the Jira user's time zone and only minute precise).
+
+jira_search.py and jira_get.py answer from the mirror with ``--local``.
+
+Usage:
+    jira_mirror.py sync --project OPS --project CLOUDOPS
+    jira_mirror.py sync                  # every project synced before
+    jira_mirror.py sync --project OPS --full   # refetch, drop deleted issues
+    jira_mirror.py search "rancher upgrade" --project OPS
+    jira_mirror.py status
+
+The database lives in ~/.cache/jira-mirror/<jira host>.db unless
+$JIRA_MIRROR_DB is set.
+"""
+import argparse
+import contextlib
+import datetime as dt
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from urllib.parse import urlparse
+
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "jira-mirror"
+)
+PAGE_SIZE = 100
+OVERLAP = dt.timedelta(hours=24)
+# 1: issues.updated holds UTC timestamps (see utc_updated)
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS issues (
+    key TEXT PRIMARY KEY,
+    id INTEGER,
+    project TEXT NOT NULL,
+    summary TEXT,
+    status TEXT,
+    issuetype TEXT,
+    assignee_id TEXT,
+    assignee_name TEXT,
+    assignee_email TEXT,
+    parent TEXT,
+    labels TEXT,
+    updated TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS issues_project ON issues (project, updated);
+CREATE INDEX IF NOT EXISTS issues_parent ON issues (parent);
+CREATE TABLE IF NOT EXISTS projects (
+    project TEXT PRIMARY KEY,
+    last_updated TEXT,
+    synced_at REAL
+);
+"""
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS issues_fts
+    USING fts5(summary, description, comments)
+"""
+
+
+def db_path(base_url):
+    if os.environ.get("JIRA_MIRROR_DB"):
+        return os.environ["JIRA_MIRROR_DB"]
+    return os.path.join(CACHE_DIR, urlparse(base_url).netloc + ".db")
+
+
+class MirrorConnection(sqlite3.Connection):
+    has_fts = False
+
+
+def connect(path):
+    """Open (and create) the mirror database at ``path``."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path, factory=MirrorConnection)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    try:
+        conn.execute(FTS_SCHEMA)
+        conn.has_fts = True
+    except sqlite3.OperationalError:
+        # sqlite built without FTS5: fall back to LIKE on the summary
+        pass
+    if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+        migrate(conn)
+    return conn
+
+
+def migrate(conn):
+    """Rewrite ``updated`` of rows stored with Jira's local time offset."""
+    with conn:
+        rows = conn.execute("SELECT key, data FROM issues").fetchall()
+        conn.executemany(
+            "UPDATE issues SET updated = ? WHERE key = ?",
+            [(utc_updated(json.loads(r["data"]).get("fields", {}).get("updated")),
+              r["key"]) for r in rows],
+        )
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def adf_text(node):
+    """Collect the text of an ADF document (or pass a plain string through)."""
+    if isinstance(node, str):
+        return node
+    out = []
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        if not isinstance(n, dict):
+            continue
+        if n.get("type") == "text":
+            out.append(n.get("text", ""))
+        stack.extend(reversed(n.get("content") or []))
+    return " ".join(out)
+
+
+def parse_updated(value):
+    """Parse Jira's ``2026-10-19T08:22:52.832+0000`` into an aware datetime."""
+    return dt.datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f%z")
+
+
+def utc_updated(value):
+    """Return ``value`` as a fixed width UTC timestamp that sorts as text.
+
+    Jira formats ``updated`` in the user's time zone, so the raw strings of
+    issues edited from different offsets do not sort chronologically.
+    """
+    if not value:
+        return None
+    return parse_updated(value).astimezone(dt.timezone.utc).strftime(
+        "%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def store_issue(conn, issue):
+    f = issue.get("fields", {})
+    assignee = f.get("assignee") or {}
+    conn.execute(
+        "INSERT OR REPLACE INTO issues VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)",
+        (
+            issue["key"],
+            int(issue["id"]),
+            (f.get("project") or {}).get("key") or issue["key"].rsplit("-", 1)[0],
+            f.get("summary"),
+            (f.get("status") or {}).get("name"),
+            (f.get("issuetype") or {}).get("name"),
+            assignee.get("accountId"),
+            assignee.get("displayName"),
+            assignee.get("emailAddress"),
+            (f.get("parent") or {}).get("key"),
+            json.dumps(f.get("labels") or []),
+            utc_updated(f.get("updated")),
+            json.dumps(issue, separators=(",", ":")),
+        ),
+    )
+    if conn.has_fts:
+        comments = (f.get("comment") or {}).get("comments") or []
+        # the FTS rowid is the Jira issue id, so replacing a row is cheap
+        conn.execute("DELETE FROM issues_fts WHERE rowid = ?", (int(issue["id"]),))
+        conn.execute(
+            "INSERT INTO issues_fts (rowid, summary, description, comments) "
+            "VALUES (?,?,?,?)",
+            (
+                int(issue["id"]),
+                f.get("summary") or "",
+                adf_text(f.get("description")) if f.get("description") else "",
+                "\n".join(adf_text(c.get("body")) for c in comments if c.get("body")),
+            ),
+        )
+
+
+def iter_pages(session, base_url, jql, fields=("*all",)):
+    """Yield pages of issues for ``jql``, v3 search with legacy fallback."""
+    token = None
+    while True:
+        payload = {"jql": jql, "fields": list(fields), "maxResults": PAGE_SIZE}
+        if token:
+            payload["nextPageToken"] = token
+        r = session.post(f"{base_url}/rest/api/3/search/jql", json=payload, timeout=60)
+        if r.status_code in (404, 405) and token is None:
+            break
+        r.raise_for_status()
+        data = r.json()
+        yield data.get("issues", [])
+        token = data.get("nextPageToken")
+        if data.get("isLast", True) or not token:
+            return
+    start = 0
+    while True:
+        r = session.get(
+            f"{base_url}/rest/api/3/search",
+            params={"jql": jql, "fields": ",".join(fields),
+                    "startAt": start, "maxResults": PAGE_SIZE},
+            timeout=60,
+        )
+        r.raise_for_status()
+        data = r.json()
+        issues = data.get("issues", [])
+        yield issues
+        start += len(issues)
+        if not issues or start >= data.get("total", 0):
+            return
+
+
+def sync_project(conn, session, base_url, project, full=False, overlap=OVERLAP):
+    """Bring ``project`` up to date; return the number of issues stored."""
+    row = conn.execute(
+        "SELECT last_updated FROM projects WHERE project = ?", (project,)
+    ).fetchone()
+    last = row["last_updated"] if row and not full else None
+    jql = f'project = "{project}"'
+    if last:
+        since = dt.datetime.fromisoformat(last) - overlap
+        jql += f' AND updated >= "{since:%Y/%m/%d %H:%M}"'
+    jql += " ORDER BY updated ASC"
+
+    newest = dt.datetime.fromisoformat(last) if last else None
+    seen = set()
+    count = 0
+    for page in iter_pages(session, base_url, jql):
+        with conn:
+            for issue in page:
+                store_issue(conn, issue)
+                seen.add(issue["key"])
+                updated = issue.get("fields", {}).get("updated")
+                if updated:
+                    updated = parse_updated(updated).astimezone(dt.timezone.utc)
+                    newest = max(newest, updated) if newest else updated
+        count += len(page)
+    with conn:
+        if full:
+            stale = [(r["key"], r["id"]) for r in conn.execute(
+                "SELECT key, id FROM issues WHERE project = ?", (project,))
+                if r["key"] not in seen]
+            for key, issue_id in stale:
+                conn.execute("DELETE FROM issues WHERE key = ?", (key,))
+                if conn.has_fts:
+                    conn.execute("DELETE FROM issues_fts WHERE rowid = ?", (issue_id,))
+        conn.execute(
+            "INSERT OR REPLACE INTO projects VALUES (?,?,?)",
+            (project, newest.isoformat() if newest else None, time.time()),
+        )
+    return count
+
+
+def get_issue(conn, key):
+    row = conn.execute("SELECT data FROM issues WHERE key = ?", (key,)).fetchone()
+    return json.loads(row["data"]) if row else None
+
+
+def search(conn, project=None, status=None, assignee=None, labels=(),
+           text=None, parent=None, limit=50, terms=()):
+    """Return mirrored issues matching every given filter, newest first.
+
+    ``assignee`` matches the account id, display name or email address;
+    ``text`` is an FTS5 query over summary, description and comments and
+    ``terms`` are plain words that must all occur there. Without FTS5 both
+    fall back to one LIKE per word on the summary.
+    """
+    where, params = [], []
+    if project:
+        where.append("i.project = ?")
+        params.append(project)
+    if status:
+        where.append("i.status = ? COLLATE NOCASE")
+        params.append(status)
+    if assignee:
+        where.append("? COLLATE NOCASE IN (i.assignee_id, i.assignee_name, i.assignee_email)")
+        params.append(assignee)
+    if parent:
+        where.append("i.parent = ?")
+        params.append(parent)
+    for label in labels or ():
+        where.append("EXISTS (SELECT 1 FROM json_each(i.labels) WHERE value = ?)")
+        params.append(label)
+    sql = "SELECT i.data FROM issues i"
+    query = [text] if text else []
+    # quote each term so "foo-bar" is not read as FTS5 syntax
+    query += ['"{}"'.format(w.replace('"', '""')) for w in terms]
+    if query and conn.has_fts:
+        sql += " JOIN issues_fts f ON f.rowid = i.id"
+        where.append("issues_fts MATCH ?")
+        params.append(" ".join(query))
+    elif query:
+        words = [w for w in re.findall(r'[^\s"()]+', text or "")
+                 if w not in ("AND", "OR", "NOT")] + list(terms)
+        for word in words:
+            where.append("i.summary LIKE ?")
+            params.append(f"%{word}%")
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY i.updated DESC LIMIT ?"
+    params.append(limit)
+    return [json.loads(r["data"]) for r in conn.execute(sql, params)]
+
+
+def last_synced(conn, project=None):
+    """Return the oldest sync time (epoch) of ``project`` or all projects."""
+    if project:
+        row = conn.execute(
+            "SELECT synced_at FROM projects WHERE project = ?", (project,)
+        ).fetchone()
+    else:
+        row = conn.execute("SELECT MIN(synced_at) AS synced_at FROM projects").fetchone()
+    return row["synced_at"] if row else None
+
+
+def open_local(profile=None, conf_path=None):
+    """Open the mirror for a config profile without prompting for a token.
+
+    Returns (base_url, conn); exits if the profile has no URL or the mirror
+    has never been synced.
+    """
+    from atlassian_auth import DEFAULT_CONF_PATH, get_conf
+
+    profile = profile or os.getenv("JIRA_PROFILE", "default")
+    conf = get_conf(conf_path=conf_path or DEFAULT_CONF_PATH).get(profile, {})
+    if not conf.get("url"):
+        sys.exit(f"No url for profile {profile!r} in ~/.atlassian-conf.json")
+    path = db_path(conf["url"])
+    if not os.path.exists(path):
+        sys.exit(f"No Jira mirror at {path}; run jira_mirror.py sync --project KEY")
+    return conf["url"], connect(path)
+
+
+def warn_if_stale(conn, project=None, max_age=3600):
+    synced = last_synced(conn, project)
+    if synced is None:
+        print("warning: project not in the local mirror", file=sys.stderr)
+    elif time.time() - synced > max_age:
+        age = (time.time() - synced) / 3600
+        print(f"warning: local mirror last synced {age:.1f}h ago", file=sys.stderr)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Sync and query a local SQLite mirror of Jira issues")
+    parser.add_argument("--profile", default=None, help="Atlassian config profile")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("sync", help="Fetch issues updated since the last sync")
+    p.add_argument("--project", action="append", default=[],
+                   help="Project key to mirror (repeatable; default: all mirrored)")
+    p.add_argument("--full", action="store_true",
+                   help="Refetch everything and drop issues deleted in Jira")
+
+    p = sub.add_parser("search", help="Full-text search the mirror")
+    p.add_argument("text", help="FTS5 query, e.g. 'rancher AND upgrade'")
+    p.add_argument("--project")
+    p.add_argument("--limit", type=int, default=50)
+
+    sub.add_parser("status", help="Show mirrored projects")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == "sync":
+        from atlassian_auth import get_auth
+        import requests
+
+        url, user, token = get_auth(profile=args.profile)
+        conn = connect(db_path(url))
+        projects = args.project or [
+            r["project"] for r in conn.execute("SELECT project FROM projects")]
+        if not projects:
+            sys.exit("Nothing mirrored yet; pass --project KEY")
+        with requests.Session() as session:
+            session.auth = (user, token)
+            for project in projects:
+                start = time.monotonic()
+                n = sync_project(conn, session, url, project, full=args.full)
+                print(f"{project}: {n} issue(s) synced in "
+                      f"{time.monotonic() - start:.1f}s", file=sys.stderr)
+        return
+
+    url, conn = open_local(args.profile)
+    with contextlib.closing(conn):
+        if args.command == "search":
+            for issue in search(conn, project=args.project, text=args.text,
+                                limit=args.limit):
+                f = issue.get("fields", {})
+                status = (f.get("status") or {}).get("name", "")
+                print(f"  {issue['key']:<14} [{status:<14}] {f.get('summary', '')}")
+        else:
+            for r in conn.execute(
+                    "SELECT p.project, p.last_updated, p.synced_at, COUNT(i.key) AS n "
+                    "FROM projects p LEFT JOIN issues i ON i.project = p.project "
+                    "GROUP BY p.project ORDER BY p.project"):
+                synced = time.strftime("%Y-%m-%d %H:%M", time.localtime(r["synced_at"]))
+                print(f"{r['project']:<14} {r['n']:>7} issues  synced {synced}  "
+                      f"newest update {r['last_updated']}")
+
+
+if __name__ == "__main__":
+    main()
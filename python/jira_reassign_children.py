@@ -18,8 +18,30 @@ Examples:
 
     # Preview changes without applying
     jira_reassign_children.py PROJ-123 --dry-run --verbose
+
+    # Large epics: 8 workers, at most 5 requests a second
+    jira_reassign_children.py PROJ-123 --assignee jdoe --jobs 8 --rate 5
+
+Children are fetched with one paged JQL query asking only for the fields
+used here. On Jira Cloud the assignment is sent as one bulk edit task when
+possible; otherwise (and for anything the bulk task skipped) issues are
+assigned concurrently by a bounded pool, throttled to --rate requests a
+second, and every worker backs off for Retry-After when Jira answers 429.
+
+Each assignment is journaled to ~/.cache/jira-reassign/; an interrupted or
+partly failed run can simply be repeated and skips what was already done.
+Issues that already have the target assignee are skipped too.
 """
 import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
 
 try:
     from jira import JIRA, JIRAError
@@ -29,6 +51,12 @@ except ModuleNotFoundError:
 
 from jira_auth import auth, add_auth_arguments
 
+CHILD_FIELDS = ['summary', 'status', 'issuetype', 'assignee']
+JOURNAL_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'jira-reassign')
+BULK_LIMIT = 1000
+MAX_RETRIES = 5
+
 
 def parse_args():
     parser = argparse.ArgumentParser(
@@ -49,6 +77,15 @@ def parse_args():
     parser.add_argument('--current-assignee',
                         help='Only reassign issues currently assigned to this user')
 
+    parser.add_argument('-j', '--jobs', type=int, default=8,
+                        help='Concurrent assignment requests (default: 8)')
+    parser.add_argument('--rate', type=float, default=10,
+                        help='Maximum requests per second (default: 10)')
+    parser.add_argument('--no-bulk', default=False, action='store_true',
+                        help='Assign issue by issue, never with a bulk edit task')
+    parser.add_argument('--no-journal', default=False, action='store_true',
+                        help='Ignore and do not write the progress journal')
+
     add_auth_arguments(parser)
     parser.add_argument('-v', '--verbose', default=False, action='store_true',
                         help='More verbose logging')
@@ -59,68 +96,32 @@ def parse_args():
 
 def get_child_issues(jira, parent_key, args):
     """
-    Fetch child issues using multiple strategies for Jira version compatibility.
-    Tries: parent field (Cloud), Epic Link (older), and direct subtasks.
+    Fetch child issues with a single paged JQL query.
+    Epic children (parent field on Cloud, Epic Link on older Jira) and
+    subtasks are matched together; instances without an Epic Link field
+    reject that clause, so the query is retried with the parent field only.
     :param jira: JIRA client
     :param parent_key: parent issue key (e.g., PROJ-123)
     :param args: parsed args for verbose flag
-    :return: deduplicated list of child issue objects
+    :return: list of child issue objects carrying only CHILD_FIELDS
     """
-    all_children = []
-    seen_keys = set()
-
-    def add_issues(issues):
-        for issue in issues:
-            if issue.key not in seen_keys:
-                seen_keys.add(issue.key)
-                all_children.append(issue)
-
-    # Strategy 1: parent field (Jira Cloud / newer)
-    try:
-        jql = 'parent = {}'.format(parent_key)
-        if args.verbose:
-            print("Searching: {}".format(jql))
-        children = jira.search_issues(jql, maxResults=1000)
-        add_issues(children)
-        if args.verbose:
-            print("Found {} issues via 'parent' field".format(len(children)))
-    except JIRAError as e:
-        if args.verbose:
-            print("'parent' field search failed: {}".format(e.text))
-
-    # Strategy 2: Epic Link (older Jira versions)
-    try:
-        jql = '"Epic Link" = {}'.format(parent_key)
+    queries = [
+        'parent = {0} OR "Epic Link" = {0}'.format(parent_key),
+        'parent = {}'.format(parent_key),
+    ]
+    for jql in queries:
         if args.verbose:
             print("Searching: {}".format(jql))
-        children = jira.search_issues(jql, maxResults=1000)
-        add_issues(children)
-        if args.verbose:
-            print("Found {} issues via 'Epic Link' field".format(len(children)))
-    except JIRAError as e:
-        if args.verbose:
-            print("'Epic Link' search failed: {}".format(e.text))
-
-    # Strategy 3: direct subtasks from parent issue
-    try:
-        parent_issue = jira.issue(parent_key)
-        if hasattr(parent_issue.fields, 'subtasks') and parent_issue.fields.subtasks:
+        try:
+            children = jira.search_issues(jql, fields=CHILD_FIELDS, maxResults=False)
+        except JIRAError as e:
             if args.verbose:
-                print("Found {} subtasks on {}".format(
-                    len(parent_issue.fields.subtasks), parent_key))
-            for subtask in parent_issue.fields.subtasks:
-                if subtask.key not in seen_keys:
-                    full_subtask = jira.issue(subtask.key)
-                    seen_keys.add(subtask.key)
-                    all_children.append(full_subtask)
-    except JIRAError as e:
+                print("Search failed: {}".format(e.text))
+            continue
         if args.verbose:
-            print("Subtask retrieval failed: {}".format(e.text))
-
-    if args.verbose:
-        print("Total unique children found: {}".format(len(all_children)))
-
-    return all_children
+            print("Total unique children found: {}".format(len(children)))
+        return list(children)
+    return []
 
 
 def apply_filters(issues, args):
@@ -186,47 +187,267 @@ def get_target_assignee(jira, args):
     return assignee
 
 
-def reassign_issues(jira, issues, assignee, args):
+def is_cloud(jira):
+    return jira.server_info().get('deploymentType') == 'Cloud'
+
+
+def resolve_account_id(jira, assignee):
+    """
+    Turn a username, email or display name into a Cloud accountId.
+    :param jira: JIRA client
+    :param assignee: accountId, email, or display name
+    :return: accountId
+    """
+    users = jira.search_users(query=assignee, maxResults=10)
+    for user in users:
+        if assignee in (user.accountId, getattr(user, 'emailAddress', None),
+                        user.displayName):
+            return user.accountId
+    if len(users) == 1:
+        return users[0].accountId
+    if not users:
+        # probably an accountId already (they are not searchable)
+        return assignee
+    print("'{}' matches {} users, pass an accountId or email".format(
+        assignee, len(users)))
+    exit(1)
+
+
+def assignee_ids(user):
+    if not user:
+        return set()
+    return {getattr(user, 'accountId', None), getattr(user, 'name', None)} - {None}
+
+
+def make_session(conf, workers):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.auth = (conf["username"], conf["password"])
+    session.headers.update({'Accept': 'application/json',
+                            'Content-Type': 'application/json'})
+    return session
+
+
+class RateLimiter(object):
+    """
+    Spread requests from all workers at most ``rate`` per second, and hold
+    every worker back while Jira has asked us to wait with Retry-After.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.next_slot = max(self.next_slot, time.monotonic() + seconds)
+
+
+def retry_after(response, attempt):
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return min(2 ** attempt, 60)
+
+
+def request(session, limiter, method, url, **kwargs):
+    """Send a request through the limiter, waiting out 429 responses."""
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.wait()
+        r = session.request(method, url, timeout=30, **kwargs)
+        if r.status_code != 429 or attempt == MAX_RETRIES:
+            return r
+        limiter.pause(retry_after(r, attempt))
+    return r
+
+
+class Journal(object):
+    """
+    Append-only record of the issues already assigned for one parent and
+    target, so reruns of an interrupted run skip them. Removed once a run
+    finishes without failures.
+    """
+
+    def __init__(self, parent, target, enabled=True):
+        tag = hashlib.sha1(str(target).encode()).hexdigest()[:12]
+        self.path = os.path.join(JOURNAL_DIR, '{}-{}.jsonl'.format(parent, tag))
+        self.enabled = enabled
+        self.done = set()
+        self.lock = threading.Lock()
+        if enabled and os.path.exists(self.path):
+            with open(self.path) as fs:
+                for line in fs:
+                    try:
+                        self.done.add(json.loads(line)['key'])
+                    except (ValueError, KeyError):
+                        pass  # torn last line after a crash
+
+    def record(self, keys):
+        if not self.enabled:
+            return
+        with self.lock:
+            os.makedirs(JOURNAL_DIR, exist_ok=True)
+            with open(self.path, 'a') as fs:
+                for key in keys:
+                    fs.write(json.dumps({'key': key, 'time': time.time()}) + '\n')
+            self.done.update(keys)
+
+    def finish(self):
+        if self.enabled and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def bulk_assign(session, limiter, base_url, issues, account_id, args):
+    """
+    Assign ``issues`` with Jira Cloud bulk edit tasks. A chunk whose task
+    cannot be submitted or followed counts as not edited, so its issues fall
+    back to being assigned one by one.
+    :return: keys the tasks reported as edited; None if bulk edit is unavailable
+    """
+    edited = []
+    for i in range(0, len(issues), BULK_LIMIT):
+        chunk = issues[i:i + BULK_LIMIT]
+        try:
+            r = request(session, limiter, 'POST', base_url + '/rest/api/3/bulk/issues/fields', json={
+                'selectedActions': ['assignee'],
+                'selectedIssueIdsOrKeys': [issue.key for issue in chunk],
+                'editedFieldsInput': {'singleSelectClearableUserPickerFields': [
+                    {'fieldId': 'assignee', 'user': {'accountId': account_id}}]},
+                'sendBulkNotification': False,
+            })
+        except requests.RequestException as e:
+            print("ERROR: bulk edit failed: {}".format(e))
+            break
+        if r.status_code in (400, 403, 404, 405) and not edited:
+            if args.verbose:
+                print("Bulk edit unavailable ({}), assigning issue by issue".format(r.status_code))
+            return None
+        if not r.ok:
+            print("ERROR: bulk edit rejected: {} {}".format(r.status_code, r.text[:200]))
+            break
+        try:
+            task = wait_for_task(session, limiter, base_url, r.json()['taskId'], args)
+        except (requests.RequestException, KeyError, ValueError) as e:
+            print("ERROR: lost track of bulk edit task: {!r}".format(e))
+            continue
+        processed = {str(x) for x in task.get('processedAccessibleIssues') or []}
+        edited += [issue.key for issue in chunk if str(issue.id) in processed]
+    return edited
+
+
+def wait_for_task(session, limiter, base_url, task_id, args, timeout=600):
+    url = '{}/rest/api/3/bulk/queue/{}'.format(base_url, task_id)
+    deadline = time.monotonic() + timeout
+    delay = 1
+    while True:
+        r = request(session, limiter, 'GET', url)
+        r.raise_for_status()
+        task = r.json()
+        if task.get('status') not in ('ENQUEUED', 'RUNNING'):
+            return task
+        if args.verbose:
+            print("Bulk task {}: {}%".format(task_id, task.get('progressPercent', 0)))
+        if time.monotonic() > deadline:
+            return task
+        time.sleep(delay)
+        delay = min(delay * 2, 10)
+
+
+def assign_one(session, limiter, base_url, key, payload):
+    r = request(session, limiter, 'PUT',
+                '{}/rest/api/2/issue/{}/assignee'.format(base_url, key), json=payload)
+    if not r.ok:
+        raise requests.HTTPError("{} {}".format(r.status_code, r.text[:200]), response=r)
+    return key
+
+
+def reassign_issues(jira, conf, issues, assignee, args):
     """
     Reassign a list of issues to the target assignee.
     :param jira: JIRA client
+    :param conf: auth config with url, username and password
     :param issues: list of JIRA issue objects
     :param assignee: target assignee string or None to unassign
-    :param args: parsed args for verbose/dry-run
-    :return: dict with success and failed counts
+    :param args: parsed args for verbose/dry-run/jobs/rate
+    :return: dict with success, skipped and failed counts
     """
-    results = {'success': 0, 'failed': 0, 'errors': []}
+    results = {'success': 0, 'skipped': 0, 'failed': 0, 'errors': []}
+    action_desc = "unassign" if assignee is None else "assign to {}".format(assignee)
 
-    for issue in issues:
-        current = 'Unassigned'
-        if issue.fields.assignee:
-            current = getattr(issue.fields.assignee, 'displayName',
-                              getattr(issue.fields.assignee, 'name', 'Unknown'))
+    cloud = is_cloud(jira)
+    target = assignee
+    if cloud and args.assignee:
+        target = resolve_account_id(jira, assignee)
+    journal = Journal(args.parent, target, enabled=not (args.no_journal or args.dry_run))
 
-        if assignee is None:
-            action_desc = "unassign"
-        else:
-            action_desc = "assign to {}".format(assignee)
+    pending = []
+    for issue in issues:
+        current = assignee_ids(issue.fields.assignee)
+        if issue.key in journal.done or (target is None and not current) or target in current:
+            results['skipped'] += 1
+            if args.verbose:
+                print("{}: already done, skipping".format(issue.key))
+            continue
+        pending.append(issue)
 
-        if args.dry_run:
+    if args.dry_run:
+        for issue in pending:
+            current = 'Unassigned'
+            if issue.fields.assignee:
+                current = getattr(issue.fields.assignee, 'displayName',
+                                  getattr(issue.fields.assignee, 'name', 'Unknown'))
             print("DRY RUN: Would {} {} [{}] (currently: {})".format(
                 action_desc, issue.key, issue.fields.summary, current))
+        results['success'] = len(pending)
+        return results
+
+    base_url = conf["url"].rstrip('/')
+    session = make_session(conf, args.jobs)
+    limiter = RateLimiter(args.rate)
+
+    if cloud and target is not None and not args.no_bulk and len(pending) > 1:
+        edited = bulk_assign(session, limiter, base_url, pending, target, args)
+        if edited:
+            journal.record(edited)
+            results['success'] += len(edited)
+            for key in edited:
+                print("{}: {}".format(key, action_desc))
+            pending = [issue for issue in pending if issue.key not in journal.done]
+
+    if cloud:
+        payload = {'accountId': target}
+    else:
+        payload = {'name': target}
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {pool.submit(assign_one, session, limiter, base_url, issue.key, payload): issue
+                   for issue in pending}
+        for future in as_completed(futures):
+            issue = futures[future]
+            try:
+                future.result()
+            except requests.RequestException as e:
+                results['failed'] += 1
+                error_msg = "{}: {}".format(issue.key, e)
+                results['errors'].append(error_msg)
+                print("ERROR: {}".format(error_msg))
+                continue
+            journal.record([issue.key])
             results['success'] += 1
-            continue
-
-        try:
-            jira.assign_issue(issue.key, assignee)
-            results['success'] += 1
-            if args.verbose:
-                print("{}: {} (was: {})".format(issue.key, action_desc, current))
-            else:
-                print("{}: {}".format(issue.key, action_desc))
-        except JIRAError as e:
-            results['failed'] += 1
-            error_msg = "{}: {}".format(issue.key, e.text)
-            results['errors'].append(error_msg)
-            print("ERROR: {}".format(error_msg))
+            print("{}: {}".format(issue.key, action_desc))
 
+    if not results['failed']:
+        journal.finish()
     return results
 
 
@@ -238,6 +459,8 @@ def print_summary(issues, results, args):
     print("=" * 50)
     print("Total issues: {}".format(len(issues)))
     print("{}: {}".format(prefix, results['success']))
+    if results['skipped'] > 0:
+        print("Already done: {}".format(results['skipped']))
     if results['failed'] > 0:
         print("Failed: {}".format(results['failed']))
         for error in results['errors']:
@@ -290,7 +513,7 @@ def main():
         print("\nDRY RUN MODE - No changes will be made\n")
 
     # Reassign
-    results = reassign_issues(jira, filtered, target, args)
+    results = reassign_issues(jira, conf, filtered, target, args)
 
     # Summary
     print_summary(filtered, results, args)
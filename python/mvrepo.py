@@ -1,21 +1,41 @@
 #!/usr/bin/env python3
+"""Move git repositories into <base>/<host>/<owner>/<repo>.
+
+Remotes are read straight from each repository's ``.git/config`` and the
+moves run on a bounded thread pool. A move is an atomic ``os.rename`` when
+source and destination share a filesystem, otherwise the tree is copied in
+parallel to a temporary sibling, renamed into place and the source removed.
+Every completed move is recorded in ``<base>/.mvrepo-index.json`` so a
+re-run skips repositories that were already relocated.
+"""
 
 import sys
 import os
+import re
+import errno
+import json
+import threading
 import urllib.parse as up
 import shutil
+import tempfile
 import argparse
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 try:
-    import git
     from giturlparse import parse
 except ModuleNotFoundError:
-    print("The modules gitpython and giturlparse are required\n\tpython3 -m pip install gitpython giturlparse")
+    parse = None
 
 logger = logging.getLogger(__name__)
 
 USER_BASE = os.path.expanduser('~')
 REPO_BASE = os.path.join(USER_BASE, 'repos')
+INDEX_NAME = '.mvrepo-index.json'
+
+SECTION_RE = re.compile(r'^\s*\[\s*([^\s\]"]+)(?:\s+"((?:[^"\\]|\\.)*)")?\s*\]')
+URL_RE = re.compile(r'^\s*url\s*=\s*(.*?)\s*$', re.I)
+SCP_RE = re.compile(r'^(?:[^@/]+@)?([^:/]+):(?!//)(.+)$')
+
 
 def parse_args():
     parser = argparse.ArgumentParser()
@@ -27,58 +47,101 @@ def parse_args():
                         default=False, help='Do a dryrun and don\'t modify anything.')
     parser.add_argument('-s', '--symlink', action='store_true',
                         default=False, help='Do a symlink back to the orinal location.')
+    parser.add_argument('-j', '--jobs', type=int, default=8,
+                        help='Repositories moved concurrently (default: 8)')
+    parser.add_argument('--copy-jobs', type=int, default=8,
+                        help='Files copied concurrently per cross-device move (default: 8)')
     parser.add_argument('--debug', action='store_true',
                         default=False, help='Turn on debug logging.')
     return parser.parse_args()
 
 
-def get_os_path(git_remote):
+def get_os_path(git_remote, base=REPO_BASE):
+    if parse is not None:
+        try:
+            g = parse(git_remote)
+            return os.path.join(base, g.host, g.owner, g.repo)
+        except AttributeError:
+            pass
+    g = up.urlparse(git_remote)
+    if g.hostname:
+        host, path = g.hostname, g.path[1:]
+    else:
+        m = SCP_RE.match(git_remote)
+        if not m:
+            return None
+        host, path = m.groups()
+    path = path.strip('/')
+    if path.endswith('.git'):
+        path = path[:-len('.git')]
+    return os.path.join(base, host, path)
+
+
+def git_config_path(path):
+    """Return the config file of the repo at ``path``.
+
+    ``.git`` may be a file pointing elsewhere (worktrees, submodules).
+    """
+    dotgit = os.path.join(path, '.git')
+    if os.path.isfile(dotgit):
+        with open(dotgit) as fs:
+            line = fs.readline()
+        if line.startswith('gitdir:'):
+            gitdir = line[len('gitdir:'):].strip()
+            dotgit = os.path.normpath(os.path.join(path, gitdir))
+            commondir = os.path.join(dotgit, 'commondir')
+            if os.path.isfile(commondir):
+                with open(commondir) as fs:
+                    dotgit = os.path.normpath(os.path.join(dotgit, fs.read().strip()))
+    return os.path.join(dotgit, 'config')
+
+
+def read_remotes(path):
+    """Return {remote name: first url} parsed from the repo's git config."""
+    remotes = {}
+    section = None
     try:
-        g = parse(git_remote)
-        return os.path.join(REPO_BASE, g.host, g.owner, g.repo)
-    except AttributeError:
-        g = up.urlparse(git_remote)
-        os_path = os.path.join(REPO_BASE, g.hostname, g.path[1:].replace('.git', ''))
-        return os_path
+        with open(git_config_path(path)) as fs:
+            for line in fs:
+                m = SECTION_RE.match(line)
+                if m:
+                    section = m.group(2) if m.group(1).lower() == 'remote' else None
+                    continue
+                if section is None:
+                    continue
+                m = URL_RE.match(line)
+                if m:
+                    remotes.setdefault(section, m.group(1).strip('"'))
+    except OSError as e:
+        logger.warning("Could not read git config for {}: {}".format(path, e))
+    return remotes
 
 
 def get_remote(path, name='origin'):
-    repo = git.Repo(path)
-    if name in [r.name for r in repo.remotes]:
-        remote = repo.remote(name)
-        return next(remote.urls)
+    remotes = read_remotes(path)
+    if name in remotes:
+        return remotes[name]
     else:
-        _avail = "Available remotes {}".format(repo.remotes)
+        _avail = "Available remotes {}".format(list(remotes))
         logger.warning("The remote named '{}' was not found. {}".format(
             name, _avail))
     return None
 
 
-def walklevel(some_dir, level=1):
-    some_dir = some_dir.rstrip(os.path.sep)
-    assert os.path.isdir(some_dir)
-    num_sep = some_dir.count(os.path.sep)
-    for root, dirs, files in os.walk(some_dir):
-        yield root, dirs, files
-        num_sep_this = root.count(os.path.sep)
-        if num_sep + level <= num_sep_this:
-            del dirs[:]
-
-
 def find_git_dirs(path):
+    path = path.rstrip(os.path.sep) or os.path.sep
+    logger.debug("Looking in {} for .git dir".format(path))
+    if os.path.exists(os.path.join(path, '.git')):
+        return [path]
     git_dirs = []
-    for root, dirs, files in walklevel(path, 0):
-        logger.debug("root: {} \ndirs: {}".format(root, dirs))
-        logger.debug("Looking in {} for .git dir".format(root))
-        if os.path.exists(os.path.join(root, '.git')):
-            git_dirs.append(root)
-            break
-        for d in dirs:
-            logger.debug("Looking in {} for .git dir".format(d))
-            if os.path.exists(os.path.join(d, '.git')):
-                logger.debug("Found .git dir in {}".format(d))
-                git_dirs.append(d)
-    return git_dirs
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            if os.path.exists(os.path.join(entry.path, '.git')):
+                logger.debug("Found .git dir in {}".format(entry.path))
+                git_dirs.append(entry.path)
+    return sorted(git_dirs)
 
 def setup_logging(args):
     if args.debug:
@@ -96,31 +159,128 @@ def setup_logging(args):
         logger.setLevel(logging.INFO)
 
 
-def move_dir(src, dest, symlink=False, dryrun=False):
+class MoveIndex:
+    """JSON record of completed moves, keyed by absolute source path."""
+
+    def __init__(self, base, dryrun=False):
+        self.path = os.path.join(base, INDEX_NAME)
+        self.dryrun = dryrun
+        self.lock = threading.Lock()
+        try:
+            with open(self.path) as fs:
+                self.moves = json.load(fs)
+        except (FileNotFoundError, ValueError):
+            self.moves = {}
+
+    def done(self, src):
+        entry = self.moves.get(os.path.abspath(src))
+        return entry is not None and os.path.exists(entry['dest'])
+
+    def record(self, src, dest, remote):
+        with self.lock:
+            self.moves[os.path.abspath(src)] = {'dest': dest, 'remote': remote}
+            if self.dryrun:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as fs:
+                json.dump(self.moves, fs, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
+
+
+def copy_tree(src, dest, workers=8):
+    """Copy ``src`` to ``dest`` with file copies spread over a thread pool.
+
+    Directory times and modes are applied once their contents are in place,
+    deepest first, so copying into them does not clobber the mtimes and a
+    read-only directory can still be filled.
+    """
+    files = []
+    dirs_copied = []
+    for root, dirs, filenames in os.walk(src):
+        target = os.path.join(dest, os.path.relpath(root, src))
+        os.makedirs(target, exist_ok=True)
+        dirs_copied.append((root, target))
+        for name in dirs + filenames:
+            s = os.path.join(root, name)
+            if os.path.islink(s):
+                os.symlink(os.readlink(s), os.path.join(target, name))
+            elif name in filenames:
+                files.append((s, os.path.join(target, name)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in as_completed(pool.submit(shutil.copy2, s, d) for s, d in files):
+            future.result()
+    for root, target in reversed(dirs_copied):
+        shutil.copystat(root, target)
+
+
+def move_dir(src, dest, symlink=False, dryrun=False, copy_workers=8):
+    """Move ``src`` to ``dest``; return True if it was (or would be) moved."""
     if os.path.islink(src):
         logger.warning("Directory {} is a symlink. Skipping...".format(src))
-        return
+        return False
+    if os.path.lexists(dest):
+        logger.warning("Destination {} already exists. Skipping {}".format(dest, src))
+        return False
     logger.info("{} -> {}".format(src, dest))
     if not dryrun:
         os.makedirs(os.path.dirname(dest), exist_ok=True)
-        shutil.move(src, dest)
+        try:
+            os.rename(src, dest)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            logger.debug("{} is on another filesystem, copying".format(dest))
+            # private staging dir, so concurrent moves never share one
+            tmp = tempfile.mkdtemp(prefix=".{}.mvrepo-".format(os.path.basename(dest)),
+                                   dir=os.path.dirname(dest))
+            try:
+                copy_tree(src, tmp, copy_workers)
+                os.rename(tmp, dest)
+            except BaseException:
+                shutil.rmtree(tmp, ignore_errors=True)
+                raise
+            shutil.rmtree(src)
     if symlink:
         logger.info("symlink {} -> {}".format(src, dest))
         if not dryrun:
             os.symlink(dest, src)
+    return True
+
+
+def relocate(d, args, index):
+    if index.done(d):
+        logger.debug("{} already moved to {}".format(d, index.moves[os.path.abspath(d)]['dest']))
+        return
+    r = get_remote(d)
+    if r is None:
+        return
+    p = get_os_path(r, args.base)
+    if p is None:
+        logger.warning("Could not map remote {} of {} to a path".format(r, d))
+        return
+    if move_dir(d, p, args.symlink, args.dryrun, args.copy_jobs):
+        index.record(d, p, r)
 
 
 def main():
     args = parse_args()
+    args.base = os.path.abspath(args.base)
     setup_logging(args)
     dirs = find_git_dirs(args.path)
     logger.debug("Found git dirs: \n\t{}".format("\n\t".join(dirs)))
-    for d in dirs:
-        r = get_remote(d)
-        if r is None:
-            continue
-        p = get_os_path(r)
-        move_dir(d, p, args.symlink, args.dryrun)
+    index = MoveIndex(args.base, args.dryrun)
+    failed = 0
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {pool.submit(relocate, d, args, index): d for d in dirs}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except OSError as e:
+                failed += 1
+                logger.error("Failed to move {}: {}".format(futures[future], e))
+    if failed:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
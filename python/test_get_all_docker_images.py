@@ -0,0 +1,108 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import get_all_docker_images as images
+
+
+class StubRegistry(BaseHTTPRequestHandler):
+    """Registry v2 stand-in with a bearer token realm and Link paging."""
+
+    tags = [f"t{i}" for i in range(25)]
+    page = 10
+    heads = []
+    token_requests = []
+    stall = 0
+
+    def send_body(self, status, body=b"", headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def authorized(self):
+        if self.headers.get("Authorization") == "Bearer tok":
+            return True
+        realm = f"http://127.0.0.1:{self.server.server_address[1]}/token"
+        self.send_body(401, headers=[(
+            "WWW-Authenticate", f'Bearer realm="{realm}",service="stub"')])
+        return False
+
+    def do_GET(self):
+        time.sleep(self.stall)
+        if self.path.startswith("/token"):
+            self.token_requests.append(self.path)
+            return self.send_body(200, json.dumps({"token": "tok"}).encode())
+        if not self.authorized():
+            return
+        repo, _, query = self.path[len("/v2/"):].partition("/tags/list?")
+        params = dict(p.split("=") for p in query.split("&"))
+        start = self.tags.index(params["last"]) + 1 if "last" in params else 0
+        page = self.tags[start:start + int(params["n"])]
+        headers = []
+        if start + len(page) < len(self.tags):
+            headers.append(("Link", f'</v2/{repo}/tags/list?n={params["n"]}'
+                                    f'&last={page[-1]}>; rel="next"'))
+        self.send_body(200, json.dumps({"tags": page}).encode(), headers)
+
+    def do_HEAD(self):
+        if not self.authorized():
+            return
+        self.heads.append(self.path)
+        tag = self.path.rsplit("/", 1)[1]
+        self.send_response(200)
+        self.send_header("Docker-Content-Digest", f"sha256:{tag}")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def registry():
+    StubRegistry.heads = []
+    StubRegistry.token_requests = []
+    StubRegistry.stall = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubRegistry)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_pages_tags_and_reuses_token(registry):
+    client = images.RegistryClient(registry)
+    tags = list(client.iter_tags("team/app", page_size=10))
+    assert tags == StubRegistry.tags
+    assert len(StubRegistry.token_requests) == 1
+    assert "scope=repository%3Ateam%2Fapp%3Apull" in StubRegistry.token_requests[0]
+
+
+def test_resolves_digests_once_per_registry(registry):
+    client = images.RegistryClient(registry)
+    cache = {}
+    digests = images.resolve_digests(client, "team/app", ["a", "b"], cache, jobs=4)
+    assert digests == {"team/app:a": "sha256:a", "team/app:b": "sha256:b"}
+    assert images.resolve_digests(client, "team/app", ["a", "b"], cache) == digests
+    assert len(StubRegistry.heads) == 2
+    assert sorted(cache) == [f"{registry}/team/app:a", f"{registry}/team/app:b"]
+
+    # the same repo:tag on another registry is not served from the cache
+    other = images.RegistryClient(registry.replace("127.0.0.1", "localhost"))
+    images.resolve_digests(other, "team/app", ["a"], cache)
+    assert len(StubRegistry.heads) == 3
+
+
+def test_stalled_registry_times_out(registry):
+    StubRegistry.stall = 1
+    client = images.RegistryClient(registry, timeout=0.2)
+    with pytest.raises(requests.Timeout):
+        list(client.iter_tags("team/app"))
@@ -3,19 +3,31 @@
 
 Usage:
     cf_get.py <url-or-id> [--format text|storage|view|adf] [--children] [--depth N]
-              [--profile NAME]
+              [--bodies] [--ndjson] [--workers N] [--profile NAME]
 
 Uses the shared atlassian_auth helper (config in ~/.atlassian-conf.json,
 token in the OS keyring). Confluence Cloud uses v1 + v2 REST — there is no v3.
+
+The child tree is crawled breadth-first over one pooled session: each
+page's children are listed (following _links.next) as soon as the page
+itself is found, --workers at a time, and --bodies fetches the children's
+bodies alongside (in batches of 50 for storage/adf; the view rendering
+behind text/view can only be fetched page by page). --depth 0 walks the
+whole tree; with --ndjson every page is printed as one JSON line the
+moment it arrives, which makes exporting a whole space practical:
+
+    cf_get.py <space-home-id> --children --depth 0 --bodies --ndjson > space.ndjson
 """
 from __future__ import annotations
 
 import argparse
+import json
 import os
 import re
 import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from html.parser import HTMLParser
-from urllib.parse import parse_qs, urlparse
+from urllib.parse import parse_qs, urljoin, urlparse
 
 # Make atlassian_auth importable from either canonical location
 for _p in (
@@ -34,6 +46,13 @@ except ImportError:
     )
 
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    # shared with cab-read.py / cab-add.py, next to atlassian_auth
+    from confluence_cache import PageCache  # type: ignore
+except ImportError:
+    PageCache = None
 
 
 FORMAT_MAP = {
@@ -42,6 +61,11 @@ FORMAT_MAP = {
     "view": "view",
     "adf": "atlas_doc_format",
 }
+PAGE_LIMIT = 250
+# ids per batched body request, kept well under URL length limits
+BODY_BATCH = 50
+# the only body formats the v2 list endpoints accept; view is per page only
+BATCH_FORMATS = {"storage", "atlas_doc_format"}
 
 
 def resolve_page_id(arg: str) -> str:
@@ -102,11 +126,27 @@ def html_to_text(html: str) -> str:
     return text.strip() + "\n"
 
 
-def fetch_page(base_url: str, auth, page_id: str, body_format: str) -> dict:
-    r = requests.get(
+def make_session(auth, pool_size: int = 8) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.auth = auth
+    return session
+
+
+def fetch_page(session, base_url: str, page_id: str, body_format: str,
+               cache=None) -> dict:
+    if cache is not None:
+        # body reused from the version cache unless the page changed
+        try:
+            return cache.get_page(session, page_id, body_format, timeout=20)
+        except requests.HTTPError as e:
+            r = e.response
+            sys.exit(f"GET page {page_id} → {r.status_code}: {r.text[:400]}")
+    r = session.get(
         f"{base_url}/wiki/api/v2/pages/{page_id}",
         params={"body-format": body_format},
-        auth=auth,
         timeout=20,
     )
     if r.status_code != 200:
@@ -114,40 +154,153 @@ def fetch_page(base_url: str, auth, page_id: str, body_format: str) -> dict:
     return r.json()
 
 
-def fetch_children(base_url: str, auth, page_id: str, depth: int = 1) -> list[dict]:
-    """Return a flat list of children, recursing up to `depth` levels."""
-    out: list[dict] = []
-    cursor: str | None = None
-    while True:
-        params = {"limit": 100}
-        if cursor:
-            params["cursor"] = cursor
-        r = requests.get(
-            f"{base_url}/wiki/api/v2/pages/{page_id}/children",
-            params=params,
-            auth=auth,
-            timeout=20,
-        )
+def iter_results(session, base_url: str, url: str, params: dict, what: str):
+    """Yield every result of a v2 list endpoint, following _links.next."""
+    while url:
+        r = session.get(url, params=params, timeout=30)
         if r.status_code != 200:
-            sys.exit(f"GET children of {page_id} → {r.status_code}: {r.text[:400]}")
+            sys.exit(f"GET {what} → {r.status_code}: {r.text[:400]}")
         data = r.json()
-        for c in data.get("results", []):
-            c["_depth"] = 1
-            out.append(c)
-            if depth > 1:
-                for gc in fetch_children(base_url, auth, c["id"], depth - 1):
-                    gc["_depth"] = gc.get("_depth", 1) + 1
-                    out.append(gc)
+        yield from data.get("results", [])
         next_link = data.get("_links", {}).get("next")
-        if not next_link:
-            break
-        m = re.search(r"cursor=([^&]+)", next_link)
-        cursor = m.group(1) if m else None
-        if not cursor:
-            break
+        # the next link is site-relative and already carries the query
+        url = urljoin(base_url, next_link) if next_link else None
+        params = None
+
+
+def list_children(session, base_url: str, page_id: str) -> list[dict]:
+    return list(iter_results(
+        session, base_url, f"{base_url}/wiki/api/v2/pages/{page_id}/children",
+        {"limit": PAGE_LIMIT}, f"children of {page_id}"))
+
+
+def fetch_bodies(session, base_url: str, ids: list[str],
+                 body_format: str | None) -> dict:
+    """Return {id: page} for ``ids`` in one listing; no bodies without a format."""
+    params = {"id": ",".join(ids), "limit": PAGE_LIMIT}
+    if body_format:
+        params["body-format"] = body_format
+    pages = iter_results(
+        session, base_url, f"{base_url}/wiki/api/v2/pages", params,
+        f"bodies of {len(ids)} pages")
+    return {p["id"]: p for p in pages}
+
+
+def cached_bodies(session, base_url: str, ids: list[str], body_format: str,
+                  cache) -> dict:
+    """Like fetch_bodies, reusing cached bodies whose version is current.
+
+    One listing without bodies gives the current versions; only the pages
+    that changed since they were cached are fetched with their bodies.
+    """
+    pages = fetch_bodies(session, base_url, ids, None)
+    stale = []
+    for page_id, page in pages.items():
+        cached = cache.load(page_id, body_format)
+        if cached and cached.get("version", {}).get("number") == \
+                page.get("version", {}).get("number"):
+            page["body"] = cached["body"]
+        else:
+            stale.append(page_id)
+    if stale:
+        fresh = fetch_bodies(session, base_url, stale, body_format)
+        for page in fresh.values():
+            cache.store(page, body_format)
+        pages.update(fresh)
+    return pages
+
+
+def crawl(session, base_url: str, page_id: str, depth: int = 1, workers: int = 8,
+          body_format: str | None = None, cache=None):
+    """Yield the descendants of ``page_id`` down to ``depth`` levels (0: all).
+
+    Pages are yielded as they are found, tagged with ``_depth`` and
+    ``_parent``; the children of every page are requested as soon as the
+    page is seen, so the levels of the tree are fetched concurrently. With
+    ``body_format`` each page is yielded once its body has arrived.
+    """
+    batch_size = BODY_BATCH if body_format in BATCH_FORMATS else 1
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(list_children, session, base_url, page_id): (page_id, 1)}
+        # children waiting for their bodies, batched across parents
+        waiting: list[dict] = []
+        while pending or waiting:
+            listing = any(parent is not None for parent, _ in pending.values())
+            while body_format and waiting and (len(waiting) >= batch_size or not listing):
+                batch, waiting = waiting[:batch_size], waiting[batch_size:]
+                job = pool.submit(_with_bodies, session, base_url, batch, body_format,
+                                  cache)
+                pending[job] = (None, 0)
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                parent, level = pending.pop(future)
+                if parent is None:
+                    yield from future.result()
+                    continue
+                children = future.result()
+                for c in children:
+                    c["_depth"] = level
+                    c["_parent"] = parent
+                    if depth <= 0 or level < depth:
+                        job = pool.submit(list_children, session, base_url, c["id"])
+                        pending[job] = (c["id"], level + 1)
+                if body_format:
+                    waiting.extend(children)
+                else:
+                    yield from children
+
+
+def _with_bodies(session, base_url, children, body_format, cache=None):
+    ids = [c["id"] for c in children]
+    if body_format in BATCH_FORMATS and cache is not None:
+        pages = cached_bodies(session, base_url, ids, body_format, cache)
+    elif body_format in BATCH_FORMATS:
+        pages = fetch_bodies(session, base_url, ids, body_format)
+    else:
+        pages = {i: fetch_page(session, base_url, i, body_format, cache)
+                 for i in ids}
+    for c in children:
+        c["body"] = pages.get(c["id"], {}).get("body", {})
+        c.setdefault("version", pages.get(c["id"], {}).get("version", {}))
+    return children
+
+
+def tree_order(pages: list[dict], root_id: str) -> list[dict]:
+    """Order crawled pages depth-first, children in API order, for display."""
+    by_parent: dict[str, list[dict]] = {}
+    for p in pages:
+        by_parent.setdefault(p["_parent"], []).append(p)
+    out: list[dict] = []
+    stack = list(reversed(by_parent.get(root_id, [])))
+    while stack:
+        p = stack.pop()
+        out.append(p)
+        stack.extend(reversed(by_parent.get(p["id"], [])))
     return out
 
 
+def render_body(body: dict, fmt: str) -> str:
+    value = body.get(FORMAT_MAP[fmt], {}).get("value", "")
+    if fmt == "text":
+        return html_to_text(value)
+    if fmt == "adf" and not isinstance(value, str):
+        return json.dumps(value)
+    return value
+
+
+def page_record(page: dict, fmt: str, depth: int = 0, parent: str | None = None) -> dict:
+    rec = {
+        "id": page["id"],
+        "title": page.get("title", ""),
+        "parentId": page.get("_parent", parent),
+        "depth": page.get("_depth", depth),
+        "version": (page.get("version") or {}).get("number"),
+    }
+    if "body" in page:
+        rec["body"] = render_body(page["body"], fmt)
+    return rec
+
+
 def main() -> None:
     ap = argparse.ArgumentParser(description=__doc__)
     ap.add_argument("page", help="Page URL or numeric ID")
@@ -158,16 +311,37 @@ def main() -> None:
         help="Output format (default: text = view HTML stripped to plaintext)",
     )
     ap.add_argument("--children", action="store_true", help="Also list child pages")
-    ap.add_argument("--depth", type=int, default=1, help="Recursion depth for --children")
+    ap.add_argument("--depth", type=int, default=1,
+                    help="Recursion depth for --children (0: the whole tree)")
+    ap.add_argument("--bodies", action="store_true",
+                    help="Also fetch the body of every child page")
+    ap.add_argument("--ndjson", action="store_true",
+                    help="Print the page and each child as a JSON line as they arrive")
+    ap.add_argument("--workers", type=int, default=8,
+                    help="Concurrent requests while crawling children (default: 8)")
+    ap.add_argument("--no-cache", action="store_true",
+                    help="Always download the page body (skip the version cache)")
     ap.add_argument("--profile", default=None, help="Atlassian config profile")
     args = ap.parse_args()
 
     page_id = resolve_page_id(args.page)
     url, user, token = get_auth(profile=args.profile)
-    auth = (user, token)
+    session = make_session((user, token), args.workers)
+    cache = None
+    if PageCache is not None and not args.no_cache:
+        cache = PageCache(url)
 
     body_format = FORMAT_MAP[args.format]
-    page = fetch_page(url, auth, page_id, body_format)
+    page = fetch_page(session, url, page_id, body_format, cache)
+    crawl_format = body_format if args.bodies else None
+
+    if args.ndjson:
+        print(json.dumps(page_record(page, args.format)), flush=True)
+        if args.children:
+            for c in crawl(session, url, page_id, args.depth, args.workers, crawl_format,
+                           cache):
+                print(json.dumps(page_record(c, args.format)), flush=True)
+        return
 
     title = page.get("title", "")
     space_id = page.get("spaceId", "")
@@ -184,15 +358,26 @@ def main() -> None:
         print(html_to_text(body))
     else:
         print(body)
+    sys.stdout.flush()
 
     if args.children:
         print("\n---\n## Children")
-        children = fetch_children(url, auth, page_id, depth=args.depth)
+        children = tree_order(
+            list(crawl(session, url, page_id, args.depth, args.workers, crawl_format,
+                       cache)),
+            page_id)
         if not children:
             print("(none)")
         for c in children:
             indent = "  " * (c.get("_depth", 1) - 1)
             print(f"{indent}- id={c['id']}  {c.get('title', '')}")
+        if args.bodies:
+            for c in children:
+                print(f"\n---\n# {c.get('title', '')}")
+                print(f"id: {c['id']} · parent: {c['_parent']} · "
+                      f"version: {(c.get('version') or {}).get('number', '?')}")
+                print()
+                print(render_body(c.get("body", {}), args.format))
 
 
 if __name__ == "__main__":
@@ -3,11 +3,14 @@
 
 Usage:
     jira_get.py <key-or-url> [--format text|json|adf] [--comments] [--subtasks]
-                [--changelog] [--profile NAME]
+                [--changelog] [--profile NAME] [--local]
 
 Uses the shared atlassian_auth helper (config in ~/.atlassian-conf.json,
 token in the OS keyring). Jira Cloud uses v2 (wiki markup) and v3 (ADF) —
 prefer v3 for new code.
+
+--local reads the issue from the SQLite mirror kept by jira_mirror.py
+(no network, no token); the changelog is not mirrored.
 """
 from __future__ import annotations
 
@@ -114,6 +117,19 @@ def fetch_issue(base_url: str, auth, key: str, expand=None) -> dict:
     return r.json()
 
 
+def local_issue(profile, key: str) -> tuple[str, dict]:
+    """Return (base_url, issue) from the jira_mirror.py database."""
+    import jira_mirror  # type: ignore
+
+    url, conn = jira_mirror.open_local(profile)
+    issue = jira_mirror.get_issue(conn, key)
+    if issue is None:
+        sys.exit(f"{key} is not in the local mirror; run jira_mirror.py sync "
+                 f"--project {key.rsplit('-', 1)[0]} or drop --local")
+    jira_mirror.warn_if_stale(conn, key.rsplit("-", 1)[0])
+    return url, issue
+
+
 def fmt_user(u) -> str:
     if not u:
         return "(unassigned)"
@@ -132,19 +148,24 @@ def main() -> None:
     ap.add_argument("--comments", action="store_true", help="Include comments")
     ap.add_argument("--subtasks", action="store_true", help="List subtasks")
     ap.add_argument("--changelog", action="store_true", help="Include change history")
+    ap.add_argument("--local", action="store_true",
+                    help="Read the issue from the jira_mirror.py mirror")
     ap.add_argument("--profile", default=None, help="Atlassian config profile")
     args = ap.parse_args()
 
     key = resolve_issue_key(args.issue)
-    url, user, token = get_auth(profile=args.profile)
-    auth = (user, token)
-
-    expand = ["renderedFields"]
-    if args.changelog:
-        expand.append("changelog")
-    if args.subtasks:
-        expand.append("subtasks")
-    issue = fetch_issue(url, auth, key, expand=expand)
+    if args.local:
+        url, issue = local_issue(args.profile, key)
+    else:
+        url, user, token = get_auth(profile=args.profile)
+        auth = (user, token)
+
+        expand = ["renderedFields"]
+        if args.changelog:
+            expand.append("changelog")
+        if args.subtasks:
+            expand.append("subtasks")
+        issue = fetch_issue(url, auth, key, expand=expand)
     f = issue["fields"]
 
     if args.format == "json":
@@ -198,26 +219,32 @@ def main() -> None:
             print()
 
     if args.comments:
-        r = requests.get(
-            f"{url}/rest/api/3/issue/{key}/comment",
-            params={"maxResults": 100},
-            auth=auth,
-            timeout=20,
-        )
-        if r.status_code == 200:
-            comments = r.json().get("comments", [])
-            if comments:
-                print("## Comments")
-                for c in comments:
-                    author = c.get("author", {}).get("displayName", "")
-                    when = c.get("created", "")
-                    body = c.get("body")
-                    text = adf_to_text(body).strip() if isinstance(body, dict) else (body or "")
-                    print(f"### {author} — {when}")
-                    print(text)
-                    print()
-
-    if args.changelog:
+        comments = []
+        if args.local:
+            comments = (f.get("comment") or {}).get("comments", [])
+        else:
+            r = requests.get(
+                f"{url}/rest/api/3/issue/{key}/comment",
+                params={"maxResults": 100},
+                auth=auth,
+                timeout=20,
+            )
+            if r.status_code == 200:
+                comments = r.json().get("comments", [])
+        if comments:
+            print("## Comments")
+            for c in comments:
+                author = c.get("author", {}).get("displayName", "")
+                when = c.get("created", "")
+                body = c.get("body")
+                text = adf_to_text(body).strip() if isinstance(body, dict) else (body or "")
+                print(f"### {author} — {when}")
+                print(text)
+                print()
+
+    if args.changelog and args.local:
+        print("(changelog is not mirrored; drop --local to fetch it)")
+    elif args.changelog:
         cl = issue.get("changelog", {}).get("histories", [])
         if cl:
             print("## Changelog")
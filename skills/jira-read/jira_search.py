@@ -6,16 +6,28 @@ Usage:
     jira_search.py --project PROJ --status "In Progress"
     jira_search.py --jql "..." --fields summary,status,assignee,updated
     jira_search.py --jql "..." --format json
+    jira_search.py --jql "..." --max-results 20000 --format ndjson | jq ...
+    jira_search.py --local --project PROJ --text "rancher upgrade"
 
 Uses the shared atlassian_auth helper. Prefers the v3 POST /search/jql
-endpoint and falls back to legacy GET /search.
+endpoint and falls back to legacy GET /search; whichever works is
+remembered per host. Legacy pages are fetched concurrently once the total
+is known. Results are cached per JQL + fields for --cache-ttl seconds, and
+ndjson prints each issue as soon as its page arrives.
+
+--local answers the shortcut filters from the SQLite mirror kept by
+jira_mirror.py instead of the API (no network, no token).
 """
 from __future__ import annotations
 
 import argparse
+import hashlib
 import json
 import os
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
 
 for _p in (
     os.path.join(os.environ.get("DEVOPS_SCRIPTS_DIR", ""), "lib"),
@@ -33,9 +45,15 @@ except ImportError:
     )
 
 import requests
+from requests.adapters import HTTPAdapter
 
 
 DEFAULT_FIELDS = ["summary", "status", "assignee", "priority", "issuetype", "updated"]
+PAGE_SIZE = 100
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "jira-read"
+)
+ENDPOINTS_FILE = os.path.join(CACHE_DIR, "endpoints.json")
 
 
 def build_jql(args) -> str:
@@ -51,72 +69,190 @@ def build_jql(args) -> str:
     if args.label:
         for lbl in args.label:
             parts.append(f'labels = "{lbl}"')
+    if args.text:
+        parts.append('text ~ "{}"'.format(args.text.replace('"', '\\"')))
     if not parts:
         sys.exit(
             "Must provide --jql, or at least one of "
-            "--project / --status / --assignee / --label"
+            "--project / --status / --assignee / --label / --text"
         )
     return " and ".join(parts) + " ORDER BY updated DESC"
 
 
-def search_v3(base_url, auth, jql, fields, max_results):
-    """POST /rest/api/3/search/jql with nextPageToken pagination."""
-    out: list[dict] = []
+def make_session(auth, pool_size: int = 8) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.auth = auth
+    return session
+
+
+def _load_json(path: str, default):
+    try:
+        with open(path) as fs:
+            return json.load(fs)
+    except (OSError, ValueError):
+        return default
+
+
+def _save_json(path: str, data) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as fs:
+        json.dump(data, fs)
+    os.replace(tmp, path)
+
+
+def remembered_endpoint(base_url: str) -> str | None:
+    return _load_json(ENDPOINTS_FILE, {}).get(urlparse(base_url).netloc)
+
+
+def remember_endpoint(base_url: str, endpoint: str) -> None:
+    known = _load_json(ENDPOINTS_FILE, {})
+    host = urlparse(base_url).netloc
+    if known.get(host) != endpoint:
+        known[host] = endpoint
+        _save_json(ENDPOINTS_FILE, known)
+
+
+class EndpointUnsupported(Exception):
+    pass
+
+
+def search_v3(session, base_url, jql, fields, max_results):
+    """POST /rest/api/3/search/jql with nextPageToken pagination.
+
+    Yields pages of issues. Raises EndpointUnsupported on a 404/405 for the
+    first page, the signal to try legacy.
+    """
+    fetched = 0
     next_token: str | None = None
-    while len(out) < max_results:
+    while fetched < max_results:
         payload = {
             "jql": jql,
             "fields": fields,
-            "maxResults": min(100, max_results - len(out)),
+            "maxResults": min(PAGE_SIZE, max_results - fetched),
         }
         if next_token:
             payload["nextPageToken"] = next_token
-        r = requests.post(
+        r = session.post(
             f"{base_url}/rest/api/3/search/jql",
             json=payload,
-            auth=auth,
             timeout=30,
         )
-        if r.status_code == 404 or r.status_code == 405:
-            return None  # signal: try legacy
+        if r.status_code in (404, 405) and not fetched:
+            raise EndpointUnsupported()
         if r.status_code != 200:
             sys.exit(f"Search → {r.status_code}: {r.text[:400]}")
         data = r.json()
-        issues = data.get("issues", [])
-        out.extend(issues)
+        issues = data.get("issues", [])[: max_results - fetched]
+        fetched += len(issues)
+        yield issues
         next_token = data.get("nextPageToken")
         if data.get("isLast", True) or not next_token or not issues:
             break
-    return out[:max_results]
-
-
-def search_legacy(base_url, auth, jql, fields, max_results):
-    """GET /rest/api/3/search with startAt pagination."""
-    out: list[dict] = []
-    start_at = 0
-    while len(out) < max_results:
-        r = requests.get(
-            f"{base_url}/rest/api/3/search",
-            params={
-                "jql": jql,
-                "fields": ",".join(fields),
-                "startAt": start_at,
-                "maxResults": min(100, max_results - len(out)),
-            },
-            auth=auth,
-            timeout=30,
+
+
+def _legacy_page(session, base_url, jql, fields, start_at, size):
+    r = session.get(
+        f"{base_url}/rest/api/3/search",
+        params={
+            "jql": jql,
+            "fields": ",".join(fields),
+            "startAt": start_at,
+            "maxResults": size,
+        },
+        timeout=30,
+    )
+    if r.status_code != 200:
+        sys.exit(f"Search → {r.status_code}: {r.text[:400]}")
+    return r.json()
+
+
+def search_legacy(session, base_url, jql, fields, max_results, workers=8):
+    """GET /rest/api/3/search with startAt pagination.
+
+    The first page reports ``total``; the remaining pages are then requested
+    concurrently and yielded in order.
+    """
+    first = _legacy_page(session, base_url, jql, fields, 0,
+                         min(PAGE_SIZE, max_results))
+    issues = first.get("issues", [])
+    yield issues[:max_results]
+    page = len(issues)
+    limit = min(first.get("total", 0), max_results)
+    if not page or page >= limit:
+        return
+    starts = range(page, limit, page)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pages = pool.map(
+            lambda s: _legacy_page(session, base_url, jql, fields, s,
+                                   min(page, limit - s)),
+            starts,
         )
-        if r.status_code != 200:
-            sys.exit(f"Search → {r.status_code}: {r.text[:400]}")
-        data = r.json()
-        issues = data.get("issues", [])
-        if not issues:
-            break
-        out.extend(issues)
-        if data.get("total", 0) <= start_at + len(issues):
-            break
-        start_at += len(issues)
-    return out[:max_results]
+        for data in pages:
+            yield data.get("issues", [])
+
+
+def iter_search(session, base_url, jql, fields, max_results, workers=8):
+    """Yield issue pages from whichever endpoint works for ``base_url``."""
+    endpoint = remembered_endpoint(base_url)
+    if endpoint != "legacy":
+        try:
+            yield from search_v3(session, base_url, jql, fields, max_results)
+            if endpoint is None:
+                remember_endpoint(base_url, "v3")
+            return
+        except EndpointUnsupported:
+            remember_endpoint(base_url, "legacy")
+    yield from search_legacy(session, base_url, jql, fields, max_results, workers)
+
+
+def cache_path(base_url, jql, fields, max_results) -> str:
+    key = json.dumps([base_url, jql, sorted(fields), max_results])
+    return os.path.join(CACHE_DIR, "search",
+                        hashlib.sha256(key.encode()).hexdigest() + ".json")
+
+
+def cached_search(session, base_url, jql, fields, max_results, ttl=300,
+                  workers=8):
+    """Yield issues, served from the per JQL + fields cache when fresh."""
+    path = cache_path(base_url, jql, fields, max_results)
+    if ttl > 0:
+        entry = _load_json(path, None)
+        if entry and time.time() - entry.get("time", 0) < ttl:
+            yield from entry["issues"]
+            return
+    issues: list[dict] = []
+    for page in iter_search(session, base_url, jql, fields, max_results, workers):
+        issues.extend(page)
+        yield from page
+    if ttl > 0:
+        _save_json(path, {"time": time.time(), "issues": issues})
+
+
+def local_search(args):
+    """Answer the shortcut filters from the jira_mirror.py database."""
+    if args.jql:
+        sys.exit("--local supports the shortcut filters only, not --jql")
+    import jira_mirror  # type: ignore
+
+    _, conn = jira_mirror.open_local(args.profile)
+    jira_mirror.warn_if_stale(conn, args.project)
+    assignee = args.assignee
+    if assignee and assignee.lower() == "currentuser()":
+        sys.exit("--local cannot resolve currentUser(); pass your name or email")
+    issues = jira_mirror.search(
+        conn, project=args.project, status=args.status, assignee=assignee,
+        labels=args.label or (), terms=(args.text or "").split(),
+        limit=args.max_results,
+    )
+    filters = " ".join(
+        f"{k}={v}" for k, v in vars(args).items()
+        if k in ("project", "status", "assignee", "label", "text") and v
+    )
+    return issues, f"local: {filters}"
 
 
 def main() -> None:
@@ -128,30 +264,51 @@ def main() -> None:
                     help='Shortcut: assignee = X (use "currentUser()" for self)')
     ap.add_argument("--label", action="append",
                     help='Shortcut: labels = "X" (repeatable, AND-combined)')
+    ap.add_argument("--text",
+                    help='Shortcut: text ~ "X" (full-text search)')
     ap.add_argument("--fields", default=",".join(DEFAULT_FIELDS),
                     help="Comma-separated field IDs to return")
     ap.add_argument("--max-results", type=int, default=50,
                     help="Maximum issues to return (default: 50)")
-    ap.add_argument("--format", choices=["text", "json"], default="text",
+    ap.add_argument("--format", choices=["text", "json", "ndjson"], default="text",
                     help="Output format (default: text)")
+    ap.add_argument("--workers", type=int, default=8,
+                    help="Concurrent page requests on the legacy endpoint (default: 8)")
+    ap.add_argument("--cache-ttl", type=int, default=300,
+                    help="Seconds to reuse cached results for the same query; "
+                         "0 disables the cache (default: 300)")
+    ap.add_argument("--no-cache", dest="cache_ttl", action="store_const", const=0,
+                    help="Same as --cache-ttl 0")
+    ap.add_argument("--local", action="store_true",
+                    help="Search the jira_mirror.py mirror instead of the API")
     ap.add_argument("--profile", default=None, help="Atlassian config profile")
     args = ap.parse_args()
 
-    jql = build_jql(args)
-    fields = [f.strip() for f in args.fields.split(",") if f.strip()]
+    if args.local:
+        results, query = local_search(args)
+    else:
+        jql = query = build_jql(args)
+        fields = [f.strip() for f in args.fields.split(",") if f.strip()]
 
-    url, user, token = get_auth(profile=args.profile)
-    auth = (user, token)
+        url, user, token = get_auth(profile=args.profile)
+        session = make_session((user, token), args.workers)
 
-    issues = search_v3(url, auth, jql, fields, args.max_results)
-    if issues is None:
-        issues = search_legacy(url, auth, jql, fields, args.max_results)
+        results = cached_search(session, url, jql, fields, args.max_results,
+                                args.cache_ttl, args.workers)
+
+    if args.format == "ndjson":
+        for issue in results:
+            sys.stdout.write(json.dumps(issue, default=str) + "\n")
+            sys.stdout.flush()
+        return
 
+    issues = list(results)
     if args.format == "json":
         print(json.dumps(issues, indent=2, default=str))
         return
 
-    print(f"# {len(issues)} issue(s) — jql: {jql}")
+    print(f"# {len(issues)} issue(s) — {query}" if args.local
+          else f"# {len(issues)} issue(s) — jql: {query}")
     print()
     for i in issues:
         f = i.get("fields", {})